@@ -0,0 +1,26 @@
+"""Add token_version to user
+
+Revision ID: 1a31ce608336
+Revises: e2412789c190
+Create Date: 2026-10-18 18:02:11.318054
+
+"""
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "1a31ce608336"
+down_revision = "e2412789c190"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column(
+        "user",
+        sa.Column("token_version", sa.Integer(), nullable=False, server_default="0"),
+    )
+
+
+def downgrade():
+    op.drop_column("user", "token_version")
@@ -0,0 +1,32 @@
+"""Add login throttle bucket
+
+Revision ID: 5b9f0c2d7e41
+Revises: 1a31ce608336
+Create Date: 2026-10-18 18:41:37.902215
+
+"""
+import sqlalchemy as sa
+import sqlmodel.sql.sqltypes
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "5b9f0c2d7e41"
+down_revision = "1a31ce608336"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "loginthrottlebucket",
+        sa.Column("key", sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+        sa.Column("tokens", sa.Float(), nullable=False),
+        sa.Column("updated_at", sa.Float(), nullable=False),
+        sa.Column("lockouts", sa.Integer(), nullable=False),
+        sa.Column("locked_until", sa.Float(), nullable=False),
+        sa.PrimaryKeyConstraint("key"),
+    )
+
+
+def downgrade():
+    op.drop_table("loginthrottlebucket")
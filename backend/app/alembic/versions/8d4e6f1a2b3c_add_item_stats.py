@@ -0,0 +1,35 @@
+"""Add item stats
+
+Revision ID: 8d4e6f1a2b3c
+Revises: 5b9f0c2d7e41
+Create Date: 2026-10-18 21:12:05.318544
+
+"""
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "8d4e6f1a2b3c"
+down_revision = "5b9f0c2d7e41"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "itemstats",
+        sa.Column("owner_id", sa.Integer(), nullable=False),
+        sa.Column("item_count", sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(["owner_id"], ["user.id"], ondelete="CASCADE"),
+        sa.PrimaryKeyConstraint("owner_id"),
+    )
+    op.execute(
+        """
+        INSERT INTO itemstats (owner_id, item_count)
+        SELECT owner_id, count(*) FROM item GROUP BY owner_id
+        """
+    )
+
+
+def downgrade():
+    op.drop_table("itemstats")
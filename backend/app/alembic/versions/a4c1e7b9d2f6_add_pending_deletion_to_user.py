@@ -0,0 +1,28 @@
+"""Add pending_deletion to user
+
+Revision ID: a4c1e7b9d2f6
+Revises: f3b8d2a6c9e4
+Create Date: 2026-10-18 23:04:37.581264
+
+"""
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "a4c1e7b9d2f6"
+down_revision = "f3b8d2a6c9e4"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column(
+        "user",
+        sa.Column(
+            "pending_deletion", sa.Boolean(), nullable=False, server_default="false"
+        ),
+    )
+
+
+def downgrade():
+    op.drop_column("user", "pending_deletion")
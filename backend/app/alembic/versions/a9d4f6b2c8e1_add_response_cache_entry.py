@@ -0,0 +1,46 @@
+"""Add response cache entry
+
+Revision ID: a9d4f6b2c8e1
+Revises: f4a7c2e9b1d6
+Create Date: 2026-10-19 05:26:48.117093
+
+"""
+import sqlalchemy as sa
+import sqlmodel.sql.sqltypes
+from alembic import op
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision = "a9d4f6b2c8e1"
+down_revision = "f4a7c2e9b1d6"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Unlogged: a cache needs neither crash safety nor replicas
+    op.create_table(
+        "responsecacheentry",
+        sa.Column("key", sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+        sa.Column("tags", postgresql.ARRAY(sa.String()), nullable=False),
+        sa.Column("owner_id", sa.Integer(), nullable=True),
+        sa.Column("etag", sqlmodel.sql.sqltypes.AutoString(), nullable=True),
+        sa.Column("last_modified", sa.DateTime(timezone=True), nullable=True),
+        sa.Column("body", sa.LargeBinary(), nullable=False),
+        sa.Column("expires_at", sa.DateTime(timezone=True), nullable=False),
+        sa.PrimaryKeyConstraint("key"),
+        prefixes=["UNLOGGED"],
+    )
+    op.create_index(
+        "ix_responsecacheentry_expires_at", "responsecacheentry", ["expires_at"]
+    )
+    op.create_index(
+        "ix_responsecacheentry_tags",
+        "responsecacheentry",
+        ["tags"],
+        postgresql_using="gin",
+    )
+
+
+def downgrade():
+    op.drop_table("responsecacheentry")
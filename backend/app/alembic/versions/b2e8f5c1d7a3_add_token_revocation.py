@@ -0,0 +1,46 @@
+"""Add token revocation
+
+Revision ID: b2e8f5c1d7a3
+Revises: a9d4f6b2c8e1
+Create Date: 2026-10-18 23:12:45.218374
+
+"""
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "b2e8f5c1d7a3"
+down_revision = "a9d4f6b2c8e1"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "tokenrevocation",
+        sa.Column("user_id", sa.Integer(), nullable=False),
+        sa.Column("token_version", sa.Integer(), nullable=False),
+        sa.Column(
+            "revoked_at",
+            sa.DateTime(timezone=True),
+            server_default=sa.text("now()"),
+            nullable=False,
+        ),
+        sa.PrimaryKeyConstraint("user_id"),
+    )
+    op.create_index(
+        op.f("ix_tokenrevocation_revoked_at"),
+        "tokenrevocation",
+        ["revoked_at"],
+        unique=False,
+    )
+    # Tokens of these users may have been revoked within their lifetime
+    op.execute(
+        'INSERT INTO tokenrevocation (user_id, token_version) '
+        'SELECT id, token_version FROM "user" WHERE token_version > 0'
+    )
+
+
+def downgrade():
+    op.drop_index(op.f("ix_tokenrevocation_revoked_at"), table_name="tokenrevocation")
+    op.drop_table("tokenrevocation")
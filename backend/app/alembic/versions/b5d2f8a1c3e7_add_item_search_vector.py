@@ -0,0 +1,51 @@
+"""Add item search vector
+
+Revision ID: b5d2f8a1c3e7
+Revises: a4c1e7b9d2f6
+Create Date: 2026-10-19 00:12:48.207391
+
+"""
+import sqlalchemy as sa
+from alembic import op
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision = "b5d2f8a1c3e7"
+down_revision = "a4c1e7b9d2f6"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Adding a stored generated column rewrites item, blocking it meanwhile
+    op.add_column(
+        "item",
+        sa.Column(
+            "search_vector",
+            postgresql.TSVECTOR(),
+            sa.Computed(
+                "setweight(to_tsvector('english', title), 'A') || "
+                "setweight(to_tsvector('english', coalesce(description, '')), 'B')",
+                persisted=True,
+            ),
+            nullable=True,
+        ),
+    )
+    # If it fails it leaves an invalid index behind, drop it before retrying
+    with op.get_context().autocommit_block():
+        op.create_index(
+            "ix_item_search_vector",
+            "item",
+            ["search_vector"],
+            unique=False,
+            postgresql_using="gin",
+            postgresql_concurrently=True,
+        )
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.drop_index(
+            "ix_item_search_vector", table_name="item", postgresql_concurrently=True
+        )
+    op.drop_column("item", "search_vector")
@@ -0,0 +1,48 @@
+"""Add response cache tag
+
+Revision ID: c5d9a3e7f2b1
+Revises: b2e8f5c1d7a3
+Create Date: 2026-10-18 16:42:09.318527
+
+"""
+import sqlalchemy as sa
+import sqlmodel.sql.sqltypes
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "c5d9a3e7f2b1"
+down_revision = "b2e8f5c1d7a3"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Unlogged, like the entries it guards: both are emptied by a crash
+    op.create_table(
+        "responsecachetag",
+        sa.Column("tag", sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+        sa.Column("invalidated_by", sa.BigInteger(), nullable=False),
+        sa.Column(
+            "invalidated_at",
+            sa.DateTime(timezone=True),
+            server_default=sa.text("now()"),
+            nullable=False,
+        ),
+        sa.PrimaryKeyConstraint("tag"),
+        prefixes=["UNLOGGED"],
+    )
+    op.create_index(
+        op.f("ix_responsecachetag_invalidated_at"),
+        "responsecachetag",
+        ["invalidated_at"],
+        unique=False,
+    )
+    # Entries put before the upgrade were never checked against a tag
+    op.execute("DELETE FROM responsecacheentry")
+
+
+def downgrade():
+    op.drop_index(
+        op.f("ix_responsecachetag_invalidated_at"), table_name="responsecachetag"
+    )
+    op.drop_table("responsecachetag")
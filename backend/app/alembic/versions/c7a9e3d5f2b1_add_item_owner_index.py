@@ -0,0 +1,34 @@
+"""Add item owner index
+
+Revision ID: c7a9e3d5f2b1
+Revises: 8d4e6f1a2b3c
+Create Date: 2026-10-18 21:48:26.604117
+
+"""
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "c7a9e3d5f2b1"
+down_revision = "8d4e6f1a2b3c"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # CONCURRENTLY doesn't block writes to item, but can't run in a transaction.
+    # If it fails it leaves an invalid index behind, drop it before retrying.
+    with op.get_context().autocommit_block():
+        op.create_index(
+            "ix_item_owner_id_id",
+            "item",
+            ["owner_id", "id"],
+            unique=False,
+            postgresql_concurrently=True,
+        )
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.drop_index(
+            "ix_item_owner_id_id", table_name="item", postgresql_concurrently=True
+        )
@@ -0,0 +1,91 @@
+"""Add item timestamps
+
+Revision ID: d8e3a6f4b9c2
+Revises: b5d2f8a1c3e7
+Create Date: 2026-10-19 01:26:09.518734
+
+"""
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "d8e3a6f4b9c2"
+down_revision = "b5d2f8a1c3e7"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # now() is stable, so existing rows get the time of the migration without
+    # rewriting the table
+    for column in ("created_at", "updated_at"):
+        op.add_column(
+            "item",
+            sa.Column(
+                column,
+                sa.DateTime(timezone=True),
+                server_default=sa.text("now()"),
+                nullable=False,
+            ),
+        )
+    # Only for the rows an update actually changes, as compared by the columns
+    # it can set (a BEFORE trigger can't see the generated search_vector)
+    op.execute(
+        """
+        CREATE FUNCTION item_set_updated_at() RETURNS trigger
+        LANGUAGE plpgsql AS $$
+        BEGIN
+            NEW.updated_at := now();
+            RETURN NEW;
+        END
+        $$
+        """
+    )
+    op.execute(
+        """
+        CREATE TRIGGER item_set_updated_at BEFORE UPDATE ON item
+        FOR EACH ROW WHEN (
+            (OLD.title, OLD.description, OLD.owner_id)
+            IS DISTINCT FROM (NEW.title, NEW.description, NEW.owner_id)
+        )
+        EXECUTE FUNCTION item_set_updated_at()
+        """
+    )
+    # If one fails it leaves an invalid index behind, drop it before retrying
+    with op.get_context().autocommit_block():
+        op.create_index(
+            "ix_item_owner_id_title",
+            "item",
+            ["owner_id", "title", "id"],
+            unique=False,
+            postgresql_concurrently=True,
+        )
+        op.create_index(
+            "ix_item_owner_id_created_at",
+            "item",
+            ["owner_id", "created_at", "id"],
+            unique=False,
+            postgresql_concurrently=True,
+        )
+        op.create_index(
+            "ix_item_created_at_brin",
+            "item",
+            ["created_at"],
+            unique=False,
+            postgresql_using="brin",
+            postgresql_concurrently=True,
+        )
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        for index in (
+            "ix_item_created_at_brin",
+            "ix_item_owner_id_created_at",
+            "ix_item_owner_id_title",
+        ):
+            op.drop_index(index, table_name="item", postgresql_concurrently=True)
+    op.execute("DROP TRIGGER item_set_updated_at ON item")
+    op.execute("DROP FUNCTION item_set_updated_at()")
+    op.drop_column("item", "updated_at")
+    op.drop_column("item", "created_at")
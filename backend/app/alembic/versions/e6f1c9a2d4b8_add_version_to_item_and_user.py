@@ -0,0 +1,64 @@
+"""Add version to item and user
+
+Revision ID: e6f1c9a2d4b8
+Revises: d8e3a6f4b9c2
+Create Date: 2026-10-19 02:41:53.860215
+
+"""
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "e6f1c9a2d4b8"
+down_revision = "d8e3a6f4b9c2"
+branch_labels = None
+depends_on = None
+
+# Columns whose changes bump the version, those of the API representation
+# (and the password of a user)
+versioned_columns = {
+    "item": ("title", "description", "owner_id"),
+    "user": (
+        "email",
+        "full_name",
+        "is_active",
+        "is_superuser",
+        "pending_deletion",
+        "hashed_password",
+    ),
+}
+
+
+def upgrade():
+    op.execute(
+        """
+        CREATE FUNCTION bump_version() RETURNS trigger
+        LANGUAGE plpgsql AS $$
+        BEGIN
+            NEW.version := OLD.version + 1;
+            RETURN NEW;
+        END
+        $$
+        """
+    )
+    for table, columns in versioned_columns.items():
+        op.add_column(
+            table,
+            sa.Column("version", sa.Integer(), server_default="0", nullable=False),
+        )
+        old = ", ".join(f"OLD.{column}" for column in columns)
+        new = ", ".join(f"NEW.{column}" for column in columns)
+        op.execute(
+            f"""
+            CREATE TRIGGER {table}_bump_version BEFORE UPDATE ON "{table}"
+            FOR EACH ROW WHEN (({old}) IS DISTINCT FROM ({new}))
+            EXECUTE FUNCTION bump_version()
+            """
+        )
+
+
+def downgrade():
+    for table in versioned_columns:
+        op.execute(f'DROP TRIGGER {table}_bump_version ON "{table}"')
+        op.drop_column(table, "version")
+    op.execute("DROP FUNCTION bump_version()")
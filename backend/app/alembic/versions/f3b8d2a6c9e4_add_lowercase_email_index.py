@@ -0,0 +1,52 @@
+"""Add lowercase email index
+
+Revision ID: f3b8d2a6c9e4
+Revises: c7a9e3d5f2b1
+Create Date: 2026-10-18 22:15:49.127730
+
+"""
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "f3b8d2a6c9e4"
+down_revision = "c7a9e3d5f2b1"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    conn = op.get_bind()
+    duplicates = (
+        conn.execute(
+            sa.text(
+                'SELECT lower(trim(email)) FROM "user" GROUP BY 1 HAVING count(*) > 1'
+            )
+        )
+        .scalars()
+        .all()
+    )
+    if duplicates:
+        raise RuntimeError(
+            "Users whose emails only differ by case must be merged or renamed "
+            f"first: {', '.join(duplicates)}"
+        )
+    op.execute(
+        'UPDATE "user" SET email = lower(trim(email)) WHERE email <> lower(trim(email))'
+    )
+    # Commit the update, CONCURRENTLY can't run in a transaction
+    with op.get_context().autocommit_block():
+        op.create_index(
+            "ix_user_email_lower",
+            "user",
+            [sa.text("lower(email)")],
+            unique=True,
+            postgresql_concurrently=True,
+        )
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.drop_index(
+            "ix_user_email_lower", table_name="user", postgresql_concurrently=True
+        )
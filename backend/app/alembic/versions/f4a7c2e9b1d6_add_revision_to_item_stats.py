@@ -0,0 +1,36 @@
+"""Add revision to item stats
+
+Revision ID: f4a7c2e9b1d6
+Revises: e6f1c9a2d4b8
+Create Date: 2026-10-19 04:12:37.502961
+
+"""
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "f4a7c2e9b1d6"
+down_revision = "e6f1c9a2d4b8"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column(
+        "itemstats",
+        sa.Column("revision", sa.Integer(), server_default="0", nullable=False),
+    )
+    op.add_column(
+        "itemstats",
+        sa.Column(
+            "modified_at",
+            sa.DateTime(timezone=True),
+            server_default=sa.text("now()"),
+            nullable=False,
+        ),
+    )
+
+
+def downgrade():
+    op.drop_column("itemstats", "modified_at")
+    op.drop_column("itemstats", "revision")
@@ -1,56 +1,472 @@
-from collections.abc import Generator
+import hashlib
+from collections.abc import AsyncGenerator, Collection, Generator
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
 from typing import Annotated
+from urllib.parse import urlencode
 
-from fastapi import Depends, HTTPException, status
+from fastapi import Depends, Header, HTTPException, Request, Response, status
+from fastapi.concurrency import run_in_threadpool
 from fastapi.security import OAuth2PasswordBearer
 from jose import JWTError, jwt
 from pydantic import ValidationError
-from sqlmodel import Session
+from sqlmodel import Session, SQLModel
+from sqlmodel.ext.asyncio.session import AsyncSession
 
+from app import crud
 from app.core import security
 from app.core.config import settings
-from app.core.db import engine
-from app.models import TokenPayload, User
+from app.core.db import (
+    async_engine,
+    async_read_only_engine,
+    engine,
+    read_only_engine,
+    replica_set,
+)
+from app.core.pagination import InvalidCursorError, Page
+from app.core.principals import (
+    Principal,
+    principal_cache,
+    token_versions,
+)
+from app.core.replicas import RoutingSession, replica_pins
+from app.core.response_cache import CachedResponse, CacheMiss, response_cache
+from app.models import CountMode, ItemSort, ItemsQuery, TokenPayload, User
 
 reusable_oauth2 = OAuth2PasswordBearer(
     tokenUrl=f"{settings.API_V1_STR}/login/access-token"
 )
 
 
-def get_db() -> Generator[Session, None, None]:
-    with Session(engine) as session:
+def is_read_only(request: Request) -> bool:
+    return request.method in ("GET", "HEAD")
+
+
+def get_db(request: Request) -> Generator[Session, None, None]:
+    """
+    Session on the primary, whose reads go to a replica for GET requests
+    when replicas are configured. GET requests run READ ONLY transactions.
+    Committed objects keep their state, the writes return what they changed
+    instead of being reloaded.
+    """
+    read_only = is_read_only(request)
+    replica = None
+    user_id = None
+    if replica_set.replicas:
+        user_id = token_user_id(request)
+        if read_only:
+            replica = replica_set.pick(replica_pins.min_lsn(user_id))
+    with RoutingSession(
+        read_only_engine if read_only else engine,
+        replica=replica,
+        user_id=user_id,
+        expire_on_commit=False,
+    ) as session:
+        yield session
+
+
+async def get_async_db(request: Request) -> AsyncGenerator[AsyncSession, None]:
+    bind = async_read_only_engine if is_read_only(request) else async_engine
+    async with AsyncSession(bind, expire_on_commit=False) as session:
         yield session
 
 
 SessionDep = Annotated[Session, Depends(get_db)]
+AsyncSessionDep = Annotated[AsyncSession, Depends(get_async_db)]
 TokenDep = Annotated[str, Depends(reusable_oauth2)]
 
 
-def get_current_user(session: SessionDep, token: TokenDep) -> User:
+def token_user_id(request: Request) -> int | None:
+    """User id of the request's access token, None if there is no valid one."""
+    scheme, _, token = request.headers.get("Authorization", "").partition(" ")
+    if scheme.lower() != "bearer":
+        return None
+    try:
+        return decode_token(token).sub
+    except HTTPException:
+        return None
+
+
+def decode_token(token: str) -> TokenPayload:
     try:
         payload = jwt.decode(
             token, settings.SECRET_KEY, algorithms=[security.ALGORITHM]
         )
-        token_data = TokenPayload(**payload)
+        return TokenPayload(**payload)
     except (JWTError, ValidationError):
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Could not validate credentials",
         )
+
+
+def check_token_version(token_data: TokenPayload, token_version: int) -> None:
+    if token_data.ver < token_version:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Could not validate credentials",
+        )
+
+
+def get_current_user(session: SessionDep, token: TokenDep) -> User:
+    token_data = decode_token(token)
     user = session.get(User, token_data.sub)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     if not user.is_active:
         raise HTTPException(status_code=400, detail="Inactive user")
+    check_token_version(token_data, user.token_version)
     return user
 
 
 CurrentUser = Annotated[User, Depends(get_current_user)]
 
 
-def get_current_active_superuser(current_user: CurrentUser) -> User:
+async def get_current_user_async(session: AsyncSessionDep, token: TokenDep) -> User:
+    token_data = decode_token(token)
+    user = await session.get(User, token_data.sub)
+    if not user:
+        raise HTTPException(status_code=404, detail="User not found")
+    if not user.is_active:
+        raise HTTPException(status_code=400, detail="Inactive user")
+    check_token_version(token_data, user.token_version)
+    return user
+
+
+AsyncCurrentUser = Annotated[User, Depends(get_current_user_async)]
+
+
+def principal_from_claims(token_data: TokenPayload) -> Principal | None:
+    """
+    Principal carried by the token claims, if ACCESS_TOKEN_CLAIMS is enabled
+    and the token has them. The caller must check its token version.
+    """
+    if (
+        settings.ACCESS_TOKEN_CLAIMS
+        and token_data.sub is not None
+        and token_data.email is not None
+        and token_data.act is not None
+        and token_data.su is not None
+    ):
+        return Principal(
+            id=token_data.sub,
+            email=token_data.email,
+            is_active=token_data.act,
+            is_superuser=token_data.su,
+            token_version=token_data.ver,
+        )
+    return None
+
+
+def check_principal(token_data: TokenPayload, principal: Principal) -> Principal:
+    if not principal.is_active:
+        raise HTTPException(status_code=400, detail="Inactive user")
+    check_token_version(token_data, principal.token_version)
+    return principal
+
+
+def check_not_revoked(principal: Principal) -> None:
+    if token_versions.is_revoked(principal.id, principal.token_version):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Could not validate credentials",
+        )
+
+
+def get_current_principal(session: SessionDep, token: TokenDep) -> Principal:
+    """
+    Like get_current_user, but without a query when possible: taken from the
+    token claims when ACCESS_TOKEN_CLAIMS is enabled, from the principal
+    cache otherwise.
+
+    Use it in routes that only need the id and permissions of the user.
+    """
+    token_data = decode_token(token)
+    principal = principal_from_claims(token_data)
+    if principal:
+        if token_versions.needs_refresh():
+            token_versions.refresh(session)
+        check_not_revoked(principal)
+        return check_principal(token_data, principal)
+    cached = principal_cache.get(token_data.sub) if token_data.sub else None
+    if cached:
+        return check_principal(token_data, cached)
+    user = session.get(User, token_data.sub)
+    if not user:
+        raise HTTPException(status_code=404, detail="User not found")
+    principal = Principal.from_user(user)
+    principal_cache.put(principal)
+    return check_principal(token_data, principal)
+
+
+CurrentPrincipal = Annotated[Principal, Depends(get_current_principal)]
+
+
+async def get_current_principal_async(
+    session: AsyncSessionDep, token: TokenDep
+) -> Principal:
+    token_data = decode_token(token)
+    principal = principal_from_claims(token_data)
+    if principal:
+        if token_versions.needs_refresh():
+            await token_versions.refresh_async(session)
+        check_not_revoked(principal)
+        return check_principal(token_data, principal)
+    cached = principal_cache.get(token_data.sub) if token_data.sub else None
+    if cached:
+        return check_principal(token_data, cached)
+    user = await session.get(User, token_data.sub)
+    if not user:
+        raise HTTPException(status_code=404, detail="User not found")
+    principal = Principal.from_user(user)
+    principal_cache.put(principal)
+    return check_principal(token_data, principal)
+
+
+AsyncCurrentPrincipal = Annotated[Principal, Depends(get_current_principal_async)]
+
+
+def get_current_active_superuser(current_user: CurrentPrincipal) -> Principal:
     if not current_user.is_superuser:
         raise HTTPException(
             status_code=400, detail="The user doesn't have enough privileges"
         )
     return current_user
+
+
+async def get_current_active_superuser_async(
+    current_user: AsyncCurrentPrincipal,
+) -> Principal:
+    return get_current_active_superuser(current_user)
+
+
+def get_page(cursor: str | None = None, skip: int = 0, limit: int = 100) -> Page:
+    """
+    Pagination parameters: pass the `next_cursor` of a page as `cursor` to
+    get the next one. `skip` is still supported, but gets slower the deeper
+    the page. `limit` is capped at MAX_PAGE_SIZE.
+    """
+    try:
+        return Page.from_params(
+            cursor=cursor, skip=skip, limit=limit, max_limit=settings.MAX_PAGE_SIZE
+        )
+    except InvalidCursorError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+PageDep = Annotated[Page, Depends(get_page)]
+
+
+def get_items_query(
+    page: PageDep,
+    q: str | None = None,
+    sort: ItemSort | None = None,
+    created_after: datetime | None = None,
+    created_before: datetime | None = None,
+    updated_after: datetime | None = None,
+    updated_before: datetime | None = None,
+) -> ItemsQuery:
+    """
+    Search, filters and sort order of the items list. `q` searches titles and
+    descriptions in web search syntax (`"quoted phrase"`, `or`, `-excluded`),
+    best match first unless `sort` says otherwise. The `_after` filters are
+    inclusive, the `_before` ones exclusive. A cursor only pages through the
+    list in the order it came from.
+    """
+    query = ItemsQuery(
+        q=q.strip() or None if q else None,
+        sort=sort,
+        created_after=created_after,
+        created_before=created_before,
+        updated_after=updated_after,
+        updated_before=updated_before,
+    )
+    try:
+        crud.item_cursor_key(query.order, page)
+    except InvalidCursorError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return query
+
+
+ItemsQueryDep = Annotated[ItemsQuery, Depends(get_items_query)]
+
+
+def version_etag(id: int | None, version: int) -> str:
+    """
+    ETag of a versioned row, sent back in If-Match to update it. It has the
+    row's id, as /users/me is the same URL for every user.
+    """
+    return f'"{id}-{version}"'
+
+
+def get_if_match(
+    if_match: Annotated[str | None, Header()] = None,
+) -> tuple[int, int] | None:
+    """
+    Id and version of the row the client last saw, from the ETag it sends in
+    If-Match: the update then fails with 409 if someone else changed the row
+    since.
+    """
+    if if_match is None or if_match.strip() == "*":
+        return None
+    tag = if_match.strip()
+    id, _, version = tag[1:-1].partition("-")
+    quoted = len(tag) > 1 and tag[0] == tag[-1] == '"'
+    if not quoted or not id.isdigit() or not version.isdigit():
+        raise HTTPException(status_code=400, detail="Invalid If-Match header")
+    return int(id), int(version)
+
+
+def if_match_version(if_match: tuple[int, int] | None, id: int) -> int | None:
+    """Version row `id` must be at to be updated, 409 for another row's ETag."""
+    if if_match is None:
+        return None
+    etag_id, version = if_match
+    if etag_id != id:
+        raise HTTPException(
+            status_code=409, detail="The If-Match ETag is not the one of this row"
+        )
+    return version
+
+
+IfMatchDep = Annotated[tuple[int, int] | None, Depends(get_if_match)]
+
+
+def http_date(moment: datetime) -> str:
+    return format_datetime(moment.astimezone(timezone.utc), usegmt=True)
+
+
+class ConditionalGet:
+    """
+    Validators of a GET response: `check` sets them, and answers 304 Not
+    Modified right away, skipping the query and serialization of the body,
+    when the client sent If-None-Match or If-Modified-Since for them.
+    """
+
+    def __init__(self, request: Request, response: Response) -> None:
+        self.request = request
+        self.response = response
+        self.etag: str | None = None
+        self.last_modified: datetime | None = None
+
+    def list_etag(self, owner_id: int, revision: int) -> str:
+        """
+        ETag of a list of the items of `owner_id` at `revision`, different for
+        each owner and query string, as the same URL lists each user's items.
+        """
+        scope = f"{owner_id}?{self.request.url.query}".encode()
+        return f'"{revision}-{hashlib.blake2b(scope, digest_size=8).hexdigest()}"'
+
+    def check(self, etag: str, last_modified: datetime | None = None) -> None:
+        self.etag, self.last_modified = etag, last_modified
+        headers = {"ETag": etag}
+        if last_modified:
+            headers["Last-Modified"] = http_date(last_modified)
+        self.response.headers.update(headers)
+        if self.is_fresh(etag, last_modified):
+            raise HTTPException(status_code=304, headers=headers)
+
+    def is_fresh(self, etag: str, last_modified: datetime | None) -> bool:
+        # If-Modified-Since only counts without If-None-Match, its one second
+        # resolution misses changes within the second of the response
+        if_none_match = self.request.headers.get("If-None-Match")
+        if if_none_match is not None:
+            tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+            return "*" in tags or etag in tags
+        if_modified_since = self.request.headers.get("If-Modified-Since")
+        if if_modified_since is None or last_modified is None:
+            return False
+        try:
+            since = parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+        if since.tzinfo is None:
+            since = since.replace(tzinfo=timezone.utc)
+        return last_modified.replace(microsecond=0) <= since
+
+
+ConditionalGetDep = Annotated[ConditionalGet, Depends()]
+
+
+class CachedGet:
+    """
+    Response cache of a GET route: `replay` answers from a cached response,
+    through the conditional checks, and `put` serializes a fresh one and
+    caches it, with the validators the route checked.
+
+    The postgres backend queries Postgres synchronously, async routes call
+    `get_async` and `put_async`, which run it in the threadpool.
+    """
+
+    def __init__(self, conditional: ConditionalGetDep) -> None:
+        self.conditional = conditional
+        # Lookup of the response the route reads, put checks the tags it read
+        # weren't invalidated since
+        self.miss = CacheMiss()
+
+    def key(self, name: str) -> str:
+        """Cache key of `name` with this request's query parameters."""
+        params = sorted(self.conditional.request.query_params.multi_items())
+        return f"{name}?{urlencode(params)}"
+
+    def get(self, key: str) -> CachedResponse | None:
+        cached = response_cache.get(key)
+        if isinstance(cached, CacheMiss):
+            self.miss = cached
+            return None
+        return cached
+
+    async def get_async(self, key: str) -> CachedResponse | None:
+        if response_cache.blocking:
+            return await run_in_threadpool(self.get, key)
+        return self.get(key)
+
+    def replay(self, cached: CachedResponse) -> Response:
+        if cached.etag:
+            self.conditional.check(cached.etag, cached.last_modified)
+        return Response(
+            cached.body, media_type="application/json", headers=cached.headers
+        )
+
+    def put(
+        self,
+        key: str,
+        content: SQLModel,
+        tags: Collection[str],
+        owner_id: int | None = None,
+    ) -> Response:
+        cached = CachedResponse(
+            body=content.model_dump_json().encode(),
+            etag=self.conditional.etag,
+            last_modified=self.conditional.last_modified,
+            owner_id=owner_id,
+        )
+        response_cache.put(key, cached, tags, self.miss)
+        return Response(
+            cached.body, media_type="application/json", headers=cached.headers
+        )
+
+    async def put_async(
+        self,
+        key: str,
+        content: SQLModel,
+        tags: Collection[str],
+        owner_id: int | None = None,
+    ) -> Response:
+        if response_cache.blocking:
+            return await run_in_threadpool(self.put, key, content, tags, owner_id)
+        return self.put(key, content, tags, owner_id)
+
+
+CachedGetDep = Annotated[CachedGet, Depends()]
+
+
+def get_count_mode(count_mode: CountMode | None = None) -> CountMode:
+    """
+    How list endpoints count their rows, LIST_COUNT_MODE by default. The
+    response says which mode was used.
+    """
+    return count_mode or settings.LIST_COUNT_MODE
+
+
+CountModeDep = Annotated[CountMode, Depends(get_count_mode)]
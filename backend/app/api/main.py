@@ -1,9 +1,16 @@
 from fastapi import APIRouter
 
-from app.api.routes import items, login, users, utils
+from app.api.routes import items, items_async, login, login_async, users, utils
+from app.core.config import settings
 
 api_router = APIRouter()
-api_router.include_router(login.router, tags=["login"])
+if settings.ASYNC_ROUTES:
+    api_router.include_router(login_async.router, tags=["login"])
+else:
+    api_router.include_router(login.router, tags=["login"])
 api_router.include_router(users.router, prefix="/users", tags=["users"])
 api_router.include_router(utils.router, prefix="/utils", tags=["utils"])
-api_router.include_router(items.router, prefix="/items", tags=["items"])
+if settings.ASYNC_ROUTES:
+    api_router.include_router(items_async.router, prefix="/items", tags=["items"])
+else:
+    api_router.include_router(items.router, prefix="/items", tags=["items"])
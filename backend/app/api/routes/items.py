@@ -1,102 +1,326 @@
-from typing import Any
+import csv
+import io
+import json
+from collections.abc import AsyncIterator, Collection, Iterator, Sequence
+from typing import Any, Literal
 
-from fastapi import APIRouter, HTTPException
-from sqlmodel import func, select
+from fastapi import APIRouter, HTTPException, Response
+from fastapi.responses import StreamingResponse
+from sqlalchemy import Row
+from sqlmodel import Session
 
-from app.api.deps import CurrentUser, SessionDep
-from app.models import Item, ItemCreate, ItemPublic, ItemsPublic, ItemUpdate, Message
+from app import crud
+from app.api.deps import (
+    CachedGetDep,
+    ConditionalGetDep,
+    CountModeDep,
+    CurrentPrincipal,
+    IfMatchDep,
+    ItemsQueryDep,
+    PageDep,
+    SessionDep,
+    if_match_version,
+    version_etag,
+)
+from app.api.routing import SessionRoute
+from app.core.config import settings
+from app.core.db import read_only_engine, replica_set
+from app.core.principals import Principal
+from app.core.replicas import replica_pins
+from app.core.response_cache import item_tag, list_tag, owner_tag
+from app.models import (
+    Item,
+    ItemBatchResult,
+    ItemCreate,
+    ItemPublic,
+    ItemsBatchPublic,
+    ItemsCreate,
+    ItemsDelete,
+    ItemsPublic,
+    ItemsUpdate,
+    ItemUpdate,
+    Message,
+)
 
-router = APIRouter()
+router = APIRouter(route_class=SessionRoute)
+
+ExportFormat = Literal["ndjson", "csv"]
+export_media_types = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+export_csv_header = "id,title,description,owner_id\r\n"
 
 
 @router.get("/", response_model=ItemsPublic)
 def read_items(
-    session: SessionDep, current_user: CurrentUser, skip: int = 0, limit: int = 100
+    session: SessionDep,
+    current_user: CurrentPrincipal,
+    page: PageDep,
+    count_mode: CountModeDep,
+    query: ItemsQueryDep,
+    conditional: ConditionalGetDep,
+    cache: CachedGetDep,
 ) -> Any:
     """
-    Retrieve items.
+    Retrieve items, optionally searched, filtered and sorted. Answers 304
+    when none of the user's items changed since the ETag or date the client
+    sent. The list of all items has no validators.
     """
-
-    if current_user.is_superuser:
-        count_statement = select(func.count()).select_from(Item)
-        count = session.exec(count_statement).one()
-        statement = select(Item).offset(skip).limit(limit)
-        items = session.exec(statement).all()
-    else:
-        count_statement = (
-            select(func.count())
-            .select_from(Item)
-            .where(Item.owner_id == current_user.id)
+    owner_id = None if current_user.is_superuser else current_user.id
+    key = cache.key(list_tag(owner_id))
+    cached = cache.get(key)
+    if cached:
+        return cache.replay(cached)
+    if owner_id is not None:
+        # Read before the list, so a write in between only makes the ETag stale
+        revision, modified_at = crud.get_items_revision(
+            session=session, owner_id=owner_id
         )
-        count = session.exec(count_statement).one()
-        statement = (
-            select(Item)
-            .where(Item.owner_id == current_user.id)
-            .offset(skip)
-            .limit(limit)
+        conditional.check(conditional.list_etag(owner_id, revision), modified_at)
+    items, next_cursor = crud.list_items(
+        session=session, owner_id=owner_id, query=query, page=page
+    )
+    count, count_mode = crud.count_items(
+        session=session, owner_id=owner_id, mode=count_mode, query=query
+    )
+    content = ItemsPublic(
+        data=items,
+        count=count,
+        count_mode=count_mode,
+        has_more=next_cursor is not None,
+        next_cursor=next_cursor,
+    )
+    return cache.put(key, content, {list_tag(owner_id)})
+
+
+def format_export(rows: Sequence[Row[Any]], format: ExportFormat) -> str:
+    if format == "ndjson":
+        return "".join(json.dumps(row._asdict()) + "\n" for row in rows)
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(rows)
+    return buffer.getvalue()
+
+
+def export_response(
+    content: Iterator[str] | AsyncIterator[str], format: ExportFormat
+) -> StreamingResponse:
+    return StreamingResponse(
+        content,
+        media_type=export_media_types[format],
+        headers={"Content-Disposition": f'attachment; filename="items.{format}"'},
+    )
+
+
+@router.get("/export")
+def export_items(
+    current_user: CurrentPrincipal, format: ExportFormat = "ndjson"
+) -> StreamingResponse:
+    """
+    Stream all the items as NDJSON or CSV.
+    """
+    owner_id = None if current_user.is_superuser else current_user.id
+    # Exports are long reads, served by a replica when there is one
+    bind = replica_set.pick(replica_pins.min_lsn(current_user.id)) or read_only_engine
+
+    def content() -> Iterator[str]:
+        if format == "csv":
+            yield export_csv_header
+        # The request's session is closed before the response is streamed
+        with Session(bind) as session:
+            for rows in crud.export_items(session=session, owner_id=owner_id):
+                yield format_export(rows, format)
+
+    return export_response(content(), format)
+
+
+def check_item_owner(owner_id: int | None, current_user: Principal) -> None:
+    if not current_user.is_superuser and (owner_id != current_user.id):
+        raise HTTPException(status_code=400, detail="Not enough permissions")
+
+
+def item_write_error(item: Item | None, current_user: Principal) -> HTTPException:
+    """
+    Error of a write that matched no item: missing, someone else's, or
+    changed since the version the client sent.
+    """
+    if not item:
+        return HTTPException(status_code=404, detail="Item not found")
+    if not current_user.is_superuser and (item.owner_id != current_user.id):
+        return HTTPException(status_code=400, detail="Not enough permissions")
+    return HTTPException(
+        status_code=409, detail="The item was changed since that version"
+    )
+
+
+def check_batch_size(size: int) -> None:
+    if size > settings.MAX_BATCH_SIZE:
+        raise HTTPException(
+            status_code=400,
+            detail=f"A batch can't have more than {settings.MAX_BATCH_SIZE} items",
         )
-        items = session.exec(statement).all()
 
-    return ItemsPublic(data=items, count=count)
+
+def batch_error(
+    id: int, item: Item | None, current_user: Principal
+) -> ItemBatchResult | None:
+    """The result of an operation on an item the user can't change, if so."""
+    if not item:
+        return ItemBatchResult(id=id, status=404, detail="Item not found")
+    if not current_user.is_superuser and (item.owner_id != current_user.id):
+        return ItemBatchResult(id=id, status=400, detail="Not enough permissions")
+    return None
+
+
+def updated_result(id: int, item: Item | None) -> ItemBatchResult:
+    """The result of an update, a 404 if the item is gone after all."""
+    if not item:
+        return ItemBatchResult(id=id, status=404, detail="Item not found")
+    return ItemBatchResult(id=id, status=200, item=item)
+
+
+def deleted_result(id: int, deleted_ids: Collection[int]) -> ItemBatchResult:
+    """The result of a delete, a 404 if another request deleted the item first."""
+    if id not in deleted_ids:
+        return ItemBatchResult(id=id, status=404, detail="Item not found")
+    return ItemBatchResult(id=id, status=200)
+
+
+@router.post("/batch", response_model=ItemsBatchPublic)
+def create_items(
+    *, session: SessionDep, current_user: CurrentPrincipal, items_in: ItemsCreate
+) -> Any:
+    """
+    Create many items in one transaction.
+    """
+    check_batch_size(len(items_in.data))
+    items = crud.create_items(
+        session=session, items_in=items_in.data, owner_id=current_user.id
+    )
+    return ItemsBatchPublic(
+        data=[ItemBatchResult(id=item.id, status=200, item=item) for item in items]
+    )
+
+
+@router.put("/batch", response_model=ItemsBatchPublic)
+def update_items(
+    *, session: SessionDep, current_user: CurrentPrincipal, items_in: ItemsUpdate
+) -> Any:
+    """
+    Update many items in one transaction, skipping those that can't be.
+    """
+    check_batch_size(len(items_in.data))
+    # Locked, so none is deleted before the update
+    items = crud.get_items(
+        session=session, ids=[item.id for item in items_in.data], lock=True
+    )
+    errors = {
+        item_in.id: batch_error(item_in.id, items.get(item_in.id), current_user)
+        for item_in in items_in.data
+    }
+    items = crud.update_items(
+        session=session,
+        items_in=[item_in for item_in in items_in.data if not errors[item_in.id]],
+    )
+    return ItemsBatchPublic(
+        data=[
+            errors[item_in.id] or updated_result(item_in.id, items.get(item_in.id))
+            for item_in in items_in.data
+        ]
+    )
+
+
+@router.post("/batch/delete", response_model=ItemsBatchPublic)
+def delete_items(
+    *, session: SessionDep, current_user: CurrentPrincipal, items_in: ItemsDelete
+) -> Any:
+    """
+    Delete many items in one transaction, skipping those that can't be.
+    """
+    check_batch_size(len(items_in.ids))
+    items = crud.get_items(session=session, ids=items_in.ids)
+    errors = []
+    db_items = []
+    for id in items_in.ids:
+        # A repeated id was deleted by its first occurrence
+        item = items.pop(id, None)
+        error = batch_error(id, item, current_user)
+        if item and not error:
+            db_items.append(item)
+        errors.append((id, error))
+    deleted_ids = crud.delete_items(session=session, db_items=db_items)
+    results = [error or deleted_result(id, deleted_ids) for id, error in errors]
+    return ItemsBatchPublic(data=results)
 
 
 @router.get("/{id}", response_model=ItemPublic)
-def read_item(session: SessionDep, current_user: CurrentUser, id: int) -> Any:
+def read_item(
+    session: SessionDep,
+    current_user: CurrentPrincipal,
+    id: int,
+    conditional: ConditionalGetDep,
+    cache: CachedGetDep,
+) -> Any:
     """
     Get item by ID.
     """
+    key = item_tag(id)
+    cached = cache.get(key)
+    if cached:
+        check_item_owner(cached.owner_id, current_user)
+        return cache.replay(cached)
     item = session.get(Item, id)
     if not item:
         raise HTTPException(status_code=404, detail="Item not found")
-    if not current_user.is_superuser and (item.owner_id != current_user.id):
-        raise HTTPException(status_code=400, detail="Not enough permissions")
-    return item
+    check_item_owner(item.owner_id, current_user)
+    conditional.check(version_etag(item.id, item.version), item.updated_at)
+    tags = {item_tag(id), owner_tag(item.owner_id)}
+    content = ItemPublic.model_validate(item)
+    return cache.put(key, content, tags, owner_id=item.owner_id)
 
 
 @router.post("/", response_model=ItemPublic)
 def create_item(
-    *, session: SessionDep, current_user: CurrentUser, item_in: ItemCreate
+    *, session: SessionDep, current_user: CurrentPrincipal, item_in: ItemCreate
 ) -> Any:
     """
     Create new item.
     """
-    item = Item.model_validate(item_in, update={"owner_id": current_user.id})
-    session.add(item)
-    session.commit()
-    session.refresh(item)
-    return item
+    return crud.create_item(session=session, item_in=item_in, owner_id=current_user.id)
 
 
 @router.put("/{id}", response_model=ItemPublic)
 def update_item(
-    *, session: SessionDep, current_user: CurrentUser, id: int, item_in: ItemUpdate
+    *,
+    session: SessionDep,
+    current_user: CurrentPrincipal,
+    id: int,
+    item_in: ItemUpdate,
+    if_match: IfMatchDep,
+    response: Response,
 ) -> Any:
     """
-    Update an item.
+    Update an item, only if it is still at the version sent in If-Match.
     """
-    item = session.get(Item, id)
+    owner_id = None if current_user.is_superuser else current_user.id
+    item = crud.update_item(
+        session=session,
+        id=id,
+        item_in=item_in,
+        owner_id=owner_id,
+        version=if_match_version(if_match, id),
+    )
     if not item:
-        raise HTTPException(status_code=404, detail="Item not found")
-    if not current_user.is_superuser and (item.owner_id != current_user.id):
-        raise HTTPException(status_code=400, detail="Not enough permissions")
-    update_dict = item_in.model_dump(exclude_unset=True)
-    item.sqlmodel_update(update_dict)
-    session.add(item)
-    session.commit()
-    session.refresh(item)
+        raise item_write_error(session.get(Item, id), current_user)
+    response.headers["ETag"] = version_etag(item.id, item.version)
     return item
 
 
 @router.delete("/{id}")
-def delete_item(session: SessionDep, current_user: CurrentUser, id: int) -> Message:
+def delete_item(
+    session: SessionDep, current_user: CurrentPrincipal, id: int
+) -> Message:
     """
     Delete an item.
     """
-    item = session.get(Item, id)
-    if not item:
-        raise HTTPException(status_code=404, detail="Item not found")
-    if not current_user.is_superuser and (item.owner_id != current_user.id):
-        raise HTTPException(status_code=400, detail="Not enough permissions")
-    session.delete(item)
-    session.commit()
+    owner_id = None if current_user.is_superuser else current_user.id
+    if not crud.delete_item(session=session, id=id, owner_id=owner_id):
+        raise item_write_error(session.get(Item, id), current_user)
     return Message(message="Item deleted successfully")
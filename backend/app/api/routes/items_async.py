@@ -0,0 +1,270 @@
+from collections.abc import AsyncIterator
+from typing import Any
+
+from fastapi import APIRouter, HTTPException, Response
+from fastapi.responses import StreamingResponse
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from app import crud_async
+from app.api.deps import (
+    AsyncCurrentPrincipal,
+    AsyncSessionDep,
+    CachedGetDep,
+    ConditionalGetDep,
+    CountModeDep,
+    IfMatchDep,
+    ItemsQueryDep,
+    PageDep,
+    if_match_version,
+    version_etag,
+)
+from app.api.routes.items import (
+    ExportFormat,
+    batch_error,
+    check_batch_size,
+    check_item_owner,
+    deleted_result,
+    export_csv_header,
+    export_response,
+    format_export,
+    item_write_error,
+    updated_result,
+)
+from app.api.routing import AsyncSessionRoute
+from app.core.db import async_read_only_engine
+from app.core.response_cache import item_tag, list_tag, owner_tag
+from app.models import (
+    Item,
+    ItemBatchResult,
+    ItemCreate,
+    ItemPublic,
+    ItemsBatchPublic,
+    ItemsCreate,
+    ItemsDelete,
+    ItemsPublic,
+    ItemsUpdate,
+    ItemUpdate,
+    Message,
+)
+
+router = APIRouter(route_class=AsyncSessionRoute)
+
+
+@router.get("/", response_model=ItemsPublic)
+async def read_items(
+    session: AsyncSessionDep,
+    current_user: AsyncCurrentPrincipal,
+    page: PageDep,
+    count_mode: CountModeDep,
+    query: ItemsQueryDep,
+    conditional: ConditionalGetDep,
+    cache: CachedGetDep,
+) -> Any:
+    """
+    Retrieve items, optionally searched, filtered and sorted. Answers 304
+    when none of the user's items changed since the ETag or date the client
+    sent. The list of all items has no validators.
+    """
+    owner_id = None if current_user.is_superuser else current_user.id
+    key = cache.key(list_tag(owner_id))
+    cached = await cache.get_async(key)
+    if cached:
+        return cache.replay(cached)
+    if owner_id is not None:
+        # Read before the list, so a write in between only makes the ETag stale
+        revision, modified_at = await crud_async.get_items_revision(
+            session=session, owner_id=owner_id
+        )
+        conditional.check(conditional.list_etag(owner_id, revision), modified_at)
+    items, next_cursor = await crud_async.list_items(
+        session=session, owner_id=owner_id, query=query, page=page
+    )
+    count, count_mode = await crud_async.count_items(
+        session=session, owner_id=owner_id, mode=count_mode, query=query
+    )
+    content = ItemsPublic(
+        data=items,
+        count=count,
+        count_mode=count_mode,
+        has_more=next_cursor is not None,
+        next_cursor=next_cursor,
+    )
+    return await cache.put_async(key, content, {list_tag(owner_id)})
+
+
+@router.get("/export")
+async def export_items(
+    current_user: AsyncCurrentPrincipal, format: ExportFormat = "ndjson"
+) -> StreamingResponse:
+    """
+    Stream all the items as NDJSON or CSV.
+    """
+    owner_id = None if current_user.is_superuser else current_user.id
+
+    async def content() -> AsyncIterator[str]:
+        if format == "csv":
+            yield export_csv_header
+        async with AsyncSession(async_read_only_engine) as session:
+            async for rows in crud_async.export_items(
+                session=session, owner_id=owner_id
+            ):
+                yield format_export(rows, format)
+
+    return export_response(content(), format)
+
+
+@router.post("/batch", response_model=ItemsBatchPublic)
+async def create_items(
+    *,
+    session: AsyncSessionDep,
+    current_user: AsyncCurrentPrincipal,
+    items_in: ItemsCreate,
+) -> Any:
+    """
+    Create many items in one transaction.
+    """
+    check_batch_size(len(items_in.data))
+    items = await crud_async.create_items(
+        session=session, items_in=items_in.data, owner_id=current_user.id
+    )
+    return ItemsBatchPublic(
+        data=[ItemBatchResult(id=item.id, status=200, item=item) for item in items]
+    )
+
+
+@router.put("/batch", response_model=ItemsBatchPublic)
+async def update_items(
+    *,
+    session: AsyncSessionDep,
+    current_user: AsyncCurrentPrincipal,
+    items_in: ItemsUpdate,
+) -> Any:
+    """
+    Update many items in one transaction, skipping those that can't be.
+    """
+    check_batch_size(len(items_in.data))
+    # Locked, so none is deleted before the update
+    items = await crud_async.get_items(
+        session=session, ids=[item.id for item in items_in.data], lock=True
+    )
+    errors = {
+        item_in.id: batch_error(item_in.id, items.get(item_in.id), current_user)
+        for item_in in items_in.data
+    }
+    items = await crud_async.update_items(
+        session=session,
+        items_in=[item_in for item_in in items_in.data if not errors[item_in.id]],
+    )
+    return ItemsBatchPublic(
+        data=[
+            errors[item_in.id] or updated_result(item_in.id, items.get(item_in.id))
+            for item_in in items_in.data
+        ]
+    )
+
+
+@router.post("/batch/delete", response_model=ItemsBatchPublic)
+async def delete_items(
+    *,
+    session: AsyncSessionDep,
+    current_user: AsyncCurrentPrincipal,
+    items_in: ItemsDelete,
+) -> Any:
+    """
+    Delete many items in one transaction, skipping those that can't be.
+    """
+    check_batch_size(len(items_in.ids))
+    items = await crud_async.get_items(session=session, ids=items_in.ids)
+    errors = []
+    db_items = []
+    for id in items_in.ids:
+        # A repeated id was deleted by its first occurrence
+        item = items.pop(id, None)
+        error = batch_error(id, item, current_user)
+        if item and not error:
+            db_items.append(item)
+        errors.append((id, error))
+    deleted_ids = await crud_async.delete_items(session=session, db_items=db_items)
+    results = [error or deleted_result(id, deleted_ids) for id, error in errors]
+    return ItemsBatchPublic(data=results)
+
+
+@router.get("/{id}", response_model=ItemPublic)
+async def read_item(
+    session: AsyncSessionDep,
+    current_user: AsyncCurrentPrincipal,
+    id: int,
+    conditional: ConditionalGetDep,
+    cache: CachedGetDep,
+) -> Any:
+    """
+    Get item by ID.
+    """
+    key = item_tag(id)
+    cached = await cache.get_async(key)
+    if cached:
+        check_item_owner(cached.owner_id, current_user)
+        return cache.replay(cached)
+    item = await session.get(Item, id)
+    if not item:
+        raise HTTPException(status_code=404, detail="Item not found")
+    check_item_owner(item.owner_id, current_user)
+    conditional.check(version_etag(item.id, item.version), item.updated_at)
+    tags = {item_tag(id), owner_tag(item.owner_id)}
+    content = ItemPublic.model_validate(item)
+    return await cache.put_async(key, content, tags, owner_id=item.owner_id)
+
+
+@router.post("/", response_model=ItemPublic)
+async def create_item(
+    *,
+    session: AsyncSessionDep,
+    current_user: AsyncCurrentPrincipal,
+    item_in: ItemCreate,
+) -> Any:
+    """
+    Create new item.
+    """
+    return await crud_async.create_item(
+        session=session, item_in=item_in, owner_id=current_user.id
+    )
+
+
+@router.put("/{id}", response_model=ItemPublic)
+async def update_item(
+    *,
+    session: AsyncSessionDep,
+    current_user: AsyncCurrentPrincipal,
+    id: int,
+    item_in: ItemUpdate,
+    if_match: IfMatchDep,
+    response: Response,
+) -> Any:
+    """
+    Update an item, only if it is still at the version sent in If-Match.
+    """
+    owner_id = None if current_user.is_superuser else current_user.id
+    item = await crud_async.update_item(
+        session=session,
+        id=id,
+        item_in=item_in,
+        owner_id=owner_id,
+        version=if_match_version(if_match, id),
+    )
+    if not item:
+        raise item_write_error(await session.get(Item, id), current_user)
+    response.headers["ETag"] = version_etag(item.id, item.version)
+    return item
+
+
+@router.delete("/{id}")
+async def delete_item(
+    session: AsyncSessionDep, current_user: AsyncCurrentPrincipal, id: int
+) -> Message:
+    """
+    Delete an item.
+    """
+    owner_id = None if current_user.is_superuser else current_user.id
+    if not await crud_async.delete_item(session=session, id=id, owner_id=owner_id):
+        raise item_write_error(await session.get(Item, id), current_user)
+    return Message(message="Item deleted successfully")
@@ -1,15 +1,21 @@
 from datetime import timedelta
 from typing import Annotated, Any
 
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request
 from fastapi.responses import HTMLResponse
 from fastapi.security import OAuth2PasswordRequestForm
 
 from app import crud
-from app.api.deps import CurrentUser, SessionDep, get_current_active_superuser
+from app.api.deps import (
+    CurrentUser,
+    SessionDep,
+    get_current_active_superuser,
+)
+from app.api.routing import SessionRoute
 from app.core import security
 from app.core.config import settings
 from app.core.security import get_password_hash
+from app.core.throttle import login_throttle
 from app.models import Message, NewPassword, Token, UserPublic
 from app.utils import (
     generate_password_reset_token,
@@ -18,39 +24,64 @@ from app.utils import (
     verify_password_reset_token,
 )
 
-router = APIRouter()
+router = APIRouter(route_class=SessionRoute)
 
 
 @router.post("/login/access-token")
 def login_access_token(
-    session: SessionDep, form_data: Annotated[OAuth2PasswordRequestForm, Depends()]
+    request: Request,
+    session: SessionDep,
+    form_data: Annotated[OAuth2PasswordRequestForm, Depends()],
 ) -> Token:
     """
     OAuth2 compatible token login, get an access token for future requests
     """
+    client_ip = request.client.host if request.client else "unknown"
+    retry_after = login_throttle.retry_after(session, client_ip, form_data.username)
+    if retry_after is not None:
+        raise HTTPException(
+            status_code=429,
+            detail="Too many failed login attempts, try again later",
+            headers={"Retry-After": str(retry_after)},
+        )
     user = crud.authenticate(
         session=session, email=form_data.username, password=form_data.password
     )
     if not user:
+        login_throttle.record_failure(session, client_ip, form_data.username)
         raise HTTPException(status_code=400, detail="Incorrect email or password")
     elif not user.is_active:
         raise HTTPException(status_code=400, detail="Inactive user")
     access_token_expires = timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
-    return Token(
-        access_token=security.create_access_token(
-            user.id, expires_delta=access_token_expires
-        )
+    claims: dict[str, Any] = {"ver": user.token_version}
+    if settings.ACCESS_TOKEN_CLAIMS:
+        claims.update(email=user.email, act=user.is_active, su=user.is_superuser)
+    access_token = security.create_access_token(
+        user.id, expires_delta=access_token_expires, claims=claims
     )
+    # Resets the email's bucket, the postgres backend commits it on the session
+    login_throttle.record_success(session, client_ip, form_data.username)
+    return Token(access_token=access_token)
 
 
 @router.post("/login/test-token", response_model=UserPublic)
 def test_token(current_user: CurrentUser) -> Any:
     """
-    Test access token
+    Test access token. Answers the stored user, whose full name and version
+    tokens don't carry, so it reads the user even with ACCESS_TOKEN_CLAIMS.
     """
     return current_user
 
 
+@router.post("/logout-everywhere")
+def logout_everywhere(session: SessionDep, current_user: CurrentUser) -> Message:
+    """
+    Revoke all the access tokens of the current user
+    """
+    crud.revoke_tokens(session=session, db_user=current_user)
+    return Message(message="Logged out from all sessions")
+
+
 @router.post("/password-recovery/{email}")
 def recover_password(email: str, session: SessionDep) -> Message:
     """
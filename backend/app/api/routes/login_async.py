@@ -0,0 +1,164 @@
+from datetime import timedelta
+from typing import Annotated, Any
+
+from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi.responses import HTMLResponse
+from fastapi.security import OAuth2PasswordRequestForm
+from starlette.concurrency import run_in_threadpool
+
+from app import crud_async
+from app.api.deps import (
+    AsyncCurrentUser,
+    AsyncSessionDep,
+    get_current_active_superuser_async,
+)
+from app.api.routing import AsyncSessionRoute
+from app.core import security
+from app.core.config import settings
+from app.core.security import get_password_hash_async
+from app.core.throttle import login_throttle
+from app.models import Message, NewPassword, Token, UserPublic
+from app.utils import (
+    generate_password_reset_token,
+    generate_reset_password_email,
+    send_email,
+    verify_password_reset_token,
+)
+
+router = APIRouter(route_class=AsyncSessionRoute)
+
+
+@router.post("/login/access-token")
+async def login_access_token(
+    request: Request,
+    session: AsyncSessionDep,
+    form_data: Annotated[OAuth2PasswordRequestForm, Depends()],
+) -> Token:
+    """
+    OAuth2 compatible token login, get an access token for future requests
+    """
+    client_ip = request.client.host if request.client else "unknown"
+    # The throttle backend may use the session, synchronously
+    retry_after = await session.run_sync(
+        login_throttle.retry_after, client_ip, form_data.username
+    )
+    if retry_after is not None:
+        raise HTTPException(
+            status_code=429,
+            detail="Too many failed login attempts, try again later",
+            headers={"Retry-After": str(retry_after)},
+        )
+    user = await crud_async.authenticate(
+        session=session, email=form_data.username, password=form_data.password
+    )
+    if not user:
+        await session.run_sync(
+            login_throttle.record_failure, client_ip, form_data.username
+        )
+        raise HTTPException(status_code=400, detail="Incorrect email or password")
+    elif not user.is_active:
+        raise HTTPException(status_code=400, detail="Inactive user")
+    access_token_expires = timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
+    claims: dict[str, Any] = {"ver": user.token_version}
+    if settings.ACCESS_TOKEN_CLAIMS:
+        claims.update(email=user.email, act=user.is_active, su=user.is_superuser)
+    access_token = security.create_access_token(
+        user.id, expires_delta=access_token_expires, claims=claims
+    )
+    # Resets the email's bucket, the postgres backend commits it on the session
+    await session.run_sync(login_throttle.record_success, client_ip, form_data.username)
+    return Token(access_token=access_token)
+
+
+@router.post("/login/test-token", response_model=UserPublic)
+async def test_token(current_user: AsyncCurrentUser) -> Any:
+    """
+    Test access token. Answers the stored user, whose full name and version
+    tokens don't carry, so it reads the user even with ACCESS_TOKEN_CLAIMS.
+    """
+    return current_user
+
+
+@router.post("/logout-everywhere")
+async def logout_everywhere(
+    session: AsyncSessionDep, current_user: AsyncCurrentUser
+) -> Message:
+    """
+    Revoke all the access tokens of the current user
+    """
+    await crud_async.revoke_tokens(session=session, db_user=current_user)
+    return Message(message="Logged out from all sessions")
+
+
+@router.post("/password-recovery/{email}")
+async def recover_password(email: str, session: AsyncSessionDep) -> Message:
+    """
+    Password Recovery
+    """
+    user = await crud_async.get_user_by_email(session=session, email=email)
+
+    if not user:
+        raise HTTPException(
+            status_code=404,
+            detail="The user with this email does not exist in the system.",
+        )
+    password_reset_token = generate_password_reset_token(email=email)
+    email_data = generate_reset_password_email(
+        email_to=user.email, email=email, token=password_reset_token
+    )
+    await run_in_threadpool(
+        send_email,
+        email_to=user.email,
+        subject=email_data.subject,
+        html_content=email_data.html_content,
+    )
+    return Message(message="Password recovery email sent")
+
+
+@router.post("/reset-password/")
+async def reset_password(session: AsyncSessionDep, body: NewPassword) -> Message:
+    """
+    Reset password
+    """
+    email = verify_password_reset_token(token=body.token)
+    if not email:
+        raise HTTPException(status_code=400, detail="Invalid token")
+    user = await crud_async.get_user_by_email(session=session, email=email)
+    if not user:
+        raise HTTPException(
+            status_code=404,
+            detail="The user with this email does not exist in the system.",
+        )
+    elif not user.is_active:
+        raise HTTPException(status_code=400, detail="Inactive user")
+    hashed_password = await get_password_hash_async(password=body.new_password)
+    user.hashed_password = hashed_password
+    session.add(user)
+    await session.commit()
+    return Message(message="Password updated successfully")
+
+
+@router.post(
+    "/password-recovery-html-content/{email}",
+    dependencies=[Depends(get_current_active_superuser_async)],
+    response_class=HTMLResponse,
+)
+async def recover_password_html_content(email: str, session: AsyncSessionDep) -> Any:
+    """
+    HTML Content for Password Recovery
+    """
+    user = await crud_async.get_user_by_email(session=session, email=email)
+
+    if not user:
+        raise HTTPException(
+            status_code=404,
+            detail="The user with this username does not exist in the system.",
+        )
+    password_reset_token = generate_password_reset_token(email=email)
+    email_data = generate_reset_password_email(
+        email_to=user.email, email=email, token=password_reset_token
+    )
+
+    return HTMLResponse(
+        content=email_data.html_content, headers={"subject:": email_data.subject}
+    )
@@ -1,18 +1,25 @@
 from typing import Any
 
-from fastapi import APIRouter, Depends, HTTPException
-from sqlmodel import col, delete, func, select
+from fastapi import APIRouter, Depends, HTTPException, Response
 
 from app import crud
 from app.api.deps import (
+    ConditionalGetDep,
+    CountModeDep,
     CurrentUser,
+    IfMatchDep,
+    PageDep,
     SessionDep,
     get_current_active_superuser,
+    if_match_version,
+    version_etag,
 )
+from app.api.routing import SessionRoute
 from app.core.config import settings
+from app.core.principals import invalidate_principal
+from app.core.purges import user_purger
 from app.core.security import get_password_hash, verify_password
 from app.models import (
-    Item,
     Message,
     UpdatePassword,
     User,
@@ -25,7 +32,7 @@ from app.models import (
 )
 from app.utils import generate_new_account_email, send_email
 
-router = APIRouter()
+router = APIRouter(route_class=SessionRoute)
 
 
 @router.get(
@@ -33,18 +40,22 @@ router = APIRouter()
     dependencies=[Depends(get_current_active_superuser)],
     response_model=UsersPublic,
 )
-def read_users(session: SessionDep, skip: int = 0, limit: int = 100) -> Any:
+def read_users(session: SessionDep, page: PageDep, count_mode: CountModeDep) -> Any:
     """
     Retrieve users.
     """
 
-    count_statement = select(func.count()).select_from(User)
-    count = session.exec(count_statement).one()
+    rows = session.exec(crud.users_statement, params=page.params).all()
+    count, count_mode = crud.count_users(session=session, mode=count_mode)
 
-    statement = select(User).offset(skip).limit(limit)
-    users = session.exec(statement).all()
-
-    return UsersPublic(data=users, count=count)
+    users, next_cursor = page.rows(rows)
+    return UsersPublic(
+        data=users,
+        count=count,
+        count_mode=count_mode,
+        has_more=next_cursor is not None,
+        next_cursor=next_cursor,
+    )
 
 
 @router.post(
@@ -91,8 +102,8 @@ def update_user_me(
     user_data = user_in.model_dump(exclude_unset=True)
     current_user.sqlmodel_update(user_data)
     session.add(current_user)
+    invalidate_principal(session, current_user)
     session.commit()
-    session.refresh(current_user)
     return current_user
 
 
@@ -112,15 +123,17 @@ def update_password_me(
     hashed_password = get_password_hash(body.new_password)
     current_user.hashed_password = hashed_password
     session.add(current_user)
+    invalidate_principal(session, current_user)
     session.commit()
     return Message(message="Password updated successfully")
 
 
 @router.get("/me", response_model=UserPublic)
-def read_user_me(current_user: CurrentUser) -> Any:
+def read_user_me(current_user: CurrentUser, conditional: ConditionalGetDep) -> Any:
     """
     Get current user.
     """
+    conditional.check(version_etag(current_user.id, current_user.version))
     return current_user
 
 
@@ -147,19 +160,22 @@ def register_user(session: SessionDep, user_in: UserRegister) -> Any:
 
 @router.get("/{user_id}", response_model=UserPublic)
 def read_user_by_id(
-    user_id: int, session: SessionDep, current_user: CurrentUser
+    user_id: int,
+    session: SessionDep,
+    current_user: CurrentUser,
+    conditional: ConditionalGetDep,
 ) -> Any:
     """
     Get a specific user by id.
     """
     user = session.get(User, user_id)
-    if user == current_user:
-        return user
-    if not current_user.is_superuser:
+    if user != current_user and not current_user.is_superuser:
         raise HTTPException(
             status_code=403,
             detail="The user doesn't have enough privileges",
         )
+    if user:
+        conditional.check(version_etag(user.id, user.version))
     return user
 
 
@@ -173,17 +189,12 @@ def update_user(
     session: SessionDep,
     user_id: int,
     user_in: UserUpdate,
+    if_match: IfMatchDep,
+    response: Response,
 ) -> Any:
     """
-    Update a user.
+    Update a user, only if they are still at the version sent in If-Match.
     """
-
-    db_user = session.get(User, user_id)
-    if not db_user:
-        raise HTTPException(
-            status_code=404,
-            detail="The user with this id does not exist in the system",
-        )
     if user_in.email:
         existing_user = crud.get_user_by_email(session=session, email=user_in.email)
         if existing_user and existing_user.id != user_id:
@@ -191,16 +202,34 @@ def update_user(
                 status_code=409, detail="User with this email already exists"
             )
 
-    db_user = crud.update_user(session=session, db_user=db_user, user_in=user_in)
+    db_user = crud.update_user(
+        session=session,
+        user_id=user_id,
+        user_in=user_in,
+        version=if_match_version(if_match, user_id),
+    )
+    if not db_user:
+        if session.get(User, user_id):
+            raise HTTPException(
+                status_code=409, detail="The user was changed since that version"
+            )
+        raise HTTPException(
+            status_code=404,
+            detail="The user with this id does not exist in the system",
+        )
+    response.headers["ETag"] = version_etag(db_user.id, db_user.version)
     return db_user
 
 
 @router.delete("/{user_id}")
 def delete_user(
-    session: SessionDep, current_user: CurrentUser, user_id: int
+    session: SessionDep,
+    current_user: CurrentUser,
+    user_id: int,
 ) -> Message:
     """
-    Delete a user.
+    Delete a user. The user is deactivated right away, their items and the
+    user itself are deleted in the background.
     """
     user = session.get(User, user_id)
     if not user:
@@ -214,8 +243,6 @@ def delete_user(
             status_code=403, detail="Super users are not allowed to delete themselves"
         )
 
-    statement = delete(Item).where(col(Item.owner_id) == user_id)
-    session.exec(statement)  # type: ignore
-    session.delete(user)
-    session.commit()
+    crud.request_user_deletion(session=session, db_user=user)
+    user_purger.submit(user_id)
     return Message(message="User deleted successfully")
@@ -1,7 +1,13 @@
+from typing import Literal
+
 from fastapi import APIRouter, Depends
 from pydantic.networks import EmailStr
 
 from app.api.deps import get_current_active_superuser
+from app.core.db import async_engine, engine
+from app.core.hashing import HashingPoolStats, hashing_pool
+from app.core.pool import InstrumentedQueuePool, PoolStats
+from app.core.response_cache import ResponseCacheStats, response_cache
 from app.models import Message
 from app.utils import generate_test_email, send_email
 
@@ -24,3 +30,39 @@ def test_email(email_to: EmailStr) -> Message:
         html_content=email_data.html_content,
     )
     return Message(message="Test email sent")
+
+
+@router.get(
+    "/hashing-stats/",
+    dependencies=[Depends(get_current_active_superuser)],
+)
+def hashing_stats() -> HashingPoolStats:
+    """
+    Password hashing pool statistics for this worker process.
+    """
+    return hashing_pool.stats()
+
+
+@router.get(
+    "/db-pool-stats/",
+    dependencies=[Depends(get_current_active_superuser)],
+)
+def db_pool_stats(pool: Literal["sync", "async"] = "sync") -> PoolStats:
+    """
+    Database connection pool statistics for this worker process.
+    """
+    db_pool = async_engine.pool if pool == "async" else engine.pool
+    assert isinstance(db_pool, InstrumentedQueuePool)
+    return db_pool.stats()
+
+
+@router.get(
+    "/response-cache-stats/",
+    dependencies=[Depends(get_current_active_superuser)],
+)
+def response_cache_stats() -> ResponseCacheStats:
+    """
+    Response cache statistics: hits, misses and evictions are those of this
+    worker process, entries and bytes those of the backend.
+    """
+    return response_cache.stats()
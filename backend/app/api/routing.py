@@ -0,0 +1,75 @@
+import functools
+import inspect
+from collections.abc import Callable
+from typing import Any
+
+from fastapi.routing import APIRoute
+from sqlmodel import Session
+from sqlmodel.ext.asyncio.session import AsyncSession
+from starlette.concurrency import run_in_threadpool
+
+from app.api.deps import AsyncSessionDep, SessionDep
+
+
+class SessionRoute(APIRoute):
+    """
+    Route that closes the request's session as soon as its endpoint returns.
+
+    The session checks out a connection on its first query only, and this
+    returns it to the pool before the response is serialized and the
+    dependencies are torn down. Objects the endpoint loaded stay usable,
+    detached, and a query after that checks out a connection again.
+    """
+
+    session_dependency: Any = SessionDep
+
+    def __init__(self, path: str, endpoint: Callable[..., Any], **kwargs: Any):
+        # Including a router creates its routes again, with wrapped endpoints
+        if not getattr(endpoint, "closes_session", False):
+            endpoint = self.close_session_after(endpoint)
+        super().__init__(path, endpoint, **kwargs)
+
+    def close_session_after(self, endpoint: Callable[..., Any]) -> Callable[..., Any]:
+        wrapper: Callable[..., Any]
+        if inspect.iscoroutinefunction(endpoint):
+
+            @functools.wraps(endpoint)
+            async def wrapper(*args: Any, request_session: Any, **kwargs: Any) -> Any:
+                try:
+                    return await endpoint(*args, **kwargs)
+                finally:
+                    await self.close_async(request_session)
+
+        else:
+
+            @functools.wraps(endpoint)
+            def wrapper(*args: Any, request_session: Any, **kwargs: Any) -> Any:
+                try:
+                    return endpoint(*args, **kwargs)
+                finally:
+                    request_session.close()
+
+        # The session is the one the endpoint and its dependencies got, as
+        # FastAPI solves a dependency once per request
+        signature = inspect.signature(endpoint)
+        session_parameter = inspect.Parameter(
+            "request_session",
+            inspect.Parameter.KEYWORD_ONLY,
+            annotation=self.session_dependency,
+        )
+        parameters = [*signature.parameters.values(), session_parameter]
+        wrapper.__signature__ = signature.replace(parameters=parameters)  # type: ignore[attr-defined]
+        wrapper.closes_session = True  # type: ignore[attr-defined]
+        return wrapper
+
+    async def close_async(self, session: Session) -> None:
+        await run_in_threadpool(session.close)
+
+
+class AsyncSessionRoute(SessionRoute):
+    """SessionRoute for async endpoints using an AsyncSession."""
+
+    session_dependency = AsyncSessionDep
+
+    async def close_async(self, session: AsyncSession) -> None:  # type: ignore[override]
+        await session.close()
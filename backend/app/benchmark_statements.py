@@ -0,0 +1,99 @@
+import argparse
+import logging
+import time
+from collections.abc import Callable
+
+from sqlalchemy import Engine
+from sqlmodel import Session, col, create_engine, func, select
+
+from app import crud
+from app.core.config import settings
+from app.models import Item, User
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+warmup_iterations = 50
+
+
+def inline_statements(session: Session, user: User) -> None:
+    session.get(User, user.id)
+    session.exec(
+        select(User).where(func.lower(User.email) == func.lower(user.email))
+    ).first()
+    session.exec(
+        select(func.count()).select_from(Item).where(Item.owner_id == user.id)
+    ).one()
+    session.exec(
+        select(Item)
+        .where(Item.owner_id == user.id, col(Item.id) > 0)
+        .order_by(col(Item.id))
+        .offset(0)
+        .limit(101)
+    ).all()
+    session.get(Item, 0)
+
+
+def prebuilt_statements(session: Session, user: User) -> None:
+    params = {"owner_id": user.id, "after": 0, "skip": 0, "limit": 101}
+    session.get(User, user.id)
+    session.exec(crud.user_by_email_statement, params={"email": user.email}).first()
+    session.exec(crud.owner_items_count_statement, params=params).one()
+    session.exec(crud.owner_items_statement, params=params).all()
+    session.get(Item, 0)
+
+
+def measure(
+    engine: Engine,
+    user: User,
+    run: Callable[[Session, User], None],
+    iterations: int,
+) -> tuple[float, float]:
+    """Wall and client CPU time in microseconds per request."""
+    for _ in range(warmup_iterations):
+        with Session(engine) as session:
+            run(session, user)
+    wall_start = time.perf_counter()
+    cpu_start = time.process_time()
+    for _ in range(iterations):
+        # A new session per iteration, like one per request
+        with Session(engine) as session:
+            run(session, user)
+    wall = (time.perf_counter() - wall_start) / iterations * 1_000_000
+    cpu = (time.process_time() - cpu_start) / iterations * 1_000_000
+    return wall, cpu
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Compare inline and prebuilt statements, with and without "
+        "server-side prepared statements"
+    )
+    parser.add_argument("--iterations", type=int, default=2000)
+    args = parser.parse_args()
+    with Session(create_engine(str(settings.SQLALCHEMY_DATABASE_URI))) as session:
+        user = crud.get_user_by_email(session=session, email=settings.FIRST_SUPERUSER)
+        if not user:
+            raise RuntimeError("The first superuser doesn't exist, run prestart.sh")
+        session.expunge(user)
+    logger.info(f"{args.iterations} requests of 5 queries each, times per request")
+    print(f"{'statements':<10} {'prepared':<9} {'wall us':>9} {'client us':>10}")
+    for prepare_threshold in (None, 0):
+        engine = create_engine(
+            str(settings.SQLALCHEMY_DATABASE_URI),
+            pool_size=1,
+            connect_args={"prepare_threshold": prepare_threshold},
+        )
+        for name, run in (
+            ("inline", inline_statements),
+            ("prebuilt", prebuilt_statements),
+        ):
+            wall, cpu = measure(engine, user, run, args.iterations)
+            prepared = "no" if prepare_threshold is None else "yes"
+            print(f"{name:<10} {prepared:<9} {wall:>9.0f} {cpu:>10.0f}")
+        engine.dispose()
+    logger.info("Database side and network time is wall minus client time")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+import argparse
+import logging
+import statistics
+import time
+
+from passlib.hash import bcrypt
+
+from app.core.config import settings
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+min_rounds = 4
+max_rounds = 20
+
+
+def measure(rounds: int, samples: int) -> float:
+    """Median time in milliseconds to hash a password with the given cost."""
+    hasher = bcrypt.using(rounds=rounds)
+    timings = []
+    for _ in range(samples):
+        start = time.perf_counter()
+        hasher.hash("calibration-password")
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings)
+
+
+def calibrate(target_ms: float, samples: int) -> int:
+    """Highest work factor whose median hashing time fits in `target_ms`."""
+    best = min_rounds
+    for rounds in range(min_rounds, max_rounds + 1):
+        median_ms = measure(rounds, samples)
+        logger.info(f"rounds={rounds}: {median_ms:.1f} ms")
+        if median_ms > target_ms:
+            break
+        best = rounds
+    return best
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Pick BCRYPT_ROUNDS for the hardware this runs on"
+    )
+    parser.add_argument("--target-ms", type=float, default=settings.BCRYPT_TARGET_MS)
+    parser.add_argument("--samples", type=int, default=5)
+    args = parser.parse_args()
+    logger.info(f"Calibrating bcrypt for a p50 of {args.target_ms} ms")
+    rounds = calibrate(args.target_ms, args.samples)
+    logger.info(f"Current setting: BCRYPT_ROUNDS={settings.BCRYPT_ROUNDS}")
+    print(f"BCRYPT_ROUNDS={rounds}")
+
+
+if __name__ == "__main__":
+    main()
@@ -14,6 +14,9 @@ from pydantic_core import MultiHostUrl
 from pydantic_settings import BaseSettings, SettingsConfigDict
 from typing_extensions import Self
 
+# Threads AnyIO runs the sync routes and dependencies on
+request_threadpool_size = 40
+
 
 def parse_cors(v: Any) -> list[str] | str:
     if isinstance(v, str) and not v.startswith("["):
@@ -66,6 +69,73 @@ class Settings(BaseSettings):
             path=self.POSTGRES_DB,
         )
 
+    # Per worker process: size pool_size + max_overflow against max_connections
+    POSTGRES_POOL_SIZE: int = 5
+    POSTGRES_MAX_OVERFLOW: int = 10
+    POSTGRES_POOL_TIMEOUT: float = 30
+    # Seconds after which connections are replaced, -1 to keep them forever
+    POSTGRES_POOL_RECYCLE: int = -1
+    POSTGRES_POOL_PRE_PING: bool = False
+    POSTGRES_POOL_SLOW_CHECKOUT_MS: float = 100
+    # psycopg prepares a statement server side once a connection has run it
+    # this many times, 0 prepares on first use, unset to disable
+    POSTGRES_PREPARE_THRESHOLD: int | None = 5
+    # PgBouncer in transaction pooling mode in front of POSTGRES_SERVER, used
+    # by the request engines. Migrations and the LISTEN connection, that need
+    # a session of their own, keep connecting to Postgres directly
+    PGBOUNCER_SERVER: str | None = None
+    PGBOUNCER_PORT: int = 6432
+    # Set when PgBouncer (1.21+) tracks protocol-level prepared statements,
+    # with max_prepared_statements, they are disabled behind it otherwise
+    PGBOUNCER_PREPARED_STATEMENTS: bool = False
+
+    @computed_field  # type: ignore[misc]
+    @property
+    def SQLALCHEMY_POOLED_DATABASE_URI(self) -> PostgresDsn:
+        if not self.PGBOUNCER_SERVER:
+            return self.SQLALCHEMY_DATABASE_URI
+        return MultiHostUrl.build(  # type: ignore[return-value]
+            scheme="postgresql+psycopg",
+            username=self.POSTGRES_USER,
+            password=self.POSTGRES_PASSWORD,
+            host=self.PGBOUNCER_SERVER,
+            port=self.PGBOUNCER_PORT,
+            path=self.POSTGRES_DB,
+        )
+
+    @computed_field  # type: ignore[misc]
+    @property
+    def prepare_threshold(self) -> int | None:
+        if self.PGBOUNCER_SERVER and not self.PGBOUNCER_PREPARED_STATEMENTS:
+            return None
+        return self.POSTGRES_PREPARE_THRESHOLD
+
+    # Serve the login and items routes from the async stack (async engine and
+    # handlers) instead of the threadpool, the async engine has its own pool
+    ASYNC_ROUTES: bool = False
+
+    # Streaming replicas that serve the reads of GET requests, comma separated
+    # postgresql+psycopg:// URIs. Users that just wrote read from the primary
+    # until a replica replayed their commit, at most REPLICA_PIN_SECONDS
+    POSTGRES_REPLICA_URIS: Annotated[
+        list[PostgresDsn] | str, BeforeValidator(parse_cors)
+    ] = []
+    REPLICA_PIN_SECONDS: float = 5
+    REPLICA_HEALTH_CHECK_SECONDS: float = 5
+    # Bounds connecting to a replica and waiting for it to acknowledge what
+    # was sent, a replica whose check takes longer is treated as down
+    REPLICA_CONNECT_TIMEOUT_SECONDS: int = 2
+
+    # Upper bound for the limit parameter of paginated endpoints
+    MAX_PAGE_SIZE: int = 1000
+    # Default count of list endpoints: exact, estimated from the planner
+    # statistics, cached per owner, or none (clients rely on has_more)
+    LIST_COUNT_MODE: Literal["exact", "estimated", "cached", "none"] = "exact"
+    # Upper bound for the number of operations of a batch request
+    MAX_BATCH_SIZE: int = 1000
+    # Items deleted per transaction when purging a deleted user
+    USER_PURGE_BATCH_SIZE: int = 5000
+
     SMTP_TLS: bool = True
     SMTP_SSL: bool = False
     SMTP_PORT: int = 587
@@ -96,6 +166,42 @@ class Settings(BaseSettings):
     FIRST_SUPERUSER_PASSWORD: str
     USERS_OPEN_REGISTRATION: bool = False
 
+    # bcrypt runs on a dedicated pool, requests above workers + queue size get a 503.
+    # A sync route holds one of the request threadpool's threads (AnyIO's 40)
+    # while its hash waits, so workers + queue size must stay at most half of it
+    # or a login spike starves every other sync route
+    PASSWORD_HASHING_WORKERS: int = 2
+    PASSWORD_HASHING_QUEUE_SIZE: int = 6
+    # bcrypt work factor, pick it with `python -m app.calibrate_bcrypt`, hashes
+    # with a different cost are rehashed on the next successful login
+    BCRYPT_ROUNDS: int = 12
+    BCRYPT_TARGET_MS: int = 150
+
+    # Upper bound for how long a changed or deactivated user stays cached, 0 disables
+    PRINCIPAL_CACHE_TTL_SECONDS: int = 30
+    PRINCIPAL_CACHE_MAX_SIZE: int = 10_000
+    # Responses of the item GET routes, cached per owner and dropped by the
+    # writes that change them, a TTL of 0 disables. "postgres" shares them
+    # between the workers in an unlogged table, bounded by the TTL only
+    RESPONSE_CACHE_BACKEND: Literal["memory", "postgres"] = "memory"
+    RESPONSE_CACHE_TTL_SECONDS: int = 30
+    RESPONSE_CACHE_MAX_BYTES: int = 64 * 1024 * 1024
+    RESPONSE_CACHE_MAX_ENTRY_BYTES: int = 1024 * 1024
+    # Embed is_active / is_superuser in access tokens so routes that only need
+    # the principal, like the item routes, can skip the database. Revocation
+    # goes through token versions
+    ACCESS_TOKEN_CLAIMS: bool = False
+    TOKEN_REVOCATION_REFRESH_SECONDS: int = 30
+
+    # Failed logins per client IP / per email before locking, one attempt is
+    # regained every LOGIN_THROTTLE_REFILL_SECONDS, lockouts double each time
+    LOGIN_THROTTLE_BACKEND: Literal["memory", "postgres"] = "memory"
+    LOGIN_THROTTLE_IP_CAPACITY: int = 100
+    LOGIN_THROTTLE_EMAIL_CAPACITY: int = 10
+    LOGIN_THROTTLE_REFILL_SECONDS: float = 60
+    LOGIN_THROTTLE_LOCKOUT_SECONDS: float = 60
+    LOGIN_THROTTLE_MAX_LOCKOUT_SECONDS: float = 60 * 60
+
     def _check_default_secret(self, var_name: str, value: str | None) -> None:
         if value == "changethis":
             message = (
@@ -107,6 +213,16 @@ class Settings(BaseSettings):
             else:
                 raise ValueError(message)
 
+    @model_validator(mode="after")
+    def _check_password_hashing_limit(self) -> Self:
+        limit = self.PASSWORD_HASHING_WORKERS + self.PASSWORD_HASHING_QUEUE_SIZE
+        if limit > request_threadpool_size // 2:
+            raise ValueError(
+                "PASSWORD_HASHING_WORKERS + PASSWORD_HASHING_QUEUE_SIZE must be at "
+                f"most {request_threadpool_size // 2}, half of the request threadpool"
+            )
+        return self
+
     @model_validator(mode="after")
     def _enforce_non_default_secrets(self) -> Self:
         self._check_default_secret("SECRET_KEY", self.SECRET_KEY)
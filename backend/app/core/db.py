@@ -1,10 +1,57 @@
-from sqlmodel import Session, create_engine, select
+from typing import Any
+
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlmodel import Session, create_engine
 
 from app import crud
 from app.core.config import settings
-from app.models import User, UserCreate
+from app.core.pool import InstrumentedAsyncQueuePool, InstrumentedQueuePool
+from app.core.replicas import Replica, ReplicaSet
+from app.models import UserCreate
+
+engine_options: dict[str, Any] = {
+    "pool_size": settings.POSTGRES_POOL_SIZE,
+    "max_overflow": settings.POSTGRES_MAX_OVERFLOW,
+    "pool_timeout": settings.POSTGRES_POOL_TIMEOUT,
+    "pool_recycle": settings.POSTGRES_POOL_RECYCLE,
+    "pool_pre_ping": settings.POSTGRES_POOL_PRE_PING,
+    "connect_args": {"prepare_threshold": settings.prepare_threshold},
+}
 
-engine = create_engine(str(settings.SQLALCHEMY_DATABASE_URI))
+engine = create_engine(
+    str(settings.SQLALCHEMY_POOLED_DATABASE_URI),
+    poolclass=InstrumentedQueuePool,
+    **engine_options,
+)
+replica_connect_args = {
+    **engine_options["connect_args"],
+    "connect_timeout": settings.REPLICA_CONNECT_TIMEOUT_SECONDS,
+    "tcp_user_timeout": settings.REPLICA_CONNECT_TIMEOUT_SECONDS * 1000,
+}
+replica_set = ReplicaSet(
+    [
+        Replica(
+            create_engine(
+                str(uri),
+                poolclass=InstrumentedQueuePool,
+                **{**engine_options, "connect_args": replica_connect_args},
+            ),
+            check_seconds=settings.REPLICA_HEALTH_CHECK_SECONDS,
+            check_timeout=settings.REPLICA_CONNECT_TIMEOUT_SECONDS,
+        )
+        for uri in settings.POSTGRES_REPLICA_URIS
+    ]
+)
+# Used by the async routes, psycopg picks its async driver for this engine
+async_engine = create_async_engine(
+    str(settings.SQLALCHEMY_POOLED_DATABASE_URI),
+    poolclass=InstrumentedAsyncQueuePool,
+    **engine_options,
+)
+# For GET requests: psycopg starts their transactions READ ONLY, without
+# another round trip, and the pool resets that when connections come back
+read_only_engine = engine.execution_options(postgresql_readonly=True)
+async_read_only_engine = async_engine.execution_options(postgresql_readonly=True)
 
 
 # make sure all SQLModel models are imported (app.models) before initializing DB
@@ -22,9 +69,7 @@ def init_db(session: Session) -> None:
     # This works because the models are already imported and registered from app.models
     # SQLModel.metadata.create_all(engine)
 
-    user = session.exec(
-        select(User).where(User.email == settings.FIRST_SUPERUSER)
-    ).first()
+    user = crud.get_user_by_email(session=session, email=settings.FIRST_SUPERUSER)
     if not user:
         user_in = UserCreate(
             email=settings.FIRST_SUPERUSER,
@@ -0,0 +1,144 @@
+import asyncio
+import logging
+import threading
+import time
+from collections.abc import Callable
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, TypeVar
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+class HashingPoolFullError(Exception):
+    """Raised when the password hashing queue is full."""
+
+
+@dataclass(frozen=True)
+class HashingPoolStats:
+    workers: int
+    max_queue: int
+    # Jobs currently running plus jobs waiting for a worker
+    in_flight: int
+    queued: int
+    completed: int
+    rejected: int
+    avg_hash_ms: float
+    max_hash_ms: float
+    last_hash_ms: float
+    avg_wait_ms: float
+
+
+class PasswordHashingPool:
+    """
+    Run bcrypt work on a dedicated, bounded pool of threads.
+
+    bcrypt releases the GIL while hashing, so a small thread pool is enough to
+    keep the CPU cost of logins off the request threadpool. At most
+    `max_workers + max_queue` jobs are accepted at a time, anything above that
+    fails fast with `HashingPoolFullError` instead of piling up requests.
+    `run` blocks its caller, a request thread, until the hash is done, which
+    is why that limit is kept below half of the request threadpool.
+    """
+
+    def __init__(self, *, max_workers: int, max_queue: int) -> None:
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="password-hashing"
+        )
+        self._slots = threading.BoundedSemaphore(max_workers + max_queue)
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._running = 0
+        self._completed = 0
+        self._rejected = 0
+        self._total_hash_seconds = 0.0
+        self._total_wait_seconds = 0.0
+        self._max_hash_seconds = 0.0
+        self._last_hash_seconds = 0.0
+
+    def run(self, fn: Callable[..., T], *args: Any) -> T:
+        self._acquire()
+        submitted_at = time.perf_counter()
+        try:
+            future = self._executor.submit(self._timed, submitted_at, fn, *args)
+            return future.result()
+        finally:
+            self._release()
+
+    async def run_async(self, fn: Callable[..., T], *args: Any) -> T:
+        """Like `run`, but awaits the result instead of blocking the thread."""
+        self._acquire()
+        submitted_at = time.perf_counter()
+        try:
+            future = self._executor.submit(self._timed, submitted_at, fn, *args)
+            return await asyncio.wrap_future(future)
+        finally:
+            self._release()
+
+    def _acquire(self) -> None:
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self._rejected += 1
+            logger.warning(
+                "Password hashing queue is full (%s jobs in flight)", self._in_flight
+            )
+            raise HashingPoolFullError("Password hashing queue is full")
+        with self._lock:
+            self._in_flight += 1
+
+    def _release(self) -> None:
+        with self._lock:
+            self._in_flight -= 1
+        self._slots.release()
+
+    def _timed(self, submitted_at: float, fn: Callable[..., T], *args: Any) -> T:
+        started_at = time.perf_counter()
+        with self._lock:
+            self._running += 1
+        try:
+            return fn(*args)
+        finally:
+            elapsed = time.perf_counter() - started_at
+            with self._lock:
+                self._running -= 1
+                self._completed += 1
+                self._total_hash_seconds += elapsed
+                self._total_wait_seconds += started_at - submitted_at
+                self._max_hash_seconds = max(self._max_hash_seconds, elapsed)
+                self._last_hash_seconds = elapsed
+            logger.debug("Password hash took %.1f ms", elapsed * 1000)
+
+    def stats(self) -> HashingPoolStats:
+        with self._lock:
+            completed = self._completed
+            return HashingPoolStats(
+                workers=self.max_workers,
+                max_queue=self.max_queue,
+                in_flight=self._in_flight,
+                queued=self._in_flight - self._running,
+                completed=completed,
+                rejected=self._rejected,
+                avg_hash_ms=(
+                    self._total_hash_seconds / completed * 1000 if completed else 0.0
+                ),
+                max_hash_ms=self._max_hash_seconds * 1000,
+                last_hash_ms=self._last_hash_seconds * 1000,
+                avg_wait_ms=(
+                    self._total_wait_seconds / completed * 1000 if completed else 0.0
+                ),
+            )
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=True)
+
+
+hashing_pool = PasswordHashingPool(
+    max_workers=settings.PASSWORD_HASHING_WORKERS,
+    max_queue=settings.PASSWORD_HASHING_QUEUE_SIZE,
+)
@@ -0,0 +1,108 @@
+import logging
+import select
+import threading
+from collections.abc import Callable
+
+import psycopg
+from psycopg import sql
+from sqlmodel import Session, func
+from sqlmodel import select as sql_select
+from sqlmodel.sql.expression import SelectOfScalar
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+poll_seconds = 1.0
+retry_seconds = 5.0
+
+
+def notify_statement(channel: str, payload: str) -> SelectOfScalar[None]:
+    return sql_select(func.pg_notify(channel, payload))
+
+
+def notify(session: Session, channel: str, payload: str) -> None:
+    """
+    Queue a Postgres NOTIFY in the session's transaction.
+
+    Postgres only delivers it once the transaction commits, so listeners in
+    other workers never see changes that were rolled back.
+    """
+    session.exec(notify_statement(channel, payload))
+
+
+class PostgresListener:
+    """
+    Background thread that LISTENs on Postgres channels for this worker.
+
+    Handlers are called from the listener thread with the notification
+    payload. Reconnect handlers are called every time the connection is
+    (re)established, as notifications sent while disconnected are lost.
+    """
+
+    def __init__(self) -> None:
+        self._handlers: dict[str, list[Callable[[str], None]]] = {}
+        self._reconnect_handlers: list[Callable[[], None]] = []
+        self._stop_event = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def subscribe(self, channel: str, handler: Callable[[str], None]) -> None:
+        self._handlers.setdefault(channel, []).append(handler)
+
+    def on_reconnect(self, handler: Callable[[], None]) -> None:
+        self._reconnect_handlers.append(handler)
+
+    def start(self) -> None:
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(
+            target=self._run, name="postgres-listener", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join(timeout=poll_seconds * 2)
+            self._thread = None
+
+    def _dispatch(self, notification: psycopg.Notify) -> None:
+        for handler in self._handlers.get(notification.channel, []):
+            try:
+                handler(notification.payload)
+            except Exception:
+                logger.exception(
+                    "Error handling notification on %s", notification.channel
+                )
+
+    def _run(self) -> None:
+        while not self._stop_event.is_set():
+            try:
+                self._listen()
+            except psycopg.Error as e:
+                logger.warning("Postgres listener disconnected: %s", e)
+                self._stop_event.wait(retry_seconds)
+
+    def _listen(self) -> None:
+        with psycopg.connect(
+            host=settings.POSTGRES_SERVER,
+            port=settings.POSTGRES_PORT,
+            user=settings.POSTGRES_USER,
+            password=settings.POSTGRES_PASSWORD,
+            dbname=settings.POSTGRES_DB,
+            autocommit=True,
+        ) as conn:
+            conn.add_notify_handler(self._dispatch)
+            for channel in self._handlers:
+                conn.execute(sql.SQL("LISTEN {}").format(sql.Identifier(channel)))
+            for handler in self._reconnect_handlers:
+                handler()
+            while not self._stop_event.is_set():
+                ready, _, _ = select.select([conn.fileno()], [], [], poll_seconds)
+                if ready:
+                    # Any round trip makes psycopg dispatch pending notifications
+                    conn.execute("SELECT 1")
+
+
+listener = PostgresListener()
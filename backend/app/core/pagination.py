@@ -0,0 +1,95 @@
+import base64
+import binascii
+import json
+from collections.abc import Sequence
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Protocol, TypeVar
+
+
+class InvalidCursorError(ValueError):
+    """Raised when a pagination cursor can't be decoded."""
+
+
+class HasId(Protocol):
+    id: int | None
+
+
+T = TypeVar("T", bound=HasId)
+
+
+def encode_cursor(values: list[Any]) -> str:
+    """Encode the sort keys of a row, datetimes as ISO 8601 strings."""
+    data = json.dumps(values, separators=(",", ":"), default=_encode_key).encode()
+    return base64.urlsafe_b64encode(data).decode().rstrip("=")
+
+
+def _encode_key(value: Any) -> str:
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"Can't encode {type(value).__name__} in a cursor")
+
+
+def decode_cursor(cursor: str) -> list[Any]:
+    try:
+        data = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        values = json.loads(data)
+    except (binascii.Error, ValueError):
+        raise InvalidCursorError(cursor)
+    if not isinstance(values, list):
+        raise InvalidCursorError(cursor)
+    return values
+
+
+@dataclass(frozen=True)
+class Page:
+    """
+    A page of rows ordered by id: the `limit` rows after id `after` when
+    paginating with cursors, or after skipping `skip` rows with offsets.
+    Rows ordered by another key, then id, have the value of that `key` in
+    their cursors too.
+    """
+
+    limit: int
+    after: int = 0
+    skip: int = 0
+    key: Any = None
+
+    @classmethod
+    def from_params(
+        cls, *, cursor: str | None, skip: int, limit: int, max_limit: int
+    ) -> "Page":
+        limit = max(1, min(limit, max_limit))
+        if cursor is None:
+            return cls(limit=limit, skip=max(skip, 0))
+        values = decode_cursor(cursor)
+        *key, after = values or [None]
+        if not isinstance(after, int) or len(key) > 1:
+            raise InvalidCursorError(cursor)
+        if not key:
+            return cls(limit=limit, after=after)
+        if not isinstance(key[0], str | int | float) or isinstance(key[0], bool):
+            raise InvalidCursorError(cursor)
+        return cls(limit=limit, after=after, key=key[0])
+
+    @property
+    def params(self) -> dict[str, int]:
+        """Bound parameters of the page statements, with one extra row."""
+        return {"after": self.after, "skip": self.skip, "limit": self.limit + 1}
+
+    def rows(self, rows: Sequence[T]) -> tuple[Sequence[T], str | None]:
+        """The rows of this page and the cursor of the next one, if any."""
+        if len(rows) <= self.limit:
+            return rows, None
+        rows = rows[: self.limit]
+        return rows, encode_cursor([rows[-1].id])
+
+    def keyed_rows(
+        self, rows: Sequence[tuple[T, Any]]
+    ) -> tuple[Sequence[T], str | None]:
+        """Same as rows, for rows along with the key they are ordered by."""
+        items = [item for item, _ in rows[: self.limit]]
+        if len(rows) <= self.limit:
+            return items, None
+        item, key = rows[self.limit - 1]
+        return items, encode_cursor([key, item.id])
@@ -0,0 +1,84 @@
+import logging
+import os
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any
+
+from sqlalchemy.exc import TimeoutError
+from sqlalchemy.pool import AsyncAdaptedQueuePool, ConnectionPoolEntry, QueuePool
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class PoolStats:
+    pid: int
+    size: int
+    checked_in: int
+    checked_out: int
+    overflow: int
+    checkouts: int
+    timeouts: int
+    avg_wait_ms: float
+    max_wait_ms: float
+
+
+class InstrumentedQueuePool(QueuePool):
+    """
+    QueuePool that measures how long each checkout waits for a connection.
+
+    Checkouts slower than POSTGRES_POOL_SLOW_CHECKOUT_MS and checkout
+    timeouts are logged with the pool occupancy at that moment.
+    """
+
+    def __init__(self, *args: Any, **kwargs: Any) -> None:
+        super().__init__(*args, **kwargs)
+        self._stats_lock = threading.Lock()
+        self._checkouts = 0
+        self._timeouts = 0
+        self._total_wait = 0.0
+        self._max_wait = 0.0
+
+    def _do_get(self) -> ConnectionPoolEntry:
+        start = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except TimeoutError:
+            with self._stats_lock:
+                self._timeouts += 1
+            logger.warning("Connection pool checkout timed out: %s", self.status())
+            raise
+        wait = time.perf_counter() - start
+        with self._stats_lock:
+            self._checkouts += 1
+            self._total_wait += wait
+            self._max_wait = max(self._max_wait, wait)
+        if wait * 1000 > settings.POSTGRES_POOL_SLOW_CHECKOUT_MS:
+            logger.warning(
+                "Connection pool checkout waited %.1f ms: %s",
+                wait * 1000,
+                self.status(),
+            )
+        return connection
+
+    def stats(self) -> PoolStats:
+        with self._stats_lock:
+            checkouts = self._checkouts
+            return PoolStats(
+                pid=os.getpid(),
+                size=self.size(),
+                checked_in=self.checkedin(),
+                checked_out=self.checkedout(),
+                overflow=max(self.overflow(), 0),
+                checkouts=checkouts,
+                timeouts=self._timeouts,
+                avg_wait_ms=self._total_wait / checkouts * 1000 if checkouts else 0.0,
+                max_wait_ms=self._max_wait * 1000,
+            )
+
+
+class InstrumentedAsyncQueuePool(InstrumentedQueuePool, AsyncAdaptedQueuePool):
+    """InstrumentedQueuePool for async engines."""
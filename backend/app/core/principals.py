@@ -0,0 +1,267 @@
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import Iterable
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import Executable, delete, event
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session as SyncSession
+from sqlmodel import Session, col, func, select
+from sqlmodel.ext.asyncio.session import AsyncSession
+from sqlmodel.sql.expression import Select
+
+from app.core.config import settings
+from app.core.notifications import listener, notify, notify_statement
+from app.models import TokenRevocation, User
+
+PRINCIPAL_CHANNEL = "principal_invalidation"
+# Refreshes load the revocations stored since the previous one minus this, so
+# they also see those of transactions that were still running
+revocation_commit_margin = timedelta(minutes=5)
+# Session.info key of the token versions to apply once the session commits
+pending_versions_key = "pending_token_versions"
+
+
+@dataclass(frozen=True)
+class Principal:
+    """Slim, immutable snapshot of the authenticated user."""
+
+    id: int
+    email: str
+    is_active: bool
+    is_superuser: bool
+    token_version: int = 0
+
+    @classmethod
+    def from_user(cls, user: User) -> "Principal":
+        assert user.id is not None
+        return cls(
+            id=user.id,
+            email=user.email,
+            is_active=user.is_active,
+            is_superuser=user.is_superuser,
+            token_version=user.token_version,
+        )
+
+
+class PrincipalCache:
+    """
+    Per-process TTL + LRU cache of principals keyed by user id.
+
+    Entries are evicted when a user changes (in this worker directly, in the
+    others through Postgres NOTIFY), the TTL bounds staleness if a
+    notification is ever missed. A TTL of 0 disables the cache.
+    """
+
+    def __init__(self, *, ttl_seconds: float, max_size: int) -> None:
+        self.ttl_seconds = ttl_seconds
+        self.max_size = max_size
+        self._entries: OrderedDict[int, tuple[float, Principal]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, user_id: int) -> Principal | None:
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None:
+                return None
+            expires_at, principal = entry
+            if expires_at < time.monotonic():
+                del self._entries[user_id]
+                return None
+            self._entries.move_to_end(user_id)
+            return principal
+
+    def put(self, principal: Principal) -> None:
+        if self.ttl_seconds <= 0:
+            return
+        with self._lock:
+            self._entries[principal.id] = (
+                time.monotonic() + self.ttl_seconds,
+                principal,
+            )
+            self._entries.move_to_end(principal.id)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def evict(self, user_id: int) -> None:
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+class TokenVersions:
+    """
+    Per-process copy of the token versions revoked within the last token
+    lifetime, used to validate claims-carrying tokens without a query.
+
+    Revocations are stored in the `tokenrevocation` table, which keeps them
+    after the user is deleted. The first refresh loads those of the last
+    `lifetime_seconds`, the next ones (every `refresh_seconds`) only those
+    since the previous refresh, and NOTIFY messages patch the copy in
+    between. A revocation older than the token lifetime is dropped, every
+    token it revoked has expired.
+    """
+
+    def __init__(self, *, refresh_seconds: float, lifetime_seconds: float) -> None:
+        self.refresh_seconds = refresh_seconds
+        self.lifetime_seconds = lifetime_seconds
+        self._versions: dict[int, tuple[int, datetime]] = {}
+        self._loaded_at: datetime | None = None
+        self._refreshed_at = float("-inf")
+        self._lock = threading.Lock()
+
+    def is_revoked(self, user_id: int, token_version: int) -> bool:
+        with self._lock:
+            entry = self._versions.get(user_id)
+            return entry is not None and token_version < entry[0]
+
+    def needs_refresh(self) -> bool:
+        return time.monotonic() - self._refreshed_at > self.refresh_seconds
+
+    def refresh(self, session: Session) -> None:
+        loaded_at = datetime.now(timezone.utc)
+        self.load(session.exec(self._refresh_statement()).all(), loaded_at)
+
+    async def refresh_async(self, session: AsyncSession) -> None:
+        loaded_at = datetime.now(timezone.utc)
+        rows = await session.exec(self._refresh_statement())
+        self.load(rows.all(), loaded_at)
+
+    def _refresh_statement(self) -> Select[tuple[int, int, datetime]]:
+        if self._loaded_at is None:
+            since = datetime.now(timezone.utc) - timedelta(
+                seconds=self.lifetime_seconds
+            )
+        else:
+            since = self._loaded_at - revocation_commit_margin
+        return select(
+            TokenRevocation.user_id,
+            TokenRevocation.token_version,
+            TokenRevocation.revoked_at,
+        ).where(col(TokenRevocation.revoked_at) > since)
+
+    def load(
+        self, rows: Iterable[tuple[int, int, datetime]], loaded_at: datetime
+    ) -> None:
+        expired_at = loaded_at - timedelta(seconds=self.lifetime_seconds)
+        with self._lock:
+            for user_id, token_version, revoked_at in rows:
+                self._add(user_id, token_version, revoked_at)
+            self._versions = {
+                user_id: entry
+                for user_id, entry in self._versions.items()
+                if entry[1] > expired_at
+            }
+            self._loaded_at = loaded_at
+            self._refreshed_at = time.monotonic()
+
+    def update(self, user_id: int, token_version: int) -> None:
+        with self._lock:
+            self._add(user_id, token_version, datetime.now(timezone.utc))
+
+    def _add(self, user_id: int, token_version: int, revoked_at: datetime) -> None:
+        if token_version > self._versions.get(user_id, (0, revoked_at))[0]:
+            self._versions[user_id] = (token_version, revoked_at)
+
+    def expire(self) -> None:
+        with self._lock:
+            self._refreshed_at = float("-inf")
+
+
+def revocation_statements(user: User) -> list[Executable]:
+    """
+    Statements storing the revocation of the tokens of `user` up to their
+    current token version, and deleting the revocations of expired tokens.
+    """
+    upsert = insert(TokenRevocation).values(
+        user_id=user.id, token_version=user.token_version
+    )
+    upsert = upsert.on_conflict_do_update(
+        index_elements=[col(TokenRevocation.user_id)],
+        set_={"token_version": upsert.excluded.token_version, "revoked_at": func.now()},
+        where=col(TokenRevocation.token_version) < upsert.excluded.token_version,
+    )
+    expired = delete(TokenRevocation).where(
+        col(TokenRevocation.revoked_at)
+        < func.now() - timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
+    )
+    return [upsert, expired]
+
+
+principal_cache = PrincipalCache(
+    ttl_seconds=settings.PRINCIPAL_CACHE_TTL_SECONDS,
+    max_size=settings.PRINCIPAL_CACHE_MAX_SIZE,
+)
+token_versions = TokenVersions(
+    refresh_seconds=settings.TOKEN_REVOCATION_REFRESH_SECONDS,
+    lifetime_seconds=settings.ACCESS_TOKEN_EXPIRE_MINUTES * 60,
+)
+
+
+def invalidate_principal(session: Session, user: User, revoked: bool = False) -> None:
+    """
+    Evict a user from the principal cache of every worker.
+
+    Call it before committing the change: the local entry is dropped right
+    away and the NOTIFY reaches all workers (this one included) on commit.
+    The payload also carries the user's token version, so revocations reach
+    the token version copies without waiting for their refresh. This
+    worker's copy takes it on commit too, a rolled back revocation doesn't
+    reject valid tokens. Pass `revoked` when the change bumped the token
+    version, to store it.
+    """
+    if user.id is None:
+        return
+    payload = f"{user.id}:{user.token_version}"
+    principal_cache.evict(user.id)
+    session.info.setdefault(pending_versions_key, []).append(payload)
+    if revoked:
+        for statement in revocation_statements(user):
+            session.execute(statement)
+    notify(session, PRINCIPAL_CHANNEL, payload)
+
+
+async def invalidate_principal_async(
+    session: AsyncSession, user: User, revoked: bool = False
+) -> None:
+    if user.id is None:
+        return
+    payload = f"{user.id}:{user.token_version}"
+    principal_cache.evict(user.id)
+    session.info.setdefault(pending_versions_key, []).append(payload)
+    if revoked:
+        for statement in revocation_statements(user):
+            await session.execute(statement)
+    await session.exec(notify_statement(PRINCIPAL_CHANNEL, payload))
+
+
+def _apply_invalidation(payload: str) -> None:
+    user_id, token_version = payload.split(":")
+    principal_cache.evict(int(user_id))
+    token_versions.update(int(user_id), int(token_version))
+
+
+def _apply_committed(session: SyncSession) -> None:
+    for payload in session.info.pop(pending_versions_key, ()):
+        _apply_invalidation(payload)
+
+
+def _drop_rolled_back(session: SyncSession) -> None:
+    session.info.pop(pending_versions_key, None)
+
+
+def _reset() -> None:
+    principal_cache.clear()
+    token_versions.expire()
+
+
+listener.subscribe(PRINCIPAL_CHANNEL, _apply_invalidation)
+# Async sessions included, they run on a sync Session
+event.listen(SyncSession, "after_commit", _apply_committed)
+event.listen(SyncSession, "after_rollback", _drop_rolled_back)
+listener.on_reconnect(_reset)
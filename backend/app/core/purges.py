@@ -0,0 +1,92 @@
+import logging
+from collections.abc import Callable
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, TypeVar
+
+from sqlalchemy import NullPool, create_engine, func, select
+from sqlmodel import Session
+
+from app import crud
+from app.core.config import settings
+from app.core.db import engine
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# Advisory lock held by the worker resuming the purges
+resume_lock_key = 8_105_017
+
+
+def purge_user(user_id: int) -> int:
+    with Session(engine) as session:
+        return crud.purge_user(
+            session=session,
+            user_id=user_id,
+            batch_size=settings.USER_PURGE_BATCH_SIZE,
+        )
+
+
+def purge_pending_users() -> None:
+    """Finish the deletions that were interrupted, e.g. by a restart."""
+    with Session(engine) as session:
+        user_ids = session.scalars(crud.pending_deletion_users_statement).all()
+    logger.info(f"Purging {len(user_ids)} users pending deletion")
+    for user_id in user_ids:
+        purge_user(user_id)
+
+
+class UserPurger:
+    """
+    Purge deleted users one at a time on a dedicated thread, so purges never
+    hold a thread of the request threadpool.
+
+    `start` also resumes the purges a restart interrupted. Every worker
+    starts one, the one that gets a Postgres advisory lock resumes them and
+    the others skip it. The lock is taken on a direct connection, as
+    PgBouncer in transaction pooling mode doesn't keep session locks.
+    """
+
+    def __init__(self) -> None:
+        self._executor: ThreadPoolExecutor | None = None
+
+    def start(self) -> "Future[None]":
+        self._executor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="user-purge"
+        )
+        return self._executor.submit(self._logged, self._resume)
+
+    def submit(self, user_id: int) -> "Future[int]":
+        if self._executor is None:
+            raise RuntimeError("The user purger is not started")
+        return self._executor.submit(self._logged, purge_user, user_id)
+
+    def _resume(self) -> None:
+        lock_engine = create_engine(
+            str(settings.SQLALCHEMY_DATABASE_URI), poolclass=NullPool
+        )
+        # Outside a transaction, the lock is held until the connection closes
+        with lock_engine.connect().execution_options(
+            isolation_level="AUTOCOMMIT"
+        ) as conn:
+            locked = conn.execute(select(func.pg_try_advisory_lock(resume_lock_key)))
+            if not locked.scalar():
+                logger.info("Another worker is resuming the user purges")
+                return
+            purge_pending_users()
+
+    def _logged(self, fn: Callable[..., T], *args: Any) -> T:
+        try:
+            return fn(*args)
+        except Exception:
+            logger.exception("User purge failed, it resumes on the next startup")
+            raise
+
+    def stop(self) -> None:
+        # The running purge finishes its user, the queued ones resume on startup
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+user_purger = UserPurger()
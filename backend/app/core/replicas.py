@@ -0,0 +1,200 @@
+import itertools
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Any
+
+from sqlalchemy import Connection, Engine, event, text
+from sqlalchemy.engine import ExceptionContext
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.sql.dml import UpdateBase
+from sqlmodel import Session
+
+from app.core.config import settings
+from app.core.notifications import listener
+
+logger = logging.getLogger(__name__)
+
+REPLICA_PIN_CHANNEL = "replica_pin"
+
+# On the primary itself (e.g. in development) this is its current position
+replay_lsn_statement = text(
+    "SELECT (CASE WHEN pg_is_in_recovery() THEN pg_last_wal_replay_lsn() "
+    "ELSE pg_current_wal_lsn() END)::text"
+)
+# Position of the commit that just happened, broadcast to every worker
+pin_statement = text(
+    "SELECT pg_current_wal_lsn()::text, "
+    "pg_notify(:channel, :prefix || pg_current_wal_lsn()::text)"
+)
+
+
+def parse_lsn(lsn: str) -> int:
+    high, low = lsn.split("/")
+    return (int(high, 16) << 32) + int(low, 16)
+
+
+class Replica:
+    """
+    A replica engine and the outcome of its last health check.
+
+    The check runs at most every `check_seconds`, from whichever request
+    needs it, and records how far the replica has replayed the WAL.
+    Disconnections seen by regular queries mark the replica down until the
+    next check, and so does a check still running `check_timeout` after it
+    was due: the replica may have stopped answering.
+    """
+
+    def __init__(
+        self, engine: Engine, *, check_seconds: float, check_timeout: float = 0
+    ) -> None:
+        self.engine = engine
+        self.check_seconds = check_seconds
+        self.check_timeout = check_timeout
+        self.healthy = False
+        self.replay_lsn = 0
+        self._checked_at = float("-inf")
+        self._lock = threading.Lock()
+        event.listen(engine, "handle_error", self._on_error)
+
+    def check(self) -> None:
+        if time.monotonic() - self._checked_at < self.check_seconds:
+            return
+        # Another thread is already checking, go with what we know
+        if not self._lock.acquire(blocking=False):
+            return
+        try:
+            try:
+                with self.engine.connect() as conn:
+                    lsn = conn.execute(replay_lsn_statement).scalar()
+            except DBAPIError as e:
+                if self.healthy:
+                    logger.warning("Replica %s is down: %s", self.engine.url, e)
+                self.healthy = False
+            else:
+                self.replay_lsn = parse_lsn(lsn) if lsn else 0
+                self.healthy = True
+            self._checked_at = time.monotonic()
+        finally:
+            self._lock.release()
+
+    def is_healthy(self) -> bool:
+        """Healthy at the last check, unless the next one is overdue."""
+        age = time.monotonic() - self._checked_at
+        return self.healthy and age < self.check_seconds + self.check_timeout
+
+    def _on_error(self, context: ExceptionContext) -> None:
+        if context.is_disconnect:
+            self.healthy = False
+            self._checked_at = time.monotonic()
+
+
+class ReplicaSet:
+    """Round-robin over the healthy replicas."""
+
+    def __init__(self, replicas: list[Replica]) -> None:
+        self.replicas = replicas
+        self._counter = itertools.count()
+
+    def pick(self, min_lsn: int = 0) -> Engine | None:
+        """A healthy replica that replayed `min_lsn`, None to use the primary."""
+        if not self.replicas:
+            return None
+        start = next(self._counter)
+        for i in range(len(self.replicas)):
+            replica = self.replicas[(start + i) % len(self.replicas)]
+            replica.check()
+            if replica.is_healthy() and replica.replay_lsn >= min_lsn:
+                return replica.engine
+        return None
+
+
+class ReplicaPins:
+    """
+    Commit LSN of the users that wrote in the last `pin_seconds`.
+
+    Their reads go to the primary unless a replica replayed that LSN.
+    """
+
+    def __init__(self, *, pin_seconds: float) -> None:
+        self.pin_seconds = pin_seconds
+        self._pins: OrderedDict[int, tuple[float, int]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def pin(self, user_id: int, lsn: int) -> None:
+        now = time.monotonic()
+        with self._lock:
+            _, pinned_lsn = self._pins.pop(user_id, (0.0, 0))
+            self._pins[user_id] = (now + self.pin_seconds, max(lsn, pinned_lsn))
+            # Entries are in expiry order
+            while self._pins:
+                expires_at, _ = next(iter(self._pins.values()))
+                if expires_at > now:
+                    break
+                self._pins.popitem(last=False)
+
+    def min_lsn(self, user_id: int | None) -> int:
+        if user_id is None:
+            return 0
+        with self._lock:
+            expires_at, lsn = self._pins.get(user_id, (0.0, 0))
+        return lsn if expires_at > time.monotonic() else 0
+
+
+replica_pins = ReplicaPins(pin_seconds=settings.REPLICA_PIN_SECONDS)
+
+
+class RoutingSession(Session):
+    """
+    Session that runs its reads on `replica` until it writes, everything from
+    the first write on goes to the primary.
+
+    When `user_id` is set, committing a write pins that user to the primary
+    in every worker until the replicas catch up with the commit.
+    """
+
+    def __init__(
+        self,
+        bind: Engine,
+        *,
+        replica: Engine | None = None,
+        user_id: int | None = None,
+        **kwargs: Any,
+    ) -> None:
+        super().__init__(bind, **kwargs)
+        self.primary = bind
+        self.replica = replica
+        self.user_id = user_id
+        self.wrote = False
+        self._unpinned_write = False
+
+    def get_bind(
+        self, mapper: Any = None, *, clause: Any = None, **kw: Any
+    ) -> Engine | Connection:
+        if self._flushing or isinstance(clause, UpdateBase):
+            self.wrote = True
+            self._unpinned_write = True
+        elif self.replica is not None and not self.wrote:
+            return self.replica
+        return super().get_bind(mapper, clause=clause, **kw)
+
+    def commit(self) -> None:
+        super().commit()
+        if self._unpinned_write and self.user_id is not None:
+            self._unpinned_write = False
+            with self.primary.connect() as conn:
+                lsn = conn.execute(
+                    pin_statement,
+                    {"channel": REPLICA_PIN_CHANNEL, "prefix": f"{self.user_id}:"},
+                ).scalar_one()
+                conn.commit()
+            replica_pins.pin(self.user_id, parse_lsn(lsn))
+
+
+def _apply_pin(payload: str) -> None:
+    user_id, lsn = payload.split(":")
+    replica_pins.pin(int(user_id), parse_lsn(lsn))
+
+
+listener.subscribe(REPLICA_PIN_CHANNEL, _apply_pin)
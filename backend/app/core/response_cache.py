@@ -0,0 +1,512 @@
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import Collection, Iterable
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime
+from typing import Protocol
+
+from sqlalchemy import BigInteger, Engine, Executable, Text, cast, delete, text
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.exc import OperationalError
+from sqlmodel import Session, col, create_engine, func, select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from app.core.config import settings
+from app.core.notifications import listener, notify_statement
+from app.models import ResponseCacheEntry, ResponseCacheTag
+
+logger = logging.getLogger(__name__)
+
+RESPONSE_CACHE_CHANNEL = "response_cache_invalidation"
+# Postgres rejects NOTIFY payloads of 8000 bytes or more, larger
+# invalidations clear the whole cache instead
+max_payload_size = 7000
+# Tag of every entry
+all_tags = "*"
+# Tags share this many invalidation counters in the memory backend, two tags
+# of the same slot only make a put skip needlessly
+generation_slots = 1024
+# Longer than any read: a tag invalidated before is as good as never
+# invalidated, the postgres backend deletes its row
+tag_retention = timedelta(hours=1)
+# SQLSTATE of the transaction Postgres aborts to break a deadlock
+deadlock_detected = "40P01"
+
+
+@dataclass(frozen=True)
+class CachedResponse:
+    """Serialized JSON body of a response, with its validators."""
+
+    body: bytes
+    etag: str | None = None
+    last_modified: datetime | None = None
+    # Owner of the item of a single item response, checked on every hit
+    owner_id: int | None = None
+
+    @property
+    def headers(self) -> dict[str, str]:
+        headers = {}
+        if self.etag:
+            headers["ETag"] = self.etag
+        if self.last_modified:
+            headers["Last-Modified"] = format_datetime(
+                self.last_modified.astimezone(timezone.utc), usegmt=True
+            )
+        return headers
+
+
+@dataclass(frozen=True)
+class CacheMiss:
+    """
+    A lookup that found no response. The response read after it is stored
+    only if none of its tags was invalidated since the lookup.
+    """
+
+    # Invalidation counters of the memory backend, by slot
+    generations: tuple[int, ...] = ()
+    # Postgres snapshot of the lookup, for the postgres backend
+    snapshot: str | None = None
+
+
+@dataclass(frozen=True)
+class ResponseCacheStats:
+    pid: int
+    backend: str
+    entries: int
+    bytes: int
+    hits: int
+    misses: int
+    evictions: int
+    invalidations: int
+
+
+class ResponseCacheBackend(Protocol):
+    ttl_seconds: float
+    # Whether get and put wait on Postgres, async routes call them in the
+    # threadpool then
+    blocking: bool
+
+    def get(self, key: str) -> CachedResponse | CacheMiss:
+        ...
+
+    def put(
+        self,
+        key: str,
+        response: CachedResponse,
+        tags: Collection[str],
+        miss: CacheMiss,
+    ) -> None:
+        ...
+
+    def evict(self, tags: Collection[str]) -> None:
+        ...
+
+    def invalidation_statements(self, tags: Collection[str]) -> list[Executable]:
+        ...
+
+    def clear(self) -> None:
+        ...
+
+    def stats(self) -> ResponseCacheStats:
+        ...
+
+
+class MemoryResponseCache:
+    """
+    Responses kept in this worker only, the least recently used are dropped
+    once they take more than `max_bytes`. Writes in the other workers reach
+    it through Postgres NOTIFY, the TTL bounds staleness if a notification
+    is ever missed.
+
+    Every invalidation bumps the counters of its tags, a response read
+    after a miss is stored only if the counters of its tags are unchanged.
+    """
+
+    blocking = False
+
+    def __init__(
+        self, *, ttl_seconds: float, max_bytes: int, max_entry_bytes: int
+    ) -> None:
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = max_entry_bytes
+        self._generations = [0] * generation_slots
+        self._entries: OrderedDict[
+            str, tuple[float, CachedResponse, frozenset[str]]
+        ] = OrderedDict()
+        self._keys_by_tag: dict[str, set[str]] = {}
+        self._bytes = 0
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._invalidations = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> CachedResponse | CacheMiss:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._misses += 1
+                return CacheMiss(generations=tuple(self._generations))
+            expires_at, response, _ = entry
+            if expires_at < time.monotonic():
+                self._remove(key)
+                self._evictions += 1
+                self._misses += 1
+                return CacheMiss(generations=tuple(self._generations))
+            self._entries.move_to_end(key)
+            self._hits += 1
+            return response
+
+    def put(
+        self,
+        key: str,
+        response: CachedResponse,
+        tags: Collection[str],
+        miss: CacheMiss,
+    ) -> None:
+        size = len(response.body)
+        if self.ttl_seconds <= 0 or size > min(self.max_entry_bytes, self.max_bytes):
+            return
+        with self._lock:
+            # Without a lookup, nothing tells when the response was read
+            if not miss.generations or any(
+                self._generations[slot] != miss.generations[slot]
+                for slot in tag_slots(tags)
+            ):
+                return
+            self._remove(key)
+            expires_at = time.monotonic() + self.ttl_seconds
+            self._entries[key] = (expires_at, response, frozenset(tags))
+            for tag in tags:
+                self._keys_by_tag.setdefault(tag, set()).add(key)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self._evictions += 1
+
+    def _remove(self, key: str) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        _, response, tags = entry
+        self._bytes -= len(response.body)
+        for tag in tags:
+            keys = self._keys_by_tag[tag]
+            keys.discard(key)
+            if not keys:
+                del self._keys_by_tag[tag]
+
+    def evict(self, tags: Collection[str]) -> None:
+        with self._lock:
+            self._invalidations += 1
+            if all_tags in tags:
+                slots: Iterable[int] = range(generation_slots)
+                keys = set(self._entries)
+            else:
+                slots = tag_slots(tags)
+                keys = {key for tag in tags for key in self._keys_by_tag.get(tag, ())}
+            for slot in slots:
+                self._generations[slot] += 1
+            for key in keys:
+                self._remove(key)
+
+    def invalidation_statements(self, tags: Collection[str]) -> list[Executable]:
+        payload = ",".join(sorted(tags))
+        if len(payload) > max_payload_size:
+            payload = all_tags
+        return [notify_statement(RESPONSE_CACHE_CHANNEL, payload)]
+
+    def clear(self) -> None:
+        self.evict({all_tags})
+
+    def stats(self) -> ResponseCacheStats:
+        with self._lock:
+            return ResponseCacheStats(
+                pid=os.getpid(),
+                backend="memory",
+                entries=len(self._entries),
+                bytes=self._bytes,
+                hits=self._hits,
+                misses=self._misses,
+                evictions=self._evictions,
+                invalidations=self._invalidations,
+            )
+
+
+class PostgresResponseCache:
+    """
+    Responses shared by all the workers through the unlogged
+    `responsecacheentry` table. Writes delete the entries they change in
+    their own transaction, and every put deletes the expired ones.
+
+    Writes also record their transaction in the `responsecachetag` rows of
+    their tags, before deleting the entries. A put locks the rows of its
+    tags, waiting for the writes in progress, and skips the response if one
+    of them is by a transaction its lookup didn't see: the response may
+    have been read before that write, in any worker.
+    """
+
+    blocking = True
+
+    def __init__(
+        self, engine: Engine, *, ttl_seconds: float, max_entry_bytes: int
+    ) -> None:
+        self.engine = engine
+        self.ttl_seconds = ttl_seconds
+        self.max_entry_bytes = max_entry_bytes
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._invalidations = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> CachedResponse | CacheMiss:
+        with Session(self.engine) as session:
+            row = session.exec(
+                select(ResponseCacheEntry).where(
+                    ResponseCacheEntry.key == key,
+                    col(ResponseCacheEntry.expires_at) > func.now(),
+                )
+            ).first()
+            if row is None:
+                snapshot = session.exec(
+                    select(cast(func.pg_current_snapshot(), Text))
+                ).one()
+        with self._lock:
+            if row is None:
+                self._misses += 1
+                return CacheMiss(snapshot=snapshot)
+            self._hits += 1
+        return CachedResponse(
+            body=row.body,
+            etag=row.etag,
+            last_modified=row.last_modified,
+            owner_id=row.owner_id,
+        )
+
+    def put(
+        self,
+        key: str,
+        response: CachedResponse,
+        tags: Collection[str],
+        miss: CacheMiss,
+    ) -> None:
+        if self.ttl_seconds <= 0 or len(response.body) > self.max_entry_bytes:
+            return
+        tags = sorted({*tags, all_tags})
+        # Rows of the tags never invalidated, waiting for the writes inserting
+        # them, so that there is a row to lock
+        missing_tags = insert(ResponseCacheTag).values(
+            [{"tag": tag, "invalidated_by": 0} for tag in tags]
+        )
+        # Computed on the row locked, after the write holding it commits
+        unchanged = text(
+            "pg_visible_in_snapshot(invalidated_by::text::xid8, "
+            "CAST(:snapshot AS pg_snapshot))"
+        ).bindparams(snapshot=miss.snapshot)
+        unchanged_tags = (
+            select(unchanged)
+            .select_from(ResponseCacheTag)
+            .where(col(ResponseCacheTag.tag).in_(tags))
+            .order_by(col(ResponseCacheTag.tag))
+            .with_for_update(read=True)
+        )
+        values = {
+            "key": key,
+            "tags": sorted(tags),
+            "owner_id": response.owner_id,
+            "etag": response.etag,
+            "last_modified": response.last_modified,
+            "body": response.body,
+            "expires_at": func.now() + timedelta(seconds=self.ttl_seconds),
+        }
+        statement = insert(ResponseCacheEntry).values(values)
+        statement = statement.on_conflict_do_update(
+            index_elements=[col(ResponseCacheEntry.key)],
+            set_={name: statement.excluded[name] for name in values if name != "key"},
+        )
+        # Skipping the rows other puts are deleting or writes are invalidating
+        old_tags = (
+            select(ResponseCacheTag.tag)
+            .where(col(ResponseCacheTag.invalidated_at) < func.now() - tag_retention)
+            .with_for_update(skip_locked=True)
+        )
+        with Session(self.engine) as session:
+            try:
+                session.execute(missing_tags.on_conflict_do_nothing())
+                if not all(session.scalars(unchanged_tags)):
+                    return
+            except OperationalError as e:
+                # Deadlocked with a write invalidating some of the tags
+                if getattr(e.orig, "sqlstate", None) != deadlock_detected:
+                    raise
+                logger.warning("Response cache put deadlocked, skipping it")
+                return
+            session.execute(statement)
+            expired = session.connection().execute(
+                delete(ResponseCacheEntry).where(
+                    col(ResponseCacheEntry.expires_at) < func.now()
+                )
+            )
+            session.execute(
+                delete(ResponseCacheTag).where(col(ResponseCacheTag.tag).in_(old_tags))
+            )
+            session.commit()
+        with self._lock:
+            self._evictions += expired.rowcount
+
+    def evict(self, tags: Collection[str]) -> None:
+        # The entries are deleted by invalidation_statements
+        with self._lock:
+            self._invalidations += 1
+
+    def invalidation_statements(self, tags: Collection[str]) -> list[Executable]:
+        # Locked in the order puts lock them, so a write and a put don't deadlock
+        tags = sorted(tags)
+        transaction = cast(cast(func.pg_current_xact_id(), Text), BigInteger)
+        invalidated = insert(ResponseCacheTag).values(
+            [
+                {
+                    "tag": tag,
+                    "invalidated_by": transaction,
+                    "invalidated_at": func.now(),
+                }
+                for tag in tags
+            ]
+        )
+        invalidated = invalidated.on_conflict_do_update(
+            index_elements=[col(ResponseCacheTag.tag)],
+            set_={
+                "invalidated_by": invalidated.excluded.invalidated_by,
+                "invalidated_at": invalidated.excluded.invalidated_at,
+            },
+        )
+        # A statement of its own, it sees the entries of the puts it waited for
+        deleted = delete(ResponseCacheEntry)
+        if all_tags not in tags:
+            tags_column = ResponseCacheEntry.__table__.c.tags  # type: ignore[attr-defined]
+            deleted = deleted.where(tags_column.overlap(tags))
+        return [invalidated, deleted]
+
+    def clear(self) -> None:
+        with Session(self.engine) as session:
+            for statement in self.invalidation_statements({all_tags}):
+                session.execute(statement)
+            session.commit()
+        self.evict({all_tags})
+
+    def stats(self) -> ResponseCacheStats:
+        with Session(self.engine) as session:
+            entries, size = session.exec(
+                select(
+                    func.count(),
+                    func.coalesce(
+                        func.sum(func.octet_length(ResponseCacheEntry.body)), 0
+                    ),
+                )
+            ).one()
+        with self._lock:
+            return ResponseCacheStats(
+                pid=os.getpid(),
+                backend="postgres",
+                entries=entries,
+                bytes=size,
+                hits=self._hits,
+                misses=self._misses,
+                evictions=self._evictions,
+                invalidations=self._invalidations,
+            )
+
+
+def tag_slots(tags: Iterable[str]) -> set[int]:
+    return {hash(tag) % generation_slots for tag in tags}
+
+
+def list_tag(owner_id: int | None) -> str:
+    """Tag of the item lists of `owner_id`, of the list of all items for None."""
+    return f"items:{'all' if owner_id is None else owner_id}"
+
+
+def item_tag(item_id: int | None) -> str:
+    return f"item:{item_id}"
+
+
+def owner_tag(owner_id: int | None) -> str:
+    """Tag of the single item responses of the items of `owner_id`."""
+    return f"owner:{owner_id}"
+
+
+def item_tags(
+    owner_ids: Iterable[int | None], item_ids: Iterable[int | None] = ()
+) -> set[str]:
+    """Tags of the responses a write to items of `owner_ids` changes."""
+    return {
+        list_tag(None),
+        *(list_tag(owner_id) for owner_id in owner_ids),
+        *(item_tag(item_id) for item_id in item_ids),
+    }
+
+
+def owner_tags(owner_id: int) -> set[str]:
+    """Tags of the responses with any item of `owner_id`."""
+    return {list_tag(None), list_tag(owner_id), owner_tag(owner_id)}
+
+
+response_cache: ResponseCacheBackend = MemoryResponseCache(
+    ttl_seconds=settings.RESPONSE_CACHE_TTL_SECONDS,
+    max_bytes=settings.RESPONSE_CACHE_MAX_BYTES,
+    max_entry_bytes=settings.RESPONSE_CACHE_MAX_ENTRY_BYTES,
+)
+if settings.RESPONSE_CACHE_BACKEND == "postgres":
+    # Its own pool, cache lookups never wait for the connections of requests
+    cache_engine = create_engine(
+        str(settings.SQLALCHEMY_POOLED_DATABASE_URI),
+        pool_pre_ping=settings.POSTGRES_POOL_PRE_PING,
+        connect_args={"prepare_threshold": settings.prepare_threshold},
+    )
+    response_cache = PostgresResponseCache(
+        cache_engine,
+        ttl_seconds=settings.RESPONSE_CACHE_TTL_SECONDS,
+        max_entry_bytes=settings.RESPONSE_CACHE_MAX_ENTRY_BYTES,
+    )
+
+
+def invalidate_responses(session: Session, tags: Collection[str]) -> None:
+    """
+    Drop the cached responses stored with any of `tags`, in every worker.
+
+    Call it before committing the write: the entries of this worker are
+    dropped right away, those of the others once the write commits.
+    """
+    if response_cache.ttl_seconds <= 0:
+        return
+    response_cache.evict(tags)
+    for statement in response_cache.invalidation_statements(tags):
+        session.execute(statement)
+
+
+async def invalidate_responses_async(
+    session: AsyncSession, tags: Collection[str]
+) -> None:
+    if response_cache.ttl_seconds <= 0:
+        return
+    response_cache.evict(tags)
+    for statement in response_cache.invalidation_statements(tags):
+        await session.execute(statement)
+
+
+def _apply_invalidation(payload: str) -> None:
+    response_cache.evict(payload.split(","))
+
+
+def _reset() -> None:
+    response_cache.evict({all_tags})
+
+
+listener.subscribe(RESPONSE_CACHE_CHANNEL, _apply_invalidation)
+listener.on_reconnect(_reset)
@@ -0,0 +1,247 @@
+import math
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Protocol
+
+from sqlalchemy import case
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+from sqlalchemy.sql.dml import ReturningInsert
+from sqlmodel import col, delete, func, select
+
+from app.core.config import settings
+from app.models import LoginThrottleBucket
+
+
+@dataclass(frozen=True)
+class BucketPolicy:
+    capacity: int
+    refill_seconds: float
+    lockout_seconds: float
+    max_lockout_seconds: float
+
+
+@dataclass(frozen=True)
+class BucketState:
+    tokens: float
+    updated_at: float
+    lockouts: int = 0
+    locked_until: float = 0.0
+
+
+def consume(state: BucketState | None, policy: BucketPolicy, now: float) -> BucketState:
+    """
+    Take one token for a failed attempt, locking the bucket when it runs dry.
+
+    Each consecutive lockout doubles, up to `max_lockout_seconds`. The count
+    starts over once the bucket has refilled completely.
+    """
+    if state is None:
+        state = BucketState(tokens=policy.capacity, updated_at=now)
+    tokens = min(
+        policy.capacity,
+        state.tokens + (now - state.updated_at) / policy.refill_seconds,
+    )
+    lockouts = 0 if tokens >= policy.capacity else state.lockouts
+    tokens -= 1
+    locked_until = state.locked_until
+    if tokens < 1:
+        lockout = min(policy.lockout_seconds * 2**lockouts, policy.max_lockout_seconds)
+        locked_until = now + lockout
+        lockouts += 1
+    return BucketState(
+        tokens=tokens, updated_at=now, lockouts=lockouts, locked_until=locked_until
+    )
+
+
+def consume_statement(
+    key: str, policy: BucketPolicy, now: float
+) -> ReturningInsert[tuple[float, float, int, float]]:
+    """
+    `consume` as a single upsert of the key's row, so concurrent failures on
+    a new key neither conflict nor lose a token. Returns the new state.
+    """
+    statement = insert(LoginThrottleBucket).values(
+        key=key, **vars(consume(None, policy, now))
+    )
+    refilled = func.least(
+        policy.capacity,
+        col(LoginThrottleBucket.tokens)
+        + (now - col(LoginThrottleBucket.updated_at)) / policy.refill_seconds,
+    )
+    lockouts = case(
+        (refilled >= policy.capacity, 0), else_=col(LoginThrottleBucket.lockouts)
+    )
+    locks = refilled - 1 < 1
+    lockout = func.least(
+        policy.lockout_seconds * func.power(2, lockouts), policy.max_lockout_seconds
+    )
+    return statement.on_conflict_do_update(
+        index_elements=[col(LoginThrottleBucket.key)],
+        set_={
+            "tokens": refilled - 1,
+            "updated_at": now,
+            "lockouts": case((locks, lockouts + 1), else_=lockouts),
+            "locked_until": case(
+                (locks, now + lockout), else_=col(LoginThrottleBucket.locked_until)
+            ),
+        },
+    ).returning(
+        col(LoginThrottleBucket.tokens),
+        col(LoginThrottleBucket.updated_at),
+        col(LoginThrottleBucket.lockouts),
+        col(LoginThrottleBucket.locked_until),
+    )
+
+
+class ThrottleBackend(Protocol):
+    def locked_until(self, session: Session, key: str) -> float:
+        ...
+
+    def record_failure(
+        self, session: Session, key: str, policy: BucketPolicy, now: float
+    ) -> None:
+        ...
+
+    def reset(self, session: Session, key: str) -> None:
+        ...
+
+
+class MemoryThrottleBackend:
+    """Buckets kept in this worker only, the least recently used are dropped."""
+
+    def __init__(self, max_keys: int = 100_000) -> None:
+        self.max_keys = max_keys
+        self._buckets: OrderedDict[str, BucketState] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def locked_until(self, _session: Session, key: str) -> float:
+        state = self._buckets.get(key)
+        return state.locked_until if state else 0.0
+
+    def record_failure(
+        self, _session: Session, key: str, policy: BucketPolicy, now: float
+    ) -> None:
+        with self._lock:
+            self._store(key, consume(self._buckets.get(key), policy, now))
+
+    def remember(self, key: str, state: BucketState) -> None:
+        with self._lock:
+            self._store(key, state)
+
+    def _store(self, key: str, state: BucketState) -> None:
+        self._buckets[key] = state
+        self._buckets.move_to_end(key)
+        while len(self._buckets) > self.max_keys:
+            self._buckets.popitem(last=False)
+
+    def reset(self, _session: Session, key: str) -> None:
+        with self._lock:
+            self._buckets.pop(key, None)
+
+
+class PostgresThrottleBackend:
+    """
+    Buckets shared by all the workers through the `loginthrottlebucket` table,
+    read and written on the login request's session.
+
+    Known locks are also kept in memory, so attempts against a key this
+    worker already saw locked are rejected without a query.
+    """
+
+    def __init__(self) -> None:
+        self._known_locks = MemoryThrottleBackend()
+
+    def locked_until(self, session: Session, key: str) -> float:
+        locked_until = self._known_locks.locked_until(session, key)
+        if locked_until > time.time():
+            return locked_until
+        row = session.execute(
+            select(LoginThrottleBucket.locked_until).where(
+                LoginThrottleBucket.key == key
+            )
+        ).scalar()
+        return row or 0.0
+
+    def record_failure(
+        self, session: Session, key: str, policy: BucketPolicy, now: float
+    ) -> None:
+        row = session.execute(consume_statement(key, policy, now)).one()
+        session.commit()
+        state = BucketState(*row)
+        if state.locked_until > now:
+            self._known_locks.remember(key, state)
+
+    def reset(self, session: Session, key: str) -> None:
+        self._known_locks.reset(session, key)
+        session.execute(
+            delete(LoginThrottleBucket).where(col(LoginThrottleBucket.key) == key)
+        )
+        session.commit()
+
+
+class LoginThrottle:
+    """
+    Token-bucket throttling of failed logins, by client IP and target email.
+
+    `retry_after` runs before the password is verified and only reads the lock
+    of each key, so rejected attempts never reach bcrypt. Every method takes
+    the login request's session, which the postgres backend commits.
+    """
+
+    def __init__(
+        self,
+        backend: ThrottleBackend,
+        *,
+        ip_policy: BucketPolicy,
+        email_policy: BucketPolicy,
+    ) -> None:
+        self.backend = backend
+        self.ip_policy = ip_policy
+        self.email_policy = email_policy
+
+    def _keys(self, ip: str, email: str) -> list[tuple[str, BucketPolicy]]:
+        return [
+            (f"ip:{ip}", self.ip_policy),
+            (f"email:{email.strip().lower()}", self.email_policy),
+        ]
+
+    def retry_after(self, session: Session, ip: str, email: str) -> int | None:
+        now = time.time()
+        locked_until = max(
+            self.backend.locked_until(session, key) for key, _ in self._keys(ip, email)
+        )
+        if locked_until > now:
+            return math.ceil(locked_until - now)
+        return None
+
+    def record_failure(self, session: Session, ip: str, email: str) -> None:
+        now = time.time()
+        for key, policy in self._keys(ip, email):
+            self.backend.record_failure(session, key, policy, now)
+
+    def record_success(self, session: Session, ip: str, email: str) -> None:
+        # A shared IP keeps its bucket, the account starts over
+        _, (email_key, _) = self._keys(ip, email)
+        self.backend.reset(session, email_key)
+
+
+def _policy(capacity: int) -> BucketPolicy:
+    return BucketPolicy(
+        capacity=capacity,
+        refill_seconds=settings.LOGIN_THROTTLE_REFILL_SECONDS,
+        lockout_seconds=settings.LOGIN_THROTTLE_LOCKOUT_SECONDS,
+        max_lockout_seconds=settings.LOGIN_THROTTLE_MAX_LOCKOUT_SECONDS,
+    )
+
+
+throttle_backend: ThrottleBackend = MemoryThrottleBackend()
+if settings.LOGIN_THROTTLE_BACKEND == "postgres":
+    throttle_backend = PostgresThrottleBackend()
+login_throttle = LoginThrottle(
+    throttle_backend,
+    ip_policy=_policy(settings.LOGIN_THROTTLE_IP_CAPACITY),
+    email_policy=_policy(settings.LOGIN_THROTTLE_EMAIL_CAPACITY),
+)
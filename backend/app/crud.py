@@ -1,9 +1,297 @@
-from typing import Any
+import functools
+import logging
+from collections import Counter
+from collections.abc import Iterator, Sequence
+from contextlib import suppress
+from datetime import datetime
+from typing import Any, TypeVar
 
-from sqlmodel import Session, select
+from sqlalchemy import (
+    ARRAY,
+    REAL,
+    Integer,
+    Row,
+    Select,
+    TextClause,
+    any_,
+    bindparam,
+    case,
+    cast,
+    delete,
+    literal_column,
+    or_,
+    text,
+    tuple_,
+    update,
+)
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.dialects.postgresql import insert
+from sqlmodel import Session, col, func, select
+from sqlmodel.sql.expression import SelectOfScalar
 
-from app.core.security import get_password_hash, verify_password
-from app.models import Item, ItemCreate, User, UserCreate, UserUpdate
+from app.core.pagination import InvalidCursorError, Page
+from app.core.principals import invalidate_principal
+from app.core.response_cache import invalidate_responses, item_tags, owner_tags
+from app.core.security import get_password_hash, verify_and_update_password
+from app.models import (
+    CountMode,
+    Item,
+    ItemBatchUpdate,
+    ItemCreate,
+    ItemsQuery,
+    ItemStats,
+    ItemUpdate,
+    User,
+    UserCreate,
+    UserUpdate,
+    item_search_vector,
+)
+
+logger = logging.getLogger(__name__)
+
+SelectT = TypeVar("SelectT", bound=Select[Any])
+
+# The hot statements are built once, with bound parameters, so each request
+# skips their construction and SQLAlchemy compiles them a single time
+user_by_email_statement = select(User).where(
+    func.lower(User.email) == func.lower(bindparam("email"))
+)
+users_count_statement = select(func.count()).select_from(User)
+# Pages are read with either a cursor (after) or an offset (skip), see Page
+users_statement = (
+    select(User)
+    .where(User.id > bindparam("after"))
+    .order_by(col(User.id))
+    .offset(bindparam("skip"))
+    .limit(bindparam("limit"))
+)
+items_count_statement = select(func.count()).select_from(Item)
+items_statement = (
+    select(Item)
+    .where(Item.id > bindparam("after"))
+    .order_by(col(Item.id))
+    .offset(bindparam("skip"))
+    .limit(bindparam("limit"))
+)
+owner_items_count_statement = items_count_statement.where(
+    Item.owner_id == bindparam("owner_id")
+)
+owner_items_statement = items_statement.where(Item.owner_id == bindparam("owner_id"))
+
+# Lists searched with q, filtered or sorted other than by id are built on first
+# use of each combination, see items_list_statement. Their pages are read after
+# a (key, id) cursor, or an offset
+item_search_query = func.websearch_to_tsquery(
+    literal_column("'english'"), bindparam("q")
+)
+item_search_rank = func.ts_rank(item_search_vector, item_search_query, type_=REAL)
+item_sort_keys: dict[str, Any] = {
+    "rank": item_search_rank,
+    "title": col(Item.title),
+    "created_at": col(Item.created_at),
+}
+item_filters = {
+    "created_after": col(Item.created_at) >= bindparam("created_after"),
+    "created_before": col(Item.created_at) < bindparam("created_before"),
+    "updated_after": col(Item.updated_at) >= bindparam("updated_after"),
+    "updated_before": col(Item.updated_at) < bindparam("updated_before"),
+}
+
+# Counts for the other count modes
+users_estimate_statement = text('EXPLAIN (FORMAT JSON) SELECT 1 FROM "user"')
+items_estimate_statement = text("EXPLAIN (FORMAT JSON) SELECT 1 FROM item")
+owner_items_estimate_statement = text(
+    "EXPLAIN (FORMAT JSON) SELECT 1 FROM item WHERE owner_id = :owner_id"
+)
+items_cached_count_statement = select(func.coalesce(func.sum(ItemStats.item_count), 0))
+owner_items_cached_count_statement = select(ItemStats.item_count).where(
+    ItemStats.owner_id == bindparam("owner_id")
+)
+_item_stats_insert = insert(ItemStats).values(
+    owner_id=bindparam("owner_id"), item_count=bindparam("delta"), revision=1
+)
+# Also bumps the revision of the owner's items, so run it with a delta of 0
+# after an update. The row lock orders the revisions of concurrent writers
+add_item_count_statement = _item_stats_insert.on_conflict_do_update(
+    index_elements=[col(ItemStats.owner_id)],
+    set_={
+        "item_count": col(ItemStats.item_count)
+        + _item_stats_insert.excluded.item_count,
+        "revision": col(ItemStats.revision) + 1,
+        "modified_at": func.now(),
+    },
+)
+owner_items_revision_statement = select(
+    ItemStats.revision, ItemStats.modified_at
+).where(ItemStats.owner_id == bindparam("owner_id"))
+
+
+def _filter_items(
+    statement: SelectT, *, owner: bool, search: bool, filters: tuple[str, ...]
+) -> SelectT:
+    if owner:
+        statement = statement.where(col(Item.owner_id) == bindparam("owner_id"))
+    if search:
+        statement = statement.where(item_search_vector.bool_op("@@")(item_search_query))
+    return statement.where(*(item_filters[name] for name in filters))
+
+
+@functools.cache
+def items_list_statement(
+    *,
+    order: str,
+    descending: bool,
+    owner: bool,
+    search: bool,
+    filters: tuple[str, ...],
+    cursor: bool,
+) -> Select[Any]:
+    """
+    Page of items ordered by `order` then id, along with their sort key
+    unless ordered by id.
+    """
+    id = col(Item.id)
+    statement: Select[Any]
+    if order == "id" and not descending:
+        return _filter_items(
+            items_statement, owner=owner, search=search, filters=filters
+        )
+    if order == "id":
+        statement = select(Item).order_by(id.desc())
+        if cursor:
+            statement = statement.where(id < bindparam("after"))
+    else:
+        key = item_sort_keys[order]
+        statement = select(Item, key)
+        if descending:
+            statement = statement.order_by(key.desc(), id.desc())
+        else:
+            statement = statement.order_by(key, id)
+        if cursor:
+            # Cast to the type of the key, e.g. ts_rank's real, so the rank of
+            # the cursor row doesn't compare above itself
+            after = cast(bindparam("key"), key.type)
+            row, cursor_row = tuple_(key, id), tuple_(after, bindparam("after"))
+            # The key is also compared alone, for indexes on the key only
+            if descending:
+                statement = statement.where(row < cursor_row, key <= after)
+            else:
+                statement = statement.where(row > cursor_row, key >= after)
+    statement = statement.offset(bindparam("skip")).limit(bindparam("limit"))
+    return _filter_items(statement, owner=owner, search=search, filters=filters)
+
+
+@functools.cache
+def items_list_count_statement(
+    *, owner: bool, search: bool, filters: tuple[str, ...]
+) -> SelectOfScalar[int]:
+    return _filter_items(
+        items_count_statement, owner=owner, search=search, filters=filters
+    )
+
+
+@functools.cache
+def items_list_estimate_statement(
+    *, owner: bool, search: bool, filters: tuple[str, ...]
+) -> TextClause:
+    statement = _filter_items(
+        select(col(Item.id)),
+        owner=owner,
+        search=search,
+        filters=filters,
+    )
+    dialect = postgresql.dialect(paramstyle="named")  # type: ignore[no-untyped-call]
+    sql = statement.compile(dialect=dialect)
+    return text(f"EXPLAIN (FORMAT JSON) {sql}")
+
+
+def item_cursor_key(order: str, page: Page) -> Any:
+    """
+    Sort key in the cursor of `page`, for items ordered by `order`, None
+    when they are ordered by id or the page has no cursor.
+    """
+    if page.key is None and (order == "id" or not page.after):
+        return None
+    if order == "rank" and isinstance(page.key, int | float):
+        return page.key
+    if order == "title" and isinstance(page.key, str):
+        return page.key
+    if order == "created_at" and isinstance(page.key, str):
+        with suppress(ValueError):
+            return datetime.fromisoformat(page.key)
+    raise InvalidCursorError(page.key)
+
+
+# Single item writes return the written row, ownership is part of the WHERE
+# clause, so each one is a single round trip
+update_item_statement = (
+    update(Item).where(col(Item.id) == bindparam("item_id")).returning(Item)
+)
+# Parameters named after a column would be SET by the UPDATE
+owner_update_item_statement = update_item_statement.where(
+    col(Item.owner_id) == bindparam("item_owner_id")
+)
+delete_item_statement = (
+    delete(Item)
+    .where(col(Item.id) == bindparam("item_id"))
+    .returning(col(Item.owner_id))
+)
+owner_delete_item_statement = delete_item_statement.where(
+    col(Item.owner_id) == bindparam("owner_id")
+)
+
+
+# Batch statements, the ids are bound as a single array parameter
+_item_ids = bindparam("ids", type_=ARRAY(Integer))
+# Overwrites the items the session already holds, e.g. after a bulk update
+items_by_id_statement = (
+    select(Item)
+    .where(col(Item.id) == any_(_item_ids))
+    .execution_options(populate_existing=True)
+)
+# Keeps them from being deleted before the transaction ends, locking in id
+# order so concurrent batches don't deadlock
+locked_items_by_id_statement = items_by_id_statement.order_by(
+    col(Item.id)
+).with_for_update()
+insert_items_statement = insert(Item).returning(Item, sort_by_parameter_order=True)
+# Returns the rows it deleted, not those a concurrent delete got first
+delete_items_statement = (
+    delete(Item)
+    .where(col(Item.id) == any_(_item_ids))
+    .returning(col(Item.id), col(Item.owner_id))
+    .execution_options(synchronize_session=False)
+)
+
+
+# Exports read plain rows, skipping the ORM identity map and object creation
+export_items_statement = select(
+    col(Item.id), col(Item.title), col(Item.description), col(Item.owner_id)
+).order_by(col(Item.id))
+owner_export_items_statement = export_items_statement.where(
+    Item.owner_id == bindparam("owner_id")
+)
+export_batch_size = 1000
+
+
+# Deletes a batch of a user's items, walking the owner index
+purge_items_statement = (
+    delete(Item)
+    .where(
+        col(Item.id).in_(
+            select(Item.id)
+            .where(Item.owner_id == bindparam("owner_id"))
+            .limit(bindparam("limit"))
+        )
+    )
+    .execution_options(synchronize_session=False)
+)
+purge_user_statement = delete(User).where(
+    col(User.id) == bindparam("user_id"), col(User.pending_deletion).is_(True)
+)
+pending_deletion_users_statement = select(User.id).where(
+    col(User.pending_deletion).is_(True)
+)
 
 
 def create_user(*, session: Session, user_create: UserCreate) -> User:
@@ -12,27 +300,104 @@ def create_user(*, session: Session, user_create: UserCreate) -> User:
     )
     session.add(db_obj)
     session.commit()
-    session.refresh(db_obj)
     return db_obj
 
 
-def update_user(*, session: Session, db_user: User, user_in: UserUpdate) -> Any:
-    user_data = user_in.model_dump(exclude_unset=True)
-    extra_data = {}
-    if "password" in user_data:
-        password = user_data["password"]
-        hashed_password = get_password_hash(password)
-        extra_data["hashed_password"] = hashed_password
-    db_user.sqlmodel_update(user_data, update=extra_data)
+def update_user(
+    *, session: Session, user_id: int, user_in: UserUpdate, version: int | None = None
+) -> User | None:
+    """
+    Update the user `user_id` in a single statement, only if they are at
+    `version` when given. Returns the updated user, None when none matched.
+    """
+    values: dict[str, Any] = user_in.model_dump(exclude_unset=True)
+    password = values.pop("password", None)
+    if password:
+        values["hashed_password"] = get_password_hash(password)
+    claims = [
+        col(getattr(User, field)).is_distinct_from(values[field])
+        for field in ("is_active", "is_superuser")
+        if field in values
+    ]
+    if claims:
+        # Tokens may carry these as claims, make clients log in again
+        values["token_version"] = case(
+            (or_(*claims), col(User.token_version) + 1),
+            else_=col(User.token_version),
+        )
+    statement = (
+        update(User)
+        .where(col(User.id) == user_id)
+        # An empty update still returns the user
+        .values(values or {"email": col(User.email)})
+        .returning(User)
+        .execution_options(populate_existing=True)
+    )
+    if version is not None:
+        statement = statement.where(col(User.version) == version)
+    db_user: User | None = session.execute(statement).scalar_one_or_none()
+    if not db_user:
+        session.rollback()
+        return None
+    invalidate_principal(session, db_user, revoked=bool(claims))
+    session.commit()
+    return db_user
+
+
+def revoke_tokens(*, session: Session, db_user: User) -> User:
+    db_user.token_version += 1
     session.add(db_user)
+    invalidate_principal(session, db_user, revoked=True)
     session.commit()
-    session.refresh(db_user)
     return db_user
 
 
+def request_user_deletion(*, session: Session, db_user: User) -> None:
+    """
+    Deactivate the user and flag them for deletion, purge_user then deletes
+    their items and the user row in bounded transactions.
+    """
+    db_user.is_active = False
+    db_user.pending_deletion = True
+    db_user.token_version += 1
+    session.add(db_user)
+    invalidate_principal(session, db_user, revoked=True)
+    session.commit()
+
+
+def purge_user(*, session: Session, user_id: int, batch_size: int) -> int:
+    """
+    Delete a user flagged for deletion, `batch_size` items per transaction
+    and the user row last. Returns the number of deleted items. It resumes
+    where it stopped when run again after an interruption.
+    """
+    user = session.get(User, user_id)
+    if not user or not user.pending_deletion:
+        return 0
+    params = {"owner_id": user_id, "limit": batch_size}
+    deleted = 0
+    # Purges of the same user may overlap, stop only once no item is left
+    while True:
+        count = session.connection().execute(purge_items_statement, params).rowcount
+        if not count:
+            break
+        session.execute(
+            add_item_count_statement, {"owner_id": user_id, "delta": -count}
+        )
+        invalidate_responses(session, owner_tags(user_id))
+        session.commit()
+        deleted += count
+        logger.info(f"Purged {deleted} items of user {user_id}")
+    session.connection().execute(purge_user_statement, {"user_id": user_id})
+    session.commit()
+    logger.info(f"Purged user {user_id} and their {deleted} items")
+    return deleted
+
+
 def get_user_by_email(*, session: Session, email: str) -> User | None:
-    statement = select(User).where(User.email == email)
-    session_user = session.exec(statement).first()
+    session_user = session.exec(
+        user_by_email_statement, params={"email": email}
+    ).first()
     return session_user
 
 
@@ -40,14 +405,272 @@ def authenticate(*, session: Session, email: str, password: str) -> User | None:
     db_user = get_user_by_email(session=session, email=email)
     if not db_user:
         return None
-    if not verify_password(password, db_user.hashed_password):
+    verified, new_hash = verify_and_update_password(password, db_user.hashed_password)
+    if not verified:
         return None
+    if new_hash:
+        # Move the stored hash to the current work factor transparently
+        db_user.hashed_password = new_hash
+        session.add(db_user)
+        session.commit()
     return db_user
 
 
 def create_item(*, session: Session, item_in: ItemCreate, owner_id: int) -> Item:
     db_item = Item.model_validate(item_in, update={"owner_id": owner_id})
     session.add(db_item)
+    session.execute(add_item_count_statement, {"owner_id": owner_id, "delta": 1})
+    invalidate_responses(session, item_tags([owner_id]))
+    session.commit()
+    return db_item
+
+
+def update_item(
+    *,
+    session: Session,
+    id: int,
+    item_in: ItemUpdate,
+    owner_id: int | None = None,
+    version: int | None = None,
+) -> Item | None:
+    """
+    Update the item `id`, only if `owner_id` owns it and it is at `version`
+    when given. Returns the updated item, None when no item matched.
+    """
+    # An empty update still returns the item
+    values = item_in.model_dump(exclude_unset=True) or {"title": col(Item.title)}
+    if owner_id is None:
+        statement = update_item_statement.values(values)
+    else:
+        statement = owner_update_item_statement.values(values)
+    if version is not None:
+        statement = statement.where(col(Item.version) == bindparam("item_version"))
+    params = {"item_id": id, "item_owner_id": owner_id, "item_version": version}
+    db_item: Item | None = session.execute(statement, params).scalar_one_or_none()
+    if db_item:
+        session.execute(
+            add_item_count_statement, {"owner_id": db_item.owner_id, "delta": 0}
+        )
+        invalidate_responses(session, item_tags([db_item.owner_id], [id]))
     session.commit()
-    session.refresh(db_item)
     return db_item
+
+
+def delete_item(*, session: Session, id: int, owner_id: int | None = None) -> bool:
+    """
+    Delete the item `id`, only if `owner_id` owns it when given. Returns
+    whether an item was deleted.
+    """
+    if owner_id is None:
+        statement = delete_item_statement
+    else:
+        statement = owner_delete_item_statement
+    params = {"item_id": id, "owner_id": owner_id}
+    deleted_owner_id = session.execute(statement, params).scalar_one_or_none()
+    if deleted_owner_id is None:
+        session.rollback()
+        return False
+    session.execute(
+        add_item_count_statement, {"owner_id": deleted_owner_id, "delta": -1}
+    )
+    invalidate_responses(session, item_tags([deleted_owner_id], [id]))
+    session.commit()
+    return True
+
+
+def get_items(
+    *, session: Session, ids: list[int], lock: bool = False
+) -> dict[int, Item]:
+    statement = locked_items_by_id_statement if lock else items_by_id_statement
+    items = session.exec(statement, params={"ids": ids}).all()
+    return {item.id: item for item in items if item.id is not None}
+
+
+def create_items(
+    *, session: Session, items_in: list[ItemCreate], owner_id: int
+) -> list[Item]:
+    """Create the items with a multi-row INSERT, in a single transaction."""
+    if not items_in:
+        return []
+    rows = [{**item_in.model_dump(), "owner_id": owner_id} for item_in in items_in]
+    items = list(session.scalars(insert_items_statement, rows))
+    session.execute(
+        add_item_count_statement, {"owner_id": owner_id, "delta": len(items)}
+    )
+    invalidate_responses(session, item_tags([owner_id]))
+    session.commit()
+    return items
+
+
+def update_items(
+    *, session: Session, items_in: list[ItemBatchUpdate]
+) -> dict[int, Item]:
+    """Apply the updates with executemany, in a single transaction."""
+    rows = [item_in.model_dump(exclude_unset=True) for item_in in items_in]
+    # Updates by primary key, grouped by the set of columns they change
+    changed = [row for row in rows if len(row) > 1]
+    if changed:
+        session.execute(update(Item), changed)
+    items = get_items(session=session, ids=[row["id"] for row in rows])
+    owner_ids = {items[row["id"]].owner_id for row in changed if row["id"] in items}
+    if owner_ids:
+        session.execute(
+            add_item_count_statement,
+            [{"owner_id": owner_id, "delta": 0} for owner_id in owner_ids],
+        )
+        changed_ids = [row["id"] for row in changed]
+        invalidate_responses(session, item_tags(owner_ids, changed_ids))
+    session.commit()
+    return items
+
+
+def delete_items(*, session: Session, db_items: list[Item]) -> set[int]:
+    """Delete the items, returns the ids of those that weren't deleted already."""
+    if not db_items:
+        return set()
+    rows = session.execute(
+        delete_items_statement, {"ids": [db_item.id for db_item in db_items]}
+    ).all()
+    if not rows:
+        session.rollback()
+        return set()
+    owner_counts = Counter(row.owner_id for row in rows)
+    session.execute(
+        add_item_count_statement,
+        [
+            {"owner_id": owner_id, "delta": -count}
+            for owner_id, count in owner_counts.items()
+        ],
+    )
+    item_ids = {row.id for row in rows}
+    invalidate_responses(session, item_tags(owner_counts, item_ids))
+    session.commit()
+    return item_ids
+
+
+def export_items(
+    *, session: Session, owner_id: int | None, batch_size: int = export_batch_size
+) -> Iterator[Sequence[Row[Any]]]:
+    """
+    The items of `owner_id`, or all of them, in batches fetched from a
+    server-side cursor, so memory doesn't grow with the number of rows.
+    """
+    options = {"yield_per": batch_size}
+    if owner_id is None:
+        result = session.execute(export_items_statement, execution_options=options)
+    else:
+        result = session.execute(
+            owner_export_items_statement,
+            {"owner_id": owner_id},
+            execution_options=options,
+        )
+    yield from result.partitions()
+
+
+def plan_rows(plan: list[dict[str, Any]]) -> int:
+    """Row estimate of an EXPLAIN (FORMAT JSON) output."""
+    return int(plan[0]["Plan"]["Plan Rows"])
+
+
+def count_users(*, session: Session, mode: CountMode) -> tuple[int | None, CountMode]:
+    """
+    Count the users the way `mode` says, returning the count and the mode
+    actually used. Users have no cached count, the estimate is used instead.
+    """
+    if mode in ("estimated", "cached"):
+        plan = session.execute(users_estimate_statement).scalar_one()
+        return plan_rows(plan), "estimated"
+    if mode == "none":
+        return None, mode
+    return session.exec(users_count_statement).one(), mode
+
+
+def get_items_revision(
+    *, session: Session, owner_id: int
+) -> tuple[int, datetime | None]:
+    """
+    Revision of the items of `owner_id` and when it last changed, bumped by
+    every write to them. (0, None) if they never had any.
+    """
+    params = {"owner_id": owner_id}
+    row = session.execute(owner_items_revision_statement, params).first()
+    return (row.revision, row.modified_at) if row else (0, None)
+
+
+def list_items(
+    *, session: Session, owner_id: int | None, query: ItemsQuery, page: Page
+) -> tuple[Sequence[Item], str | None]:
+    """Page of the items of `owner_id`, or of all of them, and the next cursor."""
+    key = item_cursor_key(query.order, page)
+    statement = items_list_statement(
+        order=query.order,
+        descending=query.descending,
+        owner=owner_id is not None,
+        search=bool(query.q),
+        filters=tuple(query.filters),
+        cursor=key is not None or bool(page.after),
+    )
+    params = {
+        **page.params,
+        **query.filters,
+        "key": key,
+        "owner_id": owner_id,
+        "q": query.q,
+    }
+    result = session.execute(statement, params)
+    if query.order == "id":
+        return page.rows(result.scalars().all())
+    return page.keyed_rows(result.tuples().all())
+
+
+def count_items(
+    *,
+    session: Session,
+    owner_id: int | None,
+    mode: CountMode,
+    query: ItemsQuery | None = None,
+) -> tuple[int | None, CountMode]:
+    """
+    Count the items of `owner_id`, or all of them, the way `mode` says,
+    returning the count and the mode actually used.
+    """
+    if query and (query.q or query.filters):
+        return count_filtered_items(
+            session=session, owner_id=owner_id, mode=mode, query=query
+        )
+    params = {"owner_id": owner_id}
+    if mode == "estimated":
+        if owner_id is None:
+            plan = session.execute(items_estimate_statement).scalar_one()
+        else:
+            plan = session.execute(owner_items_estimate_statement, params).scalar_one()
+        return plan_rows(plan), mode
+    if mode == "cached":
+        if owner_id is None:
+            return session.exec(items_cached_count_statement).one(), mode
+        cached = session.exec(owner_items_cached_count_statement, params=params)
+        return cached.first() or 0, mode
+    if mode == "none":
+        return None, mode
+    if owner_id is None:
+        return session.exec(items_count_statement).one(), mode
+    return session.exec(owner_items_count_statement, params=params).one(), mode
+
+
+def count_filtered_items(
+    *, session: Session, owner_id: int | None, mode: CountMode, query: ItemsQuery
+) -> tuple[int | None, CountMode]:
+    """Count the items `query` searches and filters, estimated in cached mode."""
+    shape = {
+        "owner": owner_id is not None,
+        "search": bool(query.q),
+        "filters": tuple(query.filters),
+    }
+    params = {**query.filters, "owner_id": owner_id, "q": query.q}
+    if mode in ("estimated", "cached"):
+        estimate = session.execute(items_list_estimate_statement(**shape), params)
+        return plan_rows(estimate.scalar_one()), "estimated"
+    if mode == "none":
+        return None, mode
+    count = session.exec(items_list_count_statement(**shape), params=params)
+    return count.one(), mode
@@ -0,0 +1,318 @@
+from collections import Counter
+from collections.abc import AsyncIterator, Sequence
+from datetime import datetime
+from typing import Any
+
+from sqlalchemy import Row, bindparam, update
+from sqlmodel import col
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from app.core.pagination import Page
+from app.core.principals import invalidate_principal_async
+from app.core.response_cache import invalidate_responses_async, item_tags
+from app.core.security import (
+    get_password_hash_async,
+    verify_and_update_password_async,
+)
+from app.crud import (
+    add_item_count_statement,
+    delete_item_statement,
+    delete_items_statement,
+    export_batch_size,
+    export_items_statement,
+    insert_items_statement,
+    item_cursor_key,
+    items_by_id_statement,
+    items_cached_count_statement,
+    items_count_statement,
+    items_estimate_statement,
+    items_list_count_statement,
+    items_list_estimate_statement,
+    items_list_statement,
+    locked_items_by_id_statement,
+    owner_delete_item_statement,
+    owner_export_items_statement,
+    owner_items_cached_count_statement,
+    owner_items_count_statement,
+    owner_items_estimate_statement,
+    owner_items_revision_statement,
+    owner_update_item_statement,
+    plan_rows,
+    update_item_statement,
+    user_by_email_statement,
+)
+from app.models import (
+    CountMode,
+    Item,
+    ItemBatchUpdate,
+    ItemCreate,
+    ItemsQuery,
+    ItemUpdate,
+    User,
+    UserCreate,
+)
+
+
+async def create_user(*, session: AsyncSession, user_create: UserCreate) -> User:
+    db_obj = User.model_validate(
+        user_create,
+        update={"hashed_password": await get_password_hash_async(user_create.password)},
+    )
+    session.add(db_obj)
+    await session.commit()
+    return db_obj
+
+
+async def revoke_tokens(*, session: AsyncSession, db_user: User) -> User:
+    db_user.token_version += 1
+    session.add(db_user)
+    await invalidate_principal_async(session, db_user, revoked=True)
+    await session.commit()
+    return db_user
+
+
+async def get_user_by_email(*, session: AsyncSession, email: str) -> User | None:
+    result = await session.exec(user_by_email_statement, params={"email": email})
+    session_user = result.first()
+    return session_user
+
+
+async def authenticate(
+    *, session: AsyncSession, email: str, password: str
+) -> User | None:
+    db_user = await get_user_by_email(session=session, email=email)
+    if not db_user:
+        return None
+    verified, new_hash = await verify_and_update_password_async(
+        password, db_user.hashed_password
+    )
+    if not verified:
+        return None
+    if new_hash:
+        db_user.hashed_password = new_hash
+        session.add(db_user)
+        await session.commit()
+    return db_user
+
+
+async def create_item(
+    *, session: AsyncSession, item_in: ItemCreate, owner_id: int
+) -> Item:
+    db_item = Item.model_validate(item_in, update={"owner_id": owner_id})
+    session.add(db_item)
+    await session.execute(add_item_count_statement, {"owner_id": owner_id, "delta": 1})
+    await invalidate_responses_async(session, item_tags([owner_id]))
+    await session.commit()
+    return db_item
+
+
+async def update_item(
+    *,
+    session: AsyncSession,
+    id: int,
+    item_in: ItemUpdate,
+    owner_id: int | None = None,
+    version: int | None = None,
+) -> Item | None:
+    values = item_in.model_dump(exclude_unset=True) or {"title": col(Item.title)}
+    if owner_id is None:
+        statement = update_item_statement.values(values)
+    else:
+        statement = owner_update_item_statement.values(values)
+    if version is not None:
+        statement = statement.where(col(Item.version) == bindparam("item_version"))
+    params = {"item_id": id, "item_owner_id": owner_id, "item_version": version}
+    result = await session.execute(statement, params)
+    db_item: Item | None = result.scalar_one_or_none()
+    if db_item:
+        await session.execute(
+            add_item_count_statement, {"owner_id": db_item.owner_id, "delta": 0}
+        )
+        await invalidate_responses_async(session, item_tags([db_item.owner_id], [id]))
+    await session.commit()
+    return db_item
+
+
+async def delete_item(
+    *, session: AsyncSession, id: int, owner_id: int | None = None
+) -> bool:
+    if owner_id is None:
+        statement = delete_item_statement
+    else:
+        statement = owner_delete_item_statement
+    params = {"item_id": id, "owner_id": owner_id}
+    deleted_owner_id = (await session.execute(statement, params)).scalar_one_or_none()
+    if deleted_owner_id is None:
+        await session.rollback()
+        return False
+    await session.execute(
+        add_item_count_statement, {"owner_id": deleted_owner_id, "delta": -1}
+    )
+    await invalidate_responses_async(session, item_tags([deleted_owner_id], [id]))
+    await session.commit()
+    return True
+
+
+async def get_items(
+    *, session: AsyncSession, ids: list[int], lock: bool = False
+) -> dict[int, Item]:
+    statement = locked_items_by_id_statement if lock else items_by_id_statement
+    result = await session.exec(statement, params={"ids": ids})
+    return {item.id: item for item in result.all() if item.id is not None}
+
+
+async def create_items(
+    *, session: AsyncSession, items_in: list[ItemCreate], owner_id: int
+) -> list[Item]:
+    if not items_in:
+        return []
+    rows = [{**item_in.model_dump(), "owner_id": owner_id} for item_in in items_in]
+    items = list(await session.scalars(insert_items_statement, rows))
+    await session.execute(
+        add_item_count_statement, {"owner_id": owner_id, "delta": len(items)}
+    )
+    await invalidate_responses_async(session, item_tags([owner_id]))
+    await session.commit()
+    return items
+
+
+async def update_items(
+    *, session: AsyncSession, items_in: list[ItemBatchUpdate]
+) -> dict[int, Item]:
+    rows = [item_in.model_dump(exclude_unset=True) for item_in in items_in]
+    changed = [row for row in rows if len(row) > 1]
+    if changed:
+        await session.execute(update(Item), changed)
+    items = await get_items(session=session, ids=[row["id"] for row in rows])
+    owner_ids = {items[row["id"]].owner_id for row in changed if row["id"] in items}
+    if owner_ids:
+        await session.execute(
+            add_item_count_statement,
+            [{"owner_id": owner_id, "delta": 0} for owner_id in owner_ids],
+        )
+        changed_ids = [row["id"] for row in changed]
+        await invalidate_responses_async(session, item_tags(owner_ids, changed_ids))
+    await session.commit()
+    return items
+
+
+async def delete_items(*, session: AsyncSession, db_items: list[Item]) -> set[int]:
+    if not db_items:
+        return set()
+    result = await session.execute(
+        delete_items_statement, {"ids": [db_item.id for db_item in db_items]}
+    )
+    rows = result.all()
+    if not rows:
+        await session.rollback()
+        return set()
+    owner_counts = Counter(row.owner_id for row in rows)
+    await session.execute(
+        add_item_count_statement,
+        [
+            {"owner_id": owner_id, "delta": -count}
+            for owner_id, count in owner_counts.items()
+        ],
+    )
+    item_ids = {row.id for row in rows}
+    await invalidate_responses_async(session, item_tags(owner_counts, item_ids))
+    await session.commit()
+    return item_ids
+
+
+async def export_items(
+    *, session: AsyncSession, owner_id: int | None, batch_size: int = export_batch_size
+) -> AsyncIterator[Sequence[Row[Any]]]:
+    options = {"yield_per": batch_size}
+    if owner_id is None:
+        result = await session.stream(export_items_statement, execution_options=options)
+    else:
+        result = await session.stream(
+            owner_export_items_statement,
+            {"owner_id": owner_id},
+            execution_options=options,
+        )
+    async for rows in result.partitions():
+        yield rows
+
+
+async def get_items_revision(
+    *, session: AsyncSession, owner_id: int
+) -> tuple[int, datetime | None]:
+    params = {"owner_id": owner_id}
+    row = (await session.execute(owner_items_revision_statement, params)).first()
+    return (row.revision, row.modified_at) if row else (0, None)
+
+
+async def list_items(
+    *, session: AsyncSession, owner_id: int | None, query: ItemsQuery, page: Page
+) -> tuple[Sequence[Item], str | None]:
+    key = item_cursor_key(query.order, page)
+    statement = items_list_statement(
+        order=query.order,
+        descending=query.descending,
+        owner=owner_id is not None,
+        search=bool(query.q),
+        filters=tuple(query.filters),
+        cursor=key is not None or bool(page.after),
+    )
+    params = {
+        **page.params,
+        **query.filters,
+        "key": key,
+        "owner_id": owner_id,
+        "q": query.q,
+    }
+    result = await session.execute(statement, params)
+    if query.order == "id":
+        return page.rows(result.scalars().all())
+    return page.keyed_rows(result.tuples().all())
+
+
+async def count_items(
+    *,
+    session: AsyncSession,
+    owner_id: int | None,
+    mode: CountMode,
+    query: ItemsQuery | None = None,
+) -> tuple[int | None, CountMode]:
+    if query and (query.q or query.filters):
+        return await count_filtered_items(
+            session=session, owner_id=owner_id, mode=mode, query=query
+        )
+    params = {"owner_id": owner_id}
+    if mode == "estimated":
+        if owner_id is None:
+            result = await session.execute(items_estimate_statement)
+        else:
+            result = await session.execute(owner_items_estimate_statement, params)
+        return plan_rows(result.scalar_one()), mode
+    if mode == "cached":
+        if owner_id is None:
+            return (await session.exec(items_cached_count_statement)).one(), mode
+        cached = await session.exec(owner_items_cached_count_statement, params=params)
+        return cached.first() or 0, mode
+    if mode == "none":
+        return None, mode
+    if owner_id is None:
+        return (await session.exec(items_count_statement)).one(), mode
+    count = await session.exec(owner_items_count_statement, params=params)
+    return count.one(), mode
+
+
+async def count_filtered_items(
+    *, session: AsyncSession, owner_id: int | None, mode: CountMode, query: ItemsQuery
+) -> tuple[int | None, CountMode]:
+    shape = {
+        "owner": owner_id is not None,
+        "search": bool(query.q),
+        "filters": tuple(query.filters),
+    }
+    params = {**query.filters, "owner_id": owner_id, "q": query.q}
+    if mode in ("estimated", "cached"):
+        estimate = await session.execute(items_list_estimate_statement(**shape), params)
+        return plan_rows(estimate.scalar_one()), "estimated"
+    if mode == "none":
+        return None, mode
+    count = await session.exec(items_list_count_statement(**shape), params=params)
+    return count.one(), mode
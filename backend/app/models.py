@@ -1,5 +1,34 @@
+from datetime import datetime
+from typing import Literal
+
+from pydantic import field_validator
+from sqlalchemy import (
+    BigInteger,
+    Column,
+    Computed,
+    DateTime,
+    FetchedValue,
+    ForeignKey,
+    Index,
+    Integer,
+    LargeBinary,
+    String,
+    func,
+    text,
+)
+from sqlalchemy.dialects.postgresql import ARRAY, TSVECTOR
 from sqlmodel import Field, Relationship, SQLModel
 
+# How the count of a list response was obtained, "none" when it wasn't
+CountMode = Literal["exact", "estimated", "cached", "none"]
+# Sort orders of the items list, descending with a "-" prefix
+ItemSort = Literal["id", "-id", "title", "-title", "created_at", "-created_at"]
+
+
+def normalize_email(email: str | None) -> str | None:
+    """Emails are stored lowercase, and looked up with lower(email)."""
+    return email.strip().lower() if email is not None else None
+
 
 # Shared properties
 # TODO replace email str with EmailStr when sqlmodel supports it
@@ -9,6 +38,8 @@ class UserBase(SQLModel):
     is_superuser: bool = False
     full_name: str | None = None
 
+    _normalize_email = field_validator("email")(normalize_email)
+
 
 # Properties to receive via API on creation
 class UserCreate(UserBase):
@@ -21,6 +52,8 @@ class UserRegister(SQLModel):
     password: str
     full_name: str | None = None
 
+    _normalize_email = field_validator("email")(normalize_email)
+
 
 # Properties to receive via API on update, all are optional
 # TODO replace email str with EmailStr when sqlmodel supports it
@@ -34,6 +67,8 @@ class UserUpdateMe(SQLModel):
     full_name: str | None = None
     email: str | None = None
 
+    _normalize_email = field_validator("email")(normalize_email)
+
 
 class UpdatePassword(SQLModel):
     current_password: str
@@ -42,19 +77,38 @@ class UpdatePassword(SQLModel):
 
 # Database model, database table inferred from class name
 class User(UserBase, table=True):
+    # Makes emails that only differ by case duplicates, serves email lookups
+    __table_args__ = (Index("ix_user_email_lower", text("lower(email)"), unique=True),)
+    __mapper_args__ = {"eager_defaults": True}
+
     id: int | None = Field(default=None, primary_key=True)
     hashed_password: str
+    # Bumped to revoke every access token issued before
+    token_version: int = 0
+    # Deactivated and waiting for its items to be purged, see crud.purge_user
+    pending_deletion: bool = False
+    # Bumped by a trigger when the user changes, conditional updates compare
+    # it. Flushes read it back with RETURNING (eager_defaults)
+    version: int = Field(
+        default=0,
+        sa_column_kwargs={"server_default": "0", "server_onupdate": FetchedValue()},
+    )
     items: list["Item"] = Relationship(back_populates="owner")
 
 
 # Properties to return via API, id is always required
 class UserPublic(UserBase):
     id: int
+    pending_deletion: bool = False
+    version: int = 0
 
 
 class UsersPublic(SQLModel):
     data: list[UserPublic]
-    count: int
+    count: int | None
+    count_mode: CountMode = "exact"
+    has_more: bool = False
+    next_cursor: str | None = None
 
 
 # Shared properties
@@ -75,21 +129,149 @@ class ItemUpdate(ItemBase):
 
 # Database model, database table inferred from class name
 class Item(ItemBase, table=True):
+    __table_args__ = (
+        # Owner-scoped lists, counts and deletes
+        Index("ix_item_owner_id_id", "owner_id", "id"),
+        # Owner-scoped lists sorted by title or creation time, or filtered on it
+        Index("ix_item_owner_id_title", "owner_id", "title", "id"),
+        Index("ix_item_owner_id_created_at", "owner_id", "created_at", "id"),
+        # Lists of all items filtered on creation time: items are only appended,
+        # so created_at follows the table order and a block range index is
+        # enough, at a fraction of the size of a btree
+        Index("ix_item_created_at_brin", "created_at", postgresql_using="brin"),
+    )
+    __mapper_args__ = {"eager_defaults": True}
+
     id: int | None = Field(default=None, primary_key=True)
     title: str
     owner_id: int | None = Field(default=None, foreign_key="user.id", nullable=False)
+    # Set by Postgres, updated_at by a trigger on the rows an update changes
+    created_at: datetime | None = Field(
+        default=None,
+        sa_column=Column(
+            DateTime(timezone=True), nullable=False, server_default=func.now()
+        ),
+    )
+    updated_at: datetime | None = Field(
+        default=None,
+        sa_column=Column(
+            DateTime(timezone=True),
+            nullable=False,
+            server_default=func.now(),
+            server_onupdate=FetchedValue(),
+        ),
+    )
+    # Same as User.version
+    version: int = Field(
+        default=0,
+        sa_column_kwargs={"server_default": "0", "server_onupdate": FetchedValue()},
+    )
     owner: User | None = Relationship(back_populates="items")
 
 
+# Matched by the search of the items list, Postgres generates it from the
+# title, ranked higher, and the description. It isn't mapped, so loading items
+# doesn't read it
+item_search_vector = Column(
+    "search_vector",
+    TSVECTOR,
+    Computed(
+        "setweight(to_tsvector('english', title), 'A') || "
+        "setweight(to_tsvector('english', coalesce(description, '')), 'B')",
+        persisted=True,
+    ),
+)
+Item.__table__.append_column(item_search_vector)  # type: ignore[attr-defined]
+Index("ix_item_search_vector", item_search_vector, postgresql_using="gin")
+
+
 # Properties to return via API, id is always required
 class ItemPublic(ItemBase):
     id: int
     owner_id: int
+    created_at: datetime
+    updated_at: datetime
+    version: int
 
 
 class ItemsPublic(SQLModel):
     data: list[ItemPublic]
-    count: int
+    count: int | None
+    count_mode: CountMode = "exact"
+    has_more: bool = False
+    next_cursor: str | None = None
+
+
+# Search, filters and sort order of the items list
+class ItemsQuery(SQLModel):
+    q: str | None = None
+    sort: ItemSort | None = None
+    created_after: datetime | None = None
+    created_before: datetime | None = None
+    updated_after: datetime | None = None
+    updated_before: datetime | None = None
+
+    @property
+    def order(self) -> str:
+        """Key the items are ordered by, then by id, search results by rank."""
+        if self.sort:
+            return self.sort.lstrip("-")
+        return "rank" if self.q else "id"
+
+    @property
+    def descending(self) -> bool:
+        return self.sort.startswith("-") if self.sort else bool(self.q)
+
+    @property
+    def filters(self) -> dict[str, datetime]:
+        return self.model_dump(exclude={"q", "sort"}, exclude_none=True)
+
+
+# Batch requests, at most MAX_BATCH_SIZE operations each
+class ItemsCreate(SQLModel):
+    data: list[ItemCreate]
+
+
+class ItemBatchUpdate(ItemUpdate):
+    id: int
+
+
+class ItemsUpdate(SQLModel):
+    data: list[ItemBatchUpdate]
+
+
+class ItemsDelete(SQLModel):
+    ids: list[int]
+
+
+# Outcome of one operation of a batch, with the status of the single-item route
+class ItemBatchResult(SQLModel):
+    id: int
+    status: int
+    detail: str | None = None
+    item: ItemPublic | None = None
+
+
+class ItemsBatchPublic(SQLModel):
+    data: list[ItemBatchResult]
+
+
+# Per-owner item counters, kept up to date by the crud functions
+class ItemStats(SQLModel, table=True):
+    owner_id: int = Field(
+        sa_column=Column(
+            Integer, ForeignKey("user.id", ondelete="CASCADE"), primary_key=True
+        )
+    )
+    item_count: int = 0
+    # Bumped by every write to the owner's items: the validators of their list
+    revision: int = Field(default=0, sa_column_kwargs={"server_default": "0"})
+    modified_at: datetime | None = Field(
+        default=None,
+        sa_column=Column(
+            DateTime(timezone=True), nullable=False, server_default=func.now()
+        ),
+    )
 
 
 # Generic message
@@ -106,8 +288,76 @@ class Token(SQLModel):
 # Contents of JWT token
 class TokenPayload(SQLModel):
     sub: int | None = None
+    ver: int = 0
+    # Authorization claims, only present when ACCESS_TOKEN_CLAIMS is enabled
+    email: str | None = None
+    act: bool | None = None
+    su: bool | None = None
 
 
 class NewPassword(SQLModel):
     token: str
     new_password: str
+
+
+# Failed login token bucket, used by the postgres login throttle backend
+class LoginThrottleBucket(SQLModel, table=True):
+    key: str = Field(primary_key=True)
+    tokens: float = 0.0
+    updated_at: float = 0.0
+    lockouts: int = 0
+    locked_until: float = 0.0
+
+
+# Token version of a user that revoked their tokens, kept after the user is
+# deleted until every revoked token expired, see core.principals
+class TokenRevocation(SQLModel, table=True):
+    user_id: int = Field(primary_key=True)
+    token_version: int
+    revoked_at: datetime = Field(
+        sa_column=Column(
+            DateTime(timezone=True),
+            nullable=False,
+            server_default=func.now(),
+            index=True,
+        ),
+    )
+
+
+# Cached API response, used by the postgres response cache backend
+class ResponseCacheEntry(SQLModel, table=True):
+    __table_args__ = (
+        # Invalidations delete the entries stored with any of their tags
+        Index("ix_responsecacheentry_tags", "tags", postgresql_using="gin"),
+        {"prefixes": ["UNLOGGED"]},
+    )
+
+    key: str = Field(primary_key=True)
+    tags: list[str] = Field(sa_column=Column(ARRAY(String), nullable=False))
+    owner_id: int | None = None
+    etag: str | None = None
+    last_modified: datetime | None = Field(
+        default=None, sa_column=Column(DateTime(timezone=True))
+    )
+    body: bytes = Field(sa_column=Column(LargeBinary, nullable=False))
+    expires_at: datetime = Field(
+        sa_column=Column(DateTime(timezone=True), nullable=False, index=True)
+    )
+
+
+# Last invalidation of a response cache tag, puts lock the rows of their tags
+# and skip the responses read before one
+class ResponseCacheTag(SQLModel, table=True):
+    __table_args__ = {"prefixes": ["UNLOGGED"]}
+
+    tag: str = Field(primary_key=True)
+    # Transaction of the last invalidation, 0 for none
+    invalidated_by: int = Field(sa_column=Column(BigInteger, nullable=False))
+    invalidated_at: datetime = Field(
+        sa_column=Column(
+            DateTime(timezone=True),
+            nullable=False,
+            server_default=func.now(),
+            index=True,
+        ),
+    )
@@ -0,0 +1,14 @@
+import logging
+
+from app.core.purges import purge_pending_users
+
+logging.basicConfig(level=logging.INFO)
+
+
+def main() -> None:
+    """Finish the deletions that were interrupted, e.g. by a restart."""
+    purge_pending_users()
+
+
+if __name__ == "__main__":
+    main()
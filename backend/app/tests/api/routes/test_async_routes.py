@@ -0,0 +1,225 @@
+from collections.abc import Generator
+from unittest.mock import patch
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlmodel import Session, col, delete
+
+from app.api.routes import items_async, login_async
+from app.core.config import settings
+from app.core.db import async_engine
+from app.core.response_cache import response_cache
+from app.core.throttle import BucketPolicy, LoginThrottle, PostgresThrottleBackend
+from app.models import Item, LoginThrottleBucket
+from app.tests.utils.item import create_random_item
+from app.tests.utils.utils import random_email
+
+async_app = FastAPI()
+async_app.include_router(login_async.router, prefix=settings.API_V1_STR)
+async_app.include_router(items_async.router, prefix=f"{settings.API_V1_STR}/items")
+
+
+@pytest.fixture(scope="module")
+def client() -> Generator[TestClient, None, None]:
+    with TestClient(async_app) as c:
+        yield c
+        # Pooled connections belong to the client's event loop
+        assert c.portal is not None
+        c.portal.call(async_engine.dispose)
+
+
+def test_async_login_and_test_token(
+    client: TestClient, superuser_token_headers: dict[str, str]
+) -> None:
+    r = client.post(
+        f"{settings.API_V1_STR}/login/test-token", headers=superuser_token_headers
+    )
+    assert r.status_code == 200
+    assert r.json()["email"] == settings.FIRST_SUPERUSER
+
+
+def test_async_login_incorrect_password(client: TestClient) -> None:
+    r = client.post(
+        f"{settings.API_V1_STR}/login/access-token",
+        data={"username": settings.FIRST_SUPERUSER, "password": "incorrect"},
+    )
+    assert r.status_code == 400
+
+
+def test_async_login_postgres_throttle(client: TestClient, db: Session) -> None:
+    policy = BucketPolicy(
+        capacity=2, refill_seconds=60, lockout_seconds=60, max_lockout_seconds=60
+    )
+    throttle = LoginThrottle(
+        PostgresThrottleBackend(), ip_policy=policy, email_policy=policy
+    )
+    email = random_email()
+    # The test client has the same IP in every test
+    ip_buckets = delete(LoginThrottleBucket).where(
+        col(LoginThrottleBucket.key).startswith("ip:")
+    )
+    db.execute(ip_buckets)
+    db.commit()
+    with patch("app.api.routes.login_async.login_throttle", throttle):
+        for status_code in (400, 400, 429):
+            r = client.post(
+                f"{settings.API_V1_STR}/login/access-token",
+                data={"username": email, "password": "incorrect"},
+            )
+            assert r.status_code == status_code
+    assert db.get(LoginThrottleBucket, f"email:{email}")
+    db.execute(ip_buckets)
+    db.commit()
+
+
+def test_async_items_crud(
+    client: TestClient, superuser_token_headers: dict[str, str], db: Session
+) -> None:
+    r = client.post(
+        f"{settings.API_V1_STR}/items/",
+        headers=superuser_token_headers,
+        json={"title": "Foo", "description": "Fighters"},
+    )
+    assert r.status_code == 200
+    item_id = r.json()["id"]
+
+    r = client.put(
+        f"{settings.API_V1_STR}/items/{item_id}",
+        headers=superuser_token_headers,
+        json={"title": "Bar"},
+    )
+    assert r.status_code == 200
+    assert r.json()["title"] == "Bar"
+    assert r.json()["description"] == "Fighters"
+    assert r.headers["ETag"] == f'"{item_id}-1"'
+
+    r = client.put(
+        f"{settings.API_V1_STR}/items/{item_id}",
+        headers={**superuser_token_headers, "If-Match": f'"{item_id}-0"'},
+        json={"title": "Baz"},
+    )
+    assert r.status_code == 409
+
+    r = client.get(f"{settings.API_V1_STR}/items/", headers=superuser_token_headers)
+    assert r.status_code == 200
+    assert item_id in [item["id"] for item in r.json()["data"]]
+
+    r = client.delete(
+        f"{settings.API_V1_STR}/items/{item_id}", headers=superuser_token_headers
+    )
+    assert r.status_code == 200
+    assert db.get(Item, item_id) is None
+
+
+def test_async_search_items(
+    client: TestClient, superuser_token_headers: dict[str, str], db: Session
+) -> None:
+    item = create_random_item(db)
+    r = client.get(
+        f"{settings.API_V1_STR}/items/",
+        headers=superuser_token_headers,
+        params={"q": item.title, "count_mode": "estimated"},
+    )
+    assert r.status_code == 200
+    content = r.json()
+    assert [data["id"] for data in content["data"]] == [item.id]
+    assert content["count_mode"] == "estimated"
+
+
+def test_async_read_items_sorted(
+    client: TestClient, superuser_token_headers: dict[str, str], db: Session
+) -> None:
+    first, second = create_random_item(db), create_random_item(db)
+    assert first.created_at is not None
+    r = client.get(
+        f"{settings.API_V1_STR}/items/",
+        headers=superuser_token_headers,
+        params={"sort": "-created_at", "created_after": first.created_at.isoformat()},
+    )
+    assert r.status_code == 200
+    assert [data["id"] for data in r.json()["data"]][-2:] == [second.id, first.id]
+
+
+def test_async_read_items_not_modified(
+    client: TestClient, normal_user_token_headers: dict[str, str]
+) -> None:
+    url = f"{settings.API_V1_STR}/items/"
+    r = client.get(url, headers=normal_user_token_headers)
+    r = client.get(
+        url,
+        headers={**normal_user_token_headers, "If-None-Match": r.headers["ETag"]},
+    )
+    assert r.status_code == 304
+
+
+@pytest.mark.skipif(response_cache.blocking, reason="The cache queries Postgres")
+def test_async_read_item_memory_cache_in_event_loop(
+    client: TestClient, superuser_token_headers: dict[str, str], db: Session
+) -> None:
+    item = create_random_item(db)
+    url = f"{settings.API_V1_STR}/items/{item.id}"
+    with patch("app.api.deps.run_in_threadpool") as run_in_threadpool:
+        r = client.get(url, headers=superuser_token_headers)
+        assert r.status_code == 200
+        r = client.get(url, headers=superuser_token_headers)
+        assert r.status_code == 200
+    run_in_threadpool.assert_not_called()
+
+
+def test_async_read_item_not_enough_permissions(
+    client: TestClient, normal_user_token_headers: dict[str, str], db: Session
+) -> None:
+    item = create_random_item(db)
+    r = client.get(
+        f"{settings.API_V1_STR}/items/{item.id}", headers=normal_user_token_headers
+    )
+    assert r.status_code == 400
+    assert r.json()["detail"] == "Not enough permissions"
+
+
+def test_async_items_batch(
+    client: TestClient, normal_user_token_headers: dict[str, str], db: Session
+) -> None:
+    r = client.post(
+        f"{settings.API_V1_STR}/items/batch",
+        headers=normal_user_token_headers,
+        json={"data": [{"title": "Foo"}, {"title": "Bar"}]},
+    )
+    assert r.status_code == 200
+    ids = [result["id"] for result in r.json()["data"]]
+    other_item = create_random_item(db)
+
+    r = client.put(
+        f"{settings.API_V1_STR}/items/batch",
+        headers=normal_user_token_headers,
+        json={"data": [{"id": ids[0], "title": "Baz"}, {"id": other_item.id}]},
+    )
+    assert r.status_code == 200
+    results = r.json()["data"]
+    assert [result["status"] for result in results] == [200, 400]
+    assert results[0]["item"]["title"] == "Baz"
+
+    r = client.post(
+        f"{settings.API_V1_STR}/items/batch/delete",
+        headers=normal_user_token_headers,
+        json={"ids": [*ids, other_item.id]},
+    )
+    assert r.status_code == 200
+    assert [result["status"] for result in r.json()["data"]] == [200, 200, 400]
+    assert db.get(Item, ids[0]) is None
+
+
+def test_async_export_items(
+    client: TestClient, superuser_token_headers: dict[str, str], db: Session
+) -> None:
+    item = create_random_item(db)
+    r = client.get(
+        f"{settings.API_V1_STR}/items/export",
+        headers=superuser_token_headers,
+        params={"format": "csv"},
+    )
+    assert r.status_code == 200
+    lines = r.text.splitlines()
+    assert lines[0] == "id,title,description,owner_id"
+    assert f"{item.id},{item.title},{item.description},{item.owner_id}" in lines
@@ -1,8 +1,19 @@
+import csv
+import io
+import json
+from typing import Any
+from unittest.mock import patch
+
 from fastapi.testclient import TestClient
 from sqlmodel import Session
 
+from app import crud
 from app.core.config import settings
+from app.core.pagination import encode_cursor
+from app.core.response_cache import response_cache
+from app.models import Item
 from app.tests.utils.item import create_random_item
+from app.tests.utils.utils import random_lower_string
 
 
 def test_create_item(
@@ -38,6 +49,50 @@ def test_read_item(
     assert content["owner_id"] == item.owner_id
 
 
+def test_read_item_not_modified(
+    client: TestClient, superuser_token_headers: dict[str, str], db: Session
+) -> None:
+    item = create_random_item(db)
+    url = f"{settings.API_V1_STR}/items/{item.id}"
+    response = client.get(url, headers=superuser_token_headers)
+    etag = response.headers["ETag"]
+    last_modified = response.headers["Last-Modified"]
+    for conditions in ({"If-None-Match": etag}, {"If-Modified-Since": last_modified}):
+        response = client.get(url, headers={**superuser_token_headers, **conditions})
+        assert response.status_code == 304
+        assert response.content == b""
+        assert response.headers["ETag"] == etag
+    client.put(url, headers=superuser_token_headers, json={"title": "Updated"})
+    response = client.get(
+        url, headers={**superuser_token_headers, "If-None-Match": etag}
+    )
+    assert response.status_code == 200
+    assert response.json()["title"] == "Updated"
+    assert response.headers["ETag"] != etag
+
+
+def test_read_item_cached(
+    client: TestClient,
+    superuser_token_headers: dict[str, str],
+    normal_user_token_headers: dict[str, str],
+    db: Session,
+) -> None:
+    item = create_random_item(db)
+    url = f"{settings.API_V1_STR}/items/{item.id}"
+    first = client.get(url, headers=superuser_token_headers)
+    hits = response_cache.stats().hits
+    second = client.get(url, headers=superuser_token_headers)
+    assert second.content == first.content
+    assert second.headers["ETag"] == first.headers["ETag"]
+    assert response_cache.stats().hits == hits + 1
+    # Cached responses are still checked against the user
+    response = client.get(url, headers=normal_user_token_headers)
+    assert response.status_code == 400
+    client.put(url, headers=superuser_token_headers, json={"title": "Updated"})
+    response = client.get(url, headers=superuser_token_headers)
+    assert response.json()["title"] == "Updated"
+
+
 def test_read_item_not_found(
     client: TestClient, superuser_token_headers: dict[str, str]
 ) -> None:
@@ -77,6 +132,244 @@ def test_read_items(
     assert len(content["data"]) >= 2
 
 
+def test_read_items_not_modified(
+    client: TestClient, normal_user_token_headers: dict[str, str]
+) -> None:
+    url = f"{settings.API_V1_STR}/items/"
+    client.post(url, headers=normal_user_token_headers, json={"title": "Polled"})
+    response = client.get(url, headers=normal_user_token_headers)
+    etag = response.headers["ETag"]
+    conditional_headers = {**normal_user_token_headers, "If-None-Match": etag}
+    response = client.get(url, headers=conditional_headers)
+    assert response.status_code == 304
+    # Each query string is its own list
+    response = client.get(url, headers=conditional_headers, params={"limit": 1})
+    assert response.status_code == 200
+    item_id = response.json()["data"][0]["id"]
+    client.put(
+        f"{url}{item_id}", headers=normal_user_token_headers, json={"title": "New"}
+    )
+    response = client.get(url, headers=conditional_headers)
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
+
+
+def test_read_items_cached(
+    client: TestClient, normal_user_token_headers: dict[str, str]
+) -> None:
+    url = f"{settings.API_V1_STR}/items/"
+    params = {"sort": "-id", "limit": "5"}
+    first = client.get(url, headers=normal_user_token_headers, params=params)
+    hits = response_cache.stats().hits
+    second = client.get(url, headers=normal_user_token_headers, params=params)
+    assert second.content == first.content
+    assert response_cache.stats().hits == hits + 1
+    response = client.post(
+        url, headers=normal_user_token_headers, json={"title": "Fresh"}
+    )
+    third = client.get(url, headers=normal_user_token_headers, params=params)
+    assert third.json()["data"][0]["id"] == response.json()["id"]
+
+
+def test_read_items_superuser_without_validators(
+    client: TestClient, superuser_token_headers: dict[str, str]
+) -> None:
+    response = client.get(
+        f"{settings.API_V1_STR}/items/",
+        headers={**superuser_token_headers, "If-None-Match": "*"},
+    )
+    assert response.status_code == 200
+    assert "ETag" not in response.headers
+
+
+def test_read_items_with_cursor(
+    client: TestClient, normal_user_token_headers: dict[str, str]
+) -> None:
+    for i in range(3):
+        r = client.post(
+            f"{settings.API_V1_STR}/items/",
+            headers=normal_user_token_headers,
+            json={"title": f"Page item {i}"},
+        )
+        assert r.status_code == 200
+    ids = []
+    cursor = None
+    while True:
+        params: dict[str, str | int] = {"limit": 2}
+        if cursor:
+            params["cursor"] = cursor
+        r = client.get(
+            f"{settings.API_V1_STR}/items/",
+            headers=normal_user_token_headers,
+            params=params,
+        )
+        assert r.status_code == 200
+        content = r.json()
+        assert len(content["data"]) <= 2
+        ids += [item["id"] for item in content["data"]]
+        cursor = content["next_cursor"]
+        if not cursor:
+            break
+    assert ids == sorted(ids)
+    assert len(ids) == content["count"]
+
+    r = client.get(
+        f"{settings.API_V1_STR}/items/",
+        headers=normal_user_token_headers,
+        params={"skip": 1, "limit": 2},
+    )
+    assert [item["id"] for item in r.json()["data"]] == ids[1:3]
+
+
+def test_read_items_without_count(
+    client: TestClient, superuser_token_headers: dict[str, str], db: Session
+) -> None:
+    create_random_item(db)
+    create_random_item(db)
+    r = client.get(
+        f"{settings.API_V1_STR}/items/",
+        headers=superuser_token_headers,
+        params={"count_mode": "none", "limit": 1},
+    )
+    assert r.status_code == 200
+    content = r.json()
+    assert content["count"] is None
+    assert content["count_mode"] == "none"
+    assert content["has_more"] is True
+
+
+def test_read_items_invalid_cursor(
+    client: TestClient, superuser_token_headers: dict[str, str]
+) -> None:
+    r = client.get(
+        f"{settings.API_V1_STR}/items/",
+        headers=superuser_token_headers,
+        params={"cursor": "not-a-cursor"},
+    )
+    assert r.status_code == 400
+    assert r.json()["detail"] == "Invalid cursor"
+
+
+def test_read_items_sorted_and_filtered(
+    client: TestClient, normal_user_token_headers: dict[str, str]
+) -> None:
+    created = []
+    for title in ("Sorted b", "Sorted a", "Sorted c"):
+        r = client.post(
+            f"{settings.API_V1_STR}/items/",
+            headers=normal_user_token_headers,
+            json={"title": title},
+        )
+        assert r.status_code == 200
+        created.append(r.json())
+    created_after = created[0]["created_at"]
+    titles = []
+    cursor = None
+    while True:
+        params = {"sort": "-created_at", "created_after": created_after, "limit": 2}
+        if cursor:
+            params["cursor"] = cursor
+        r = client.get(
+            f"{settings.API_V1_STR}/items/",
+            headers=normal_user_token_headers,
+            params=params,
+        )
+        assert r.status_code == 200
+        content = r.json()
+        assert content["count"] == 3
+        titles += [item["title"] for item in content["data"]]
+        if not content["next_cursor"]:
+            break
+        cursor = content["next_cursor"]
+    assert titles == ["Sorted c", "Sorted a", "Sorted b"]
+
+    r = client.get(
+        f"{settings.API_V1_STR}/items/",
+        headers=normal_user_token_headers,
+        params={"sort": "title", "created_after": created_after},
+    )
+    assert [item["title"] for item in r.json()["data"]] == [
+        "Sorted a",
+        "Sorted b",
+        "Sorted c",
+    ]
+
+    r = client.get(
+        f"{settings.API_V1_STR}/items/",
+        headers=normal_user_token_headers,
+        params={
+            "created_after": created_after,
+            "created_before": created[2]["created_at"],
+        },
+    )
+    assert [item["title"] for item in r.json()["data"]] == ["Sorted b", "Sorted a"]
+
+    # A cursor only pages through the order it came from
+    r = client.get(
+        f"{settings.API_V1_STR}/items/",
+        headers=normal_user_token_headers,
+        params={"cursor": cursor},
+    )
+    assert r.status_code == 400
+
+
+def test_search_items(
+    client: TestClient, normal_user_token_headers: dict[str, str]
+) -> None:
+    word = random_lower_string()
+    items = [
+        {"title": "Described", "description": f"About {word}"},
+        {"title": f"Titled {word}"},
+        {"title": "Unrelated", "description": "Nothing to see"},
+    ]
+    for item in items:
+        r = client.post(
+            f"{settings.API_V1_STR}/items/",
+            headers=normal_user_token_headers,
+            json=item,
+        )
+        assert r.status_code == 200
+    titles = []
+    cursor = None
+    while True:
+        params: dict[str, str | int] = {"q": word, "limit": 1}
+        if cursor:
+            params["cursor"] = cursor
+        r = client.get(
+            f"{settings.API_V1_STR}/items/",
+            headers=normal_user_token_headers,
+            params=params,
+        )
+        assert r.status_code == 200
+        content = r.json()
+        assert content["count"] == 2
+        titles += [item["title"] for item in content["data"]]
+        cursor = content["next_cursor"]
+        if not cursor:
+            break
+    # Title matches rank above description matches
+    assert titles == [f"Titled {word}", "Described"]
+
+    r = client.get(
+        f"{settings.API_V1_STR}/items/",
+        headers=normal_user_token_headers,
+        params={"q": f"{word} -titled"},
+    )
+    assert [item["title"] for item in r.json()["data"]] == ["Described"]
+
+
+def test_search_items_with_list_cursor(
+    client: TestClient, normal_user_token_headers: dict[str, str]
+) -> None:
+    r = client.get(
+        f"{settings.API_V1_STR}/items/",
+        headers=normal_user_token_headers,
+        params={"q": "anything", "cursor": encode_cursor([1])},
+    )
+    assert r.status_code == 400
+    assert r.json()["detail"] == "Invalid cursor"
+
+
 def test_update_item(
     client: TestClient, superuser_token_headers: dict[str, str], db: Session
 ) -> None:
@@ -95,6 +388,58 @@ def test_update_item(
     assert content["owner_id"] == item.owner_id
 
 
+def test_update_item_if_match(
+    client: TestClient, superuser_token_headers: dict[str, str], db: Session
+) -> None:
+    item = create_random_item(db)
+    url = f"{settings.API_V1_STR}/items/{item.id}"
+    response = client.get(url, headers=superuser_token_headers)
+    etag = response.headers["ETag"]
+    assert etag == f'"{item.id}-{item.version}"'
+    response = client.put(
+        url,
+        headers={**superuser_token_headers, "If-Match": etag},
+        json={"title": "First"},
+    )
+    assert response.status_code == 200
+    assert response.json()["version"] == item.version + 1
+    assert response.headers["ETag"] == f'"{item.id}-{item.version + 1}"'
+    # Another writer updated the item since the client read it
+    response = client.put(
+        url,
+        headers={**superuser_token_headers, "If-Match": etag},
+        json={"title": "Second"},
+    )
+    assert response.status_code == 409
+    assert response.json()["detail"] == "The item was changed since that version"
+    db.refresh(item)
+    assert item.title == "First"
+
+
+def test_update_item_invalid_if_match(
+    client: TestClient, superuser_token_headers: dict[str, str], db: Session
+) -> None:
+    item = create_random_item(db)
+    response = client.put(
+        f"{settings.API_V1_STR}/items/{item.id}",
+        headers={**superuser_token_headers, "If-Match": "W/1"},
+        json={"title": "Updated title"},
+    )
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Invalid If-Match header"
+    # The ETag of another item
+    other_item = create_random_item(db)
+    response = client.put(
+        f"{settings.API_V1_STR}/items/{item.id}",
+        headers={
+            **superuser_token_headers,
+            "If-Match": f'"{other_item.id}-{item.version}"',
+        },
+        json={"title": "Updated title"},
+    )
+    assert response.status_code == 409
+
+
 def test_update_item_not_found(
     client: TestClient, superuser_token_headers: dict[str, str]
 ) -> None:
@@ -160,3 +505,207 @@ def test_delete_item_not_enough_permissions(
     assert response.status_code == 400
     content = response.json()
     assert content["detail"] == "Not enough permissions"
+
+
+def test_create_items_batch(
+    client: TestClient, normal_user_token_headers: dict[str, str]
+) -> None:
+    data = {"data": [{"title": "Foo"}, {"title": "Bar", "description": "Baz"}]}
+    response = client.post(
+        f"{settings.API_V1_STR}/items/batch",
+        headers=normal_user_token_headers,
+        json=data,
+    )
+    assert response.status_code == 200
+    results = response.json()["data"]
+    assert [result["status"] for result in results] == [200, 200]
+    assert [result["item"]["title"] for result in results] == ["Foo", "Bar"]
+    assert results[1]["item"]["description"] == "Baz"
+    assert results[0]["id"] == results[0]["item"]["id"]
+
+
+def test_create_items_batch_too_large(
+    client: TestClient, normal_user_token_headers: dict[str, str]
+) -> None:
+    data = {"data": [{"title": "Foo"}] * (settings.MAX_BATCH_SIZE + 1)}
+    response = client.post(
+        f"{settings.API_V1_STR}/items/batch",
+        headers=normal_user_token_headers,
+        json=data,
+    )
+    assert response.status_code == 400
+
+
+def test_update_items_batch(
+    client: TestClient, normal_user_token_headers: dict[str, str], db: Session
+) -> None:
+    response = client.post(
+        f"{settings.API_V1_STR}/items/batch",
+        headers=normal_user_token_headers,
+        json={"data": [{"title": "Foo"}, {"title": "Bar", "description": "Baz"}]},
+    )
+    own_ids = [result["id"] for result in response.json()["data"]]
+    other_item = create_random_item(db)
+    data = {
+        "data": [
+            {"id": own_ids[0], "title": "Updated"},
+            {"id": own_ids[1], "description": None},
+            {"id": other_item.id, "title": "Updated"},
+            {"id": 999, "title": "Updated"},
+        ]
+    }
+    response = client.put(
+        f"{settings.API_V1_STR}/items/batch",
+        headers=normal_user_token_headers,
+        json=data,
+    )
+    assert response.status_code == 200
+    results = response.json()["data"]
+    assert [result["status"] for result in results] == [200, 200, 400, 404]
+    assert results[0]["item"]["title"] == "Updated"
+    item = results[1]["item"]
+    # Set by the update trigger
+    assert item.pop("updated_at") != item.pop("created_at")
+    assert item == {
+        "id": own_ids[1],
+        "title": "Bar",
+        "description": None,
+        "owner_id": results[0]["item"]["owner_id"],
+        "version": 1,
+    }
+    assert results[2]["detail"] == "Not enough permissions"
+    assert results[3]["detail"] == "Item not found"
+    db.refresh(other_item)
+    assert other_item.title != "Updated"
+
+
+def test_update_items_batch_item_deleted_meanwhile(
+    client: TestClient, superuser_token_headers: dict[str, str], db: Session
+) -> None:
+    item = create_random_item(db)
+    with patch("app.api.routes.items.crud.update_items", return_value={}):
+        response = client.put(
+            f"{settings.API_V1_STR}/items/batch",
+            headers=superuser_token_headers,
+            json={"data": [{"id": item.id, "title": "Updated"}]},
+        )
+    assert response.status_code == 200
+    [result] = response.json()["data"]
+    assert result["status"] == 404
+    assert result["detail"] == "Item not found"
+
+
+def test_delete_items_batch(
+    client: TestClient, normal_user_token_headers: dict[str, str], db: Session
+) -> None:
+    response = client.post(
+        f"{settings.API_V1_STR}/items/batch",
+        headers=normal_user_token_headers,
+        json={"data": [{"title": "Foo"}, {"title": "Bar"}]},
+    )
+    own_ids = [result["id"] for result in response.json()["data"]]
+    other_item = create_random_item(db)
+    response = client.get(
+        f"{settings.API_V1_STR}/items/",
+        headers=normal_user_token_headers,
+        params={"count_mode": "cached"},
+    )
+    count = response.json()["count"]
+    response = client.post(
+        f"{settings.API_V1_STR}/items/batch/delete",
+        headers=normal_user_token_headers,
+        json={"ids": [*own_ids, own_ids[0], other_item.id]},
+    )
+    assert response.status_code == 200
+    results = response.json()["data"]
+    assert [result["status"] for result in results] == [200, 200, 404, 400]
+    response = client.get(
+        f"{settings.API_V1_STR}/items/",
+        headers=normal_user_token_headers,
+        params={"count_mode": "cached"},
+    )
+    assert response.json()["count"] == count - 2
+    assert db.get(Item, other_item.id)
+
+
+def test_delete_items_batch_item_deleted_meanwhile(
+    client: TestClient, normal_user_token_headers: dict[str, str], db: Session
+) -> None:
+    response = client.post(
+        f"{settings.API_V1_STR}/items/batch",
+        headers=normal_user_token_headers,
+        json={"data": [{"title": "Foo"}, {"title": "Bar"}]},
+    )
+    own_ids = [result["id"] for result in response.json()["data"]]
+    get_items = crud.get_items
+
+    def get_items_then_delete_one(**kwargs: Any) -> dict[int, Item]:
+        items = get_items(**kwargs)
+        # Another request deletes it before this one does
+        assert crud.delete_item(session=db, id=own_ids[0])
+        return items
+
+    with patch(
+        "app.api.routes.items.crud.get_items", side_effect=get_items_then_delete_one
+    ):
+        response = client.post(
+            f"{settings.API_V1_STR}/items/batch/delete",
+            headers=normal_user_token_headers,
+            json={"ids": own_ids},
+        )
+    assert response.status_code == 200
+    results = response.json()["data"]
+    assert [result["status"] for result in results] == [404, 200]
+    counts = {
+        count_mode: client.get(
+            f"{settings.API_V1_STR}/items/",
+            headers=normal_user_token_headers,
+            params={"count_mode": count_mode},
+        ).json()["count"]
+        for count_mode in ("cached", "exact")
+    }
+    assert counts["cached"] == counts["exact"]
+
+
+def test_export_items(
+    client: TestClient, normal_user_token_headers: dict[str, str], db: Session
+) -> None:
+    response = client.post(
+        f"{settings.API_V1_STR}/items/batch",
+        headers=normal_user_token_headers,
+        json={"data": [{"title": "Foo"}, {"title": "Bar", "description": "a\nb"}]},
+    )
+    own_ids = [result["id"] for result in response.json()["data"]]
+    other_item = create_random_item(db)
+    response = client.get(
+        f"{settings.API_V1_STR}/items/export", headers=normal_user_token_headers
+    )
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/x-ndjson"
+    rows = [json.loads(line) for line in response.text.splitlines()]
+    ids = [row["id"] for row in rows]
+    assert set(own_ids) <= set(ids)
+    assert other_item.id not in ids
+    assert ids == sorted(ids)
+    assert len({row["owner_id"] for row in rows}) == 1
+    assert rows[ids.index(own_ids[1])]["description"] == "a\nb"
+
+
+def test_export_items_csv(
+    client: TestClient, superuser_token_headers: dict[str, str], db: Session
+) -> None:
+    item = create_random_item(db)
+    response = client.get(
+        f"{settings.API_V1_STR}/items/export",
+        headers=superuser_token_headers,
+        params={"format": "csv"},
+    )
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/csv")
+    rows = list(csv.DictReader(io.StringIO(response.text)))
+    assert {
+        "id": str(item.id),
+        "title": item.title,
+        "description": item.description,
+        "owner_id": str(item.owner_id),
+    } in rows
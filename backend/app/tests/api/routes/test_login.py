@@ -1,8 +1,16 @@
 from unittest.mock import patch
 
 from fastapi.testclient import TestClient
+from jose import jwt
+from sqlmodel import Session
 
+from app import crud
+from app.core import security
 from app.core.config import settings
+from app.core.throttle import BucketPolicy, LoginThrottle, MemoryThrottleBackend
+from app.models import UserCreate
+from app.tests.utils.user import user_authentication_headers
+from app.tests.utils.utils import random_email, random_lower_string
 from app.utils import generate_password_reset_token
 
 
@@ -27,6 +35,32 @@ def test_get_access_token_incorrect_password(client: TestClient) -> None:
     assert r.status_code == 400
 
 
+def test_get_access_token_throttled(client: TestClient) -> None:
+    policy = BucketPolicy(
+        capacity=2, refill_seconds=60, lockout_seconds=60, max_lockout_seconds=60
+    )
+    throttle = LoginThrottle(
+        MemoryThrottleBackend(), ip_policy=policy, email_policy=policy
+    )
+    login_data = {
+        "username": settings.FIRST_SUPERUSER,
+        "password": "incorrect",
+    }
+    with patch("app.api.routes.login.login_throttle", throttle):
+        for _ in range(2):
+            r = client.post(
+                f"{settings.API_V1_STR}/login/access-token", data=login_data
+            )
+            assert r.status_code == 400
+        with patch("app.crud.authenticate") as authenticate:
+            r = client.post(
+                f"{settings.API_V1_STR}/login/access-token", data=login_data
+            )
+            assert not authenticate.called
+        assert r.status_code == 429
+        assert r.headers["Retry-After"] == "60"
+
+
 def test_use_access_token(
     client: TestClient, superuser_token_headers: dict[str, str]
 ) -> None:
@@ -39,6 +73,65 @@ def test_use_access_token(
     assert "email" in result
 
 
+def test_use_access_token_returns_user(client: TestClient, db: Session) -> None:
+    email = random_email()
+    password = random_lower_string()
+    user = crud.create_user(
+        session=db,
+        user_create=UserCreate(email=email, password=password, full_name="Full Name"),
+    )
+    headers = user_authentication_headers(client=client, email=email, password=password)
+    r = client.post(f"{settings.API_V1_STR}/login/test-token", headers=headers)
+    assert r.status_code == 200
+    assert r.json()["full_name"] == "Full Name"
+    assert r.json()["version"] == user.version
+
+
+def test_logout_everywhere(client: TestClient, db: Session) -> None:
+    email = random_email()
+    password = random_lower_string()
+    crud.create_user(session=db, user_create=UserCreate(email=email, password=password))
+    headers = user_authentication_headers(client=client, email=email, password=password)
+
+    r = client.post(f"{settings.API_V1_STR}/logout-everywhere", headers=headers)
+    assert r.status_code == 200
+    r = client.post(f"{settings.API_V1_STR}/login/test-token", headers=headers)
+    assert r.status_code == 403
+
+    new_headers = user_authentication_headers(
+        client=client, email=email, password=password
+    )
+    r = client.post(f"{settings.API_V1_STR}/login/test-token", headers=new_headers)
+    assert r.status_code == 200
+
+
+def test_access_token_claims(client: TestClient, db: Session) -> None:
+    email = random_email()
+    password = random_lower_string()
+    crud.create_user(session=db, user_create=UserCreate(email=email, password=password))
+    with patch("app.core.config.settings.ACCESS_TOKEN_CLAIMS", True):
+        headers = user_authentication_headers(
+            client=client, email=email, password=password
+        )
+        token = headers["Authorization"].removeprefix("Bearer ")
+        payload = jwt.decode(
+            token, settings.SECRET_KEY, algorithms=[security.ALGORITHM]
+        )
+        assert payload["email"] == email
+        assert payload["act"] is True
+        assert payload["su"] is False
+
+        # The principal comes from the token, the user row is not loaded
+        with patch.object(Session, "get", side_effect=AssertionError):
+            r = client.get(f"{settings.API_V1_STR}/items/", headers=headers)
+        assert r.status_code == 200
+
+        r = client.post(f"{settings.API_V1_STR}/logout-everywhere", headers=headers)
+        assert r.status_code == 200
+        r = client.post(f"{settings.API_V1_STR}/login/test-token", headers=headers)
+        assert r.status_code == 403
+
+
 def test_recovery_password(
     client: TestClient, normal_user_token_headers: dict[str, str]
 ) -> None:
@@ -5,7 +5,9 @@ from sqlmodel import Session
 
 from app import crud
 from app.core.config import settings
-from app.models import UserCreate
+from app.core.purges import user_purger
+from app.models import ItemCreate, User, UserCreate
+from app.tests.utils.user import create_random_user, user_authentication_headers
 from app.tests.utils.utils import random_email, random_lower_string
 
 
@@ -31,6 +33,35 @@ def test_get_users_normal_user_me(
     assert current_user["email"] == settings.EMAIL_TEST_USER
 
 
+def test_get_users_me_not_modified(
+    client: TestClient, normal_user_token_headers: dict[str, str]
+) -> None:
+    r = client.get(f"{settings.API_V1_STR}/users/me", headers=normal_user_token_headers)
+    etag = r.headers["ETag"]
+    r = client.get(
+        f"{settings.API_V1_STR}/users/me",
+        headers={**normal_user_token_headers, "If-None-Match": f'"x", {etag}'},
+    )
+    assert r.status_code == 304
+    assert r.content == b""
+
+
+def test_get_users_me_etag_is_per_user(
+    client: TestClient,
+    normal_user_token_headers: dict[str, str],
+    superuser_token_headers: dict[str, str],
+) -> None:
+    r = client.get(f"{settings.API_V1_STR}/users/me", headers=normal_user_token_headers)
+    etag = r.headers["ETag"]
+    # Same URL, after switching accounts
+    r = client.get(
+        f"{settings.API_V1_STR}/users/me",
+        headers={**superuser_token_headers, "If-None-Match": etag},
+    )
+    assert r.status_code == 200
+    assert r.json()["email"] == settings.FIRST_SUPERUSER
+
+
 def test_create_user_new_email(
     client: TestClient, superuser_token_headers: dict[str, str], db: Session
 ) -> None:
@@ -336,6 +367,55 @@ def test_update_user(
     assert updated_user["full_name"] == "Updated_full_name"
 
 
+def test_update_user_if_match(
+    client: TestClient, superuser_token_headers: dict[str, str], db: Session
+) -> None:
+    user = create_random_user(db)
+    url = f"{settings.API_V1_STR}/users/{user.id}"
+    r = client.get(url, headers=superuser_token_headers)
+    etag = r.headers["ETag"]
+    r = client.patch(
+        url,
+        headers={**superuser_token_headers, "If-Match": etag},
+        json={"full_name": "First"},
+    )
+    assert r.status_code == 200
+    assert r.headers["ETag"] != etag
+    r = client.patch(
+        url,
+        headers={**superuser_token_headers, "If-Match": etag},
+        json={"full_name": "Second"},
+    )
+    assert r.status_code == 409
+    assert r.json()["detail"] == "The user was changed since that version"
+    db.refresh(user)
+    assert user.full_name == "First"
+
+
+def test_deactivated_user_is_locked_out(
+    client: TestClient, superuser_token_headers: dict[str, str], db: Session
+) -> None:
+    username = random_email()
+    password = random_lower_string()
+    user_in = UserCreate(email=username, password=password)
+    user = crud.create_user(session=db, user_create=user_in)
+    user_headers = user_authentication_headers(
+        client=client, email=username, password=password
+    )
+    r = client.get(f"{settings.API_V1_STR}/items/", headers=user_headers)
+    assert r.status_code == 200
+
+    r = client.patch(
+        f"{settings.API_V1_STR}/users/{user.id}",
+        headers=superuser_token_headers,
+        json={"is_active": False},
+    )
+    assert r.status_code == 200
+    r = client.get(f"{settings.API_V1_STR}/items/", headers=user_headers)
+    assert r.status_code == 400
+    assert r.json() == {"detail": "Inactive user"}
+
+
 def test_update_user_not_exists(
     client: TestClient, superuser_token_headers: dict[str, str]
 ) -> None:
@@ -389,6 +469,30 @@ def test_delete_user_super_user(
     assert deleted_user["message"] == "User deleted successfully"
 
 
+def test_delete_user_with_items(
+    client: TestClient, superuser_token_headers: dict[str, str], db: Session
+) -> None:
+    user = create_random_user(db)
+    assert user.id is not None
+    user_id = user.id
+    crud.create_items(
+        session=db,
+        items_in=[ItemCreate(title=random_lower_string()) for _ in range(3)],
+        owner_id=user_id,
+    )
+    with patch("app.core.config.settings.USER_PURGE_BATCH_SIZE", 2):
+        r = client.delete(
+            f"{settings.API_V1_STR}/users/{user_id}",
+            headers=superuser_token_headers,
+        )
+        # Runs once the purge the request queued is done
+        assert user_purger.submit(user_id).result() == 0
+    assert r.status_code == 200
+    db.expire_all()
+    assert db.get(User, user_id) is None
+    assert crud.count_items(session=db, owner_id=user_id, mode="exact")[0] == 0
+
+
 def test_delete_user_current_user(client: TestClient, db: Session) -> None:
     username = random_email()
     password = random_lower_string()
@@ -0,0 +1,90 @@
+from typing import Any
+from unittest.mock import patch
+
+from fastapi import Request
+from fastapi.testclient import TestClient
+from sqlalchemy import Engine
+from sqlmodel import create_engine, text
+
+from app.api.deps import get_db
+from app.core.config import settings
+from app.core.db import engine
+
+
+def transaction_read_only(method: str) -> Any:
+    sessions = get_db(Request({"type": "http", "method": method, "headers": []}))
+    session = next(sessions)
+    try:
+        return session.execute(text("SHOW transaction_read_only")).scalar_one()
+    finally:
+        sessions.close()
+
+
+def test_get_requests_run_read_only_transactions() -> None:
+    assert transaction_read_only("GET") == "on"
+    assert transaction_read_only("POST") == "off"
+    # Connections are back to read-write once returned to the pool
+    with engine.connect() as conn:
+        assert conn.exec_driver_sql("SHOW transaction_read_only").scalar_one() == "off"
+
+
+def count_prepared_statements(engine: Engine) -> int:
+    with engine.connect() as conn:
+        count: int = conn.exec_driver_sql(
+            "SELECT count(*) FROM pg_prepared_statements"
+        ).scalar_one()
+        return count
+
+
+def prepared_statements(
+    client: TestClient, headers: dict[str, str], prepare_threshold: int | None
+) -> int:
+    """
+    Prepared statements on the connection after requests through an engine
+    with `prepare_threshold`, with one connection so all the requests share
+    it. Counted after the POSTs: psycopg forgets what it prepared on
+    rollback, and READ ONLY GET transactions end with one.
+    """
+    pooled_engine = create_engine(
+        str(settings.SQLALCHEMY_DATABASE_URI),
+        pool_size=1,
+        max_overflow=0,
+        pool_pre_ping=True,
+        connect_args={"prepare_threshold": prepare_threshold},
+    )
+    read_only = pooled_engine.execution_options(postgresql_readonly=True)
+    try:
+        with patch("app.api.deps.engine", pooled_engine), patch(
+            "app.api.deps.read_only_engine", read_only
+        ):
+            assert transaction_read_only("GET") == "on"
+            ids = []
+            for _ in range(10):
+                r = client.post(
+                    f"{settings.API_V1_STR}/items/",
+                    headers=headers,
+                    json={"title": "Foo"},
+                )
+                assert r.status_code == 200
+                ids.append(r.json()["id"])
+            count = count_prepared_statements(pooled_engine)
+            for id in ids:
+                r = client.get(f"{settings.API_V1_STR}/items/{id}", headers=headers)
+                assert r.status_code == 200
+            assert transaction_read_only("POST") == "off"
+        return count
+    finally:
+        pooled_engine.dispose()
+
+
+def test_requests_in_pgbouncer_mode(
+    client: TestClient, superuser_token_headers: dict[str, str]
+) -> None:
+    # The client settings of PgBouncer transaction pooling, against Postgres
+    # directly: CI runs no PgBouncer
+    pgbouncer = settings.model_copy(update={"PGBOUNCER_SERVER": "pgbouncer"})
+    headers = superuser_token_headers
+    assert prepared_statements(client, headers, pgbouncer.prepare_threshold) == 0
+    # Without PgBouncer, the repeated statements are prepared on the connection
+    if settings.prepare_threshold is not None:
+        assert prepared_statements(client, headers, settings.prepare_threshold) > 0
@@ -0,0 +1,317 @@
+"""
+Plans of the SQL issued by the routes, on tables seeded to a realistic size.
+
+Each scenario records the statements of one request and EXPLAINs them: a
+sequential scan of a large table fails the test unless the scenario allows
+it, and so does a total estimated cost above the stored baseline (with some
+tolerance). After an intended change, update the baselines with:
+
+    UPDATE_QUERY_PLAN_BASELINES=1 pytest app/tests/api/test_query_plans.py
+"""
+
+import json
+import os
+from collections.abc import Generator
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Any
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlmodel import Session, text
+
+from app.core.config import settings
+from app.core.db import engine
+from app.core.pagination import encode_cursor
+from app.core.response_cache import response_cache
+from app.core.security import create_access_token, get_password_hash
+from app.tests.utils.plans import explain_query, record_queries, seq_scanned_tables
+
+baselines_path = Path(__file__).parent / "query_plan_baselines.json"
+update_baselines = bool(os.environ.get("UPDATE_QUERY_PLAN_BASELINES"))
+cost_tolerance = 1.5
+large_table_rows = 1000
+seed_users = 2000
+seed_items = 20000
+# Items of the user the owner scenarios run as, on top of its share
+seed_owner_items = 2000
+seed_password = "plan-password"
+
+
+@dataclass
+class Seed:
+    owner_id: int
+    owner_email: str
+    other_user_id: int
+    item_ids: list[int]
+    large_tables: set[str]
+    # Items are seeded one second apart, the last ones at this time
+    seeded_at: datetime
+
+
+@dataclass
+class Scenario:
+    name: str
+    method: str
+    path: str
+    superuser: bool = False
+    params: dict[str, Any] = field(default_factory=dict)
+    json: dict[str, Any] | None = None
+    data: dict[str, Any] | None = None
+    # Tables this request is expected to scan, e.g. for exact counts
+    allowed_seq_scans: set[str] = field(default_factory=set)
+
+
+scenarios = [
+    Scenario(
+        "login",
+        "POST",
+        "/login/access-token",
+        data={"username": "{owner_email}", "password": seed_password},
+    ),
+    Scenario("test_token", "POST", "/login/test-token"),
+    Scenario("read_items", "GET", "/items/"),
+    Scenario("read_items_cursor", "GET", "/items/", params={"cursor": "{cursor}"}),
+    Scenario("read_items_offset", "GET", "/items/", params={"skip": 2000}),
+    Scenario(
+        "read_items_cached_count", "GET", "/items/", params={"count_mode": "cached"}
+    ),
+    Scenario(
+        "read_items_superuser",
+        "GET",
+        "/items/",
+        superuser=True,
+        params={"count_mode": "cached"},
+        # Sums the counter of every owner
+        allowed_seq_scans={"itemstats"},
+    ),
+    Scenario(
+        "read_items_superuser_exact_count",
+        "GET",
+        "/items/",
+        superuser=True,
+        allowed_seq_scans={"item"},
+    ),
+    Scenario("search_items", "GET", "/items/", params={"q": "owner"}),
+    Scenario(
+        "search_items_superuser",
+        "GET",
+        "/items/",
+        superuser=True,
+        params={"q": "17", "count_mode": "estimated"},
+    ),
+    Scenario(
+        "read_items_recent",
+        "GET",
+        "/items/",
+        params={"sort": "-created_at", "created_after": "{recent}"},
+    ),
+    Scenario(
+        "read_items_by_title",
+        "GET",
+        "/items/",
+        params={"sort": "title", "count_mode": "cached"},
+    ),
+    Scenario(
+        "read_items_superuser_recent",
+        "GET",
+        "/items/",
+        superuser=True,
+        params={"created_after": "{recent}", "count_mode": "estimated"},
+    ),
+    Scenario("read_item", "GET", "/items/{item_0}"),
+    Scenario("update_item", "PUT", "/items/{item_1}", json={"title": "Updated"}),
+    Scenario("delete_item", "DELETE", "/items/{item_2}"),
+    Scenario(
+        "read_users",
+        "GET",
+        "/users/",
+        superuser=True,
+        params={"count_mode": "estimated"},
+    ),
+    Scenario(
+        "read_users_exact_count",
+        "GET",
+        "/users/",
+        superuser=True,
+        allowed_seq_scans={"user"},
+    ),
+    Scenario("read_user_me", "GET", "/users/me"),
+    Scenario("update_user_me", "PATCH", "/users/me", json={"full_name": "Plan"}),
+    Scenario("read_user_by_id", "GET", "/users/{owner_id}", superuser=True),
+    Scenario("delete_user", "DELETE", "/users/{other_user_id}", superuser=True),
+]
+
+
+@pytest.fixture(scope="module")
+def seed(db: Session) -> Generator[Seed, None, None]:
+    db.execute(
+        text(
+            """
+            INSERT INTO "user" (email, hashed_password, is_active, is_superuser,
+                                token_version)
+            SELECT 'plan-user-' || i || '@example.com', :hashed_password, true,
+                   false, 0
+            FROM generate_series(1, :users) i
+            """
+        ),
+        {"users": seed_users, "hashed_password": get_password_hash(seed_password)},
+    )
+    user_ids = (
+        db.execute(
+            text("SELECT id FROM \"user\" WHERE email LIKE 'plan-user-%' ORDER BY id")
+        )
+        .scalars()
+        .all()
+    )
+    owner_id, other_user_id = user_ids[0], user_ids[1]
+    owner_email = db.execute(
+        text('SELECT email FROM "user" WHERE id = :id'), {"id": owner_id}
+    ).scalar_one()
+    db.execute(
+        text(
+            """
+            INSERT INTO item (title, owner_id, created_at, updated_at)
+            SELECT title, owner_id, created_at, created_at FROM (
+                SELECT 'Plan item ' || i AS title,
+                       (:user_ids)[1 + i % :users] AS owner_id,
+                       now() - make_interval(secs => :items + :owner_items - i)
+                           AS created_at
+                FROM generate_series(1, :items) i
+                UNION ALL
+                SELECT 'Plan owner item ' || i, :owner_id,
+                       now() - make_interval(secs => :owner_items - i)
+                FROM generate_series(1, :owner_items) i
+            ) seed
+            """
+        ),
+        {
+            "user_ids": list(user_ids),
+            "users": len(user_ids),
+            "items": seed_items,
+            "owner_id": owner_id,
+            "owner_items": seed_owner_items,
+        },
+    )
+    db.execute(
+        text(
+            """
+            INSERT INTO itemstats (owner_id, item_count)
+            SELECT owner_id, count(*) FROM item
+            WHERE owner_id = ANY(:user_ids) GROUP BY owner_id
+            """
+        ),
+        {"user_ids": list(user_ids)},
+    )
+    item_ids = (
+        db.execute(
+            text("SELECT id FROM item WHERE owner_id = :owner_id ORDER BY id LIMIT 3"),
+            {"owner_id": owner_id},
+        )
+        .scalars()
+        .all()
+    )
+    seeded_at = db.execute(text("SELECT now()")).scalar_one()
+    db.commit()
+    # The seed bypasses the crud functions and their invalidations
+    response_cache.clear()
+    vacuum()
+    large_tables = set(
+        db.execute(
+            text(
+                "SELECT relname FROM pg_class "
+                "WHERE relkind = 'r' AND reltuples >= :rows"
+            ),
+            {"rows": large_table_rows},
+        ).scalars()
+    )
+    db.commit()
+    yield Seed(
+        owner_id=owner_id,
+        owner_email=owner_email,
+        other_user_id=other_user_id,
+        item_ids=list(item_ids),
+        large_tables=large_tables,
+        seeded_at=seeded_at,
+    )
+    db.execute(
+        text("DELETE FROM item WHERE owner_id = ANY(:user_ids)"),
+        {"user_ids": list(user_ids)},
+    )
+    db.execute(text("DELETE FROM \"user\" WHERE email LIKE 'plan-user-%'"))
+    db.commit()
+    vacuum()
+
+
+def vacuum() -> None:
+    # Also sets the visibility map, so plans don't depend on autovacuum timing
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        conn.exec_driver_sql('VACUUM ANALYZE "user", item, itemstats')
+
+
+def format_values(values: dict[str, Any], seed: Seed) -> dict[str, Any]:
+    replacements = {
+        "owner_id": seed.owner_id,
+        "owner_email": seed.owner_email,
+        "other_user_id": seed.other_user_id,
+        "cursor": encode_cursor([seed.item_ids[0]]),
+        "recent": (seed.seeded_at - timedelta(seconds=100)).isoformat(),
+        **{f"item_{i}": item_id for i, item_id in enumerate(seed.item_ids)},
+    }
+    return {
+        key: value.format(**replacements) if isinstance(value, str) else value
+        for key, value in values.items()
+    }
+
+
+@pytest.mark.parametrize("scenario", scenarios, ids=lambda s: s.name)
+def test_query_plans(
+    client: TestClient,
+    db: Session,
+    seed: Seed,
+    superuser_token_headers: dict[str, str],
+    scenario: Scenario,
+) -> None:
+    if scenario.superuser:
+        headers = superuser_token_headers
+    else:
+        token = create_access_token(
+            seed.owner_id, expires_delta=timedelta(minutes=5), claims={"ver": 0}
+        )
+        headers = {"Authorization": f"Bearer {token}"}
+    path = format_values({"path": scenario.path}, seed)["path"]
+    with record_queries(engine) as queries:
+        r = client.request(
+            scenario.method,
+            f"{settings.API_V1_STR}{path}",
+            headers=headers,
+            params=format_values(scenario.params, seed),
+            json=scenario.json,
+            data=format_values(scenario.data, seed) if scenario.data else None,
+        )
+    assert r.status_code == 200, r.text
+    assert queries
+
+    cost = 0.0
+    for statement, parameters in queries:
+        plan = explain_query(db, statement, parameters)
+        scanned = seq_scanned_tables(plan) & seed.large_tables
+        assert not scanned - scenario.allowed_seq_scans, (
+            f"Sequential scan of {scanned} in:\n{statement}\n"
+            f"{json.dumps(plan, indent=2)}"
+        )
+        cost += plan["Total Cost"]
+
+    baselines = json.loads(baselines_path.read_text())
+    if update_baselines:
+        baselines[scenario.name] = round(cost, 2)
+        baselines_path.write_text(
+            json.dumps(baselines, indent=2, sort_keys=True) + "\n"
+        )
+        return
+    assert scenario.name in baselines, "No baseline, see the module docstring"
+    assert cost <= baselines[scenario.name] * cost_tolerance, (
+        f"Estimated cost {cost:.2f} is above the baseline "
+        f"{baselines[scenario.name]:.2f} of {scenario.name}"
+    )
@@ -0,0 +1,44 @@
+from typing import Annotated, Any
+
+from fastapi import APIRouter, FastAPI
+from fastapi.testclient import TestClient
+from pydantic import AfterValidator, BaseModel
+from sqlmodel import Session, select
+
+from app.api.deps import SessionDep
+from app.api.routing import SessionRoute
+from app.core.db import engine
+from app.main import app
+
+
+def test_session_closed_before_serialization() -> None:
+    sessions: list[Session] = []
+    checked_out: list[int] = []
+
+    def record_checked_out(value: int) -> int:
+        checked_out.append(engine.pool.checkedout())  # type: ignore[attr-defined]
+        return value
+
+    class Response(BaseModel):
+        value: Annotated[int, AfterValidator(record_checked_out)]
+
+    router = APIRouter(route_class=SessionRoute)
+
+    @router.get("/value", response_model=Response)
+    def read_value(session: SessionDep) -> Any:
+        sessions.append(session)
+        return {"value": session.exec(select(1)).one()}
+
+    test_app = FastAPI()
+    test_app.include_router(router, prefix="/test")
+    with TestClient(test_app) as client:
+        before = engine.pool.checkedout()  # type: ignore[attr-defined]
+        r = client.get("/test/value")
+    assert r.status_code == 200
+    assert r.json() == {"value": 1}
+    assert checked_out == [before]
+    assert not sessions[0].in_transaction()
+
+
+def test_session_parameter_not_in_openapi() -> None:
+    assert "request_session" not in str(app.openapi())
@@ -0,0 +1,14 @@
+from app.core.config import settings
+
+
+def test_pgbouncer_settings() -> None:
+    assert settings.SQLALCHEMY_POOLED_DATABASE_URI == settings.SQLALCHEMY_DATABASE_URI
+    assert settings.prepare_threshold == settings.POSTGRES_PREPARE_THRESHOLD
+
+    pgbouncer = settings.model_copy(update={"PGBOUNCER_SERVER": "pgbouncer"})
+    assert "@pgbouncer:6432/" in str(pgbouncer.SQLALCHEMY_POOLED_DATABASE_URI)
+    assert pgbouncer.SQLALCHEMY_DATABASE_URI == settings.SQLALCHEMY_DATABASE_URI
+    assert pgbouncer.prepare_threshold is None
+
+    prepared = pgbouncer.model_copy(update={"PGBOUNCER_PREPARED_STATEMENTS": True})
+    assert prepared.prepare_threshold == settings.POSTGRES_PREPARE_THRESHOLD
@@ -0,0 +1,18 @@
+from unittest.mock import patch
+
+from sqlmodel import Session, func, select
+
+from app.core.config import settings
+from app.core.db import init_db
+from app.models import User
+
+
+def test_init_db_finds_the_superuser_whatever_the_case(db: Session) -> None:
+    with patch.object(settings, "FIRST_SUPERUSER", settings.FIRST_SUPERUSER.upper()):
+        init_db(db)
+    count = db.exec(
+        select(func.count())
+        .select_from(User)
+        .where(func.lower(User.email) == settings.FIRST_SUPERUSER.lower())
+    ).one()
+    assert count == 1
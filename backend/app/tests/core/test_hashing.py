@@ -0,0 +1,68 @@
+import asyncio
+import threading
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.core.config import Settings, settings
+from app.core.hashing import HashingPoolFullError, PasswordHashingPool
+
+
+def test_hashing_pool_runs_job() -> None:
+    pool = PasswordHashingPool(max_workers=1, max_queue=1)
+    assert pool.run(lambda a, b: a + b, 1, 2) == 3
+    stats = pool.stats()
+    assert stats.completed == 1
+    assert stats.in_flight == 0
+    assert stats.rejected == 0
+    pool.shutdown()
+
+
+def test_hashing_pool_runs_job_async() -> None:
+    pool = PasswordHashingPool(max_workers=1, max_queue=1)
+    assert asyncio.run(pool.run_async(lambda a, b: a + b, 1, 2)) == 3
+    stats = pool.stats()
+    assert stats.completed == 1
+    assert stats.in_flight == 0
+    pool.shutdown()
+
+
+def test_hashing_pool_rejects_when_full() -> None:
+    pool = PasswordHashingPool(max_workers=1, max_queue=0)
+    started = threading.Event()
+    release = threading.Event()
+
+    def block() -> None:
+        started.set()
+        release.wait()
+
+    worker = threading.Thread(target=pool.run, args=(block,))
+    worker.start()
+    started.wait()
+    with pytest.raises(HashingPoolFullError):
+        pool.run(lambda: None)
+    assert pool.stats().in_flight == 1
+    release.set()
+    worker.join()
+    stats = pool.stats()
+    assert stats.rejected == 1
+    assert stats.completed == 1
+    pool.shutdown()
+
+
+def test_hashing_stats_endpoint(
+    client: TestClient, superuser_token_headers: dict[str, str]
+) -> None:
+    r = client.get(
+        f"{settings.API_V1_STR}/utils/hashing-stats/",
+        headers=superuser_token_headers,
+    )
+    assert r.status_code == 200
+    stats = r.json()
+    assert stats["workers"] == settings.PASSWORD_HASHING_WORKERS
+    assert stats["completed"] >= 1
+
+
+def test_hashing_limit_below_request_threadpool() -> None:
+    with pytest.raises(ValueError, match="half of the request threadpool"):
+        Settings(PASSWORD_HASHING_WORKERS=2, PASSWORD_HASHING_QUEUE_SIZE=32)  # type: ignore[call-arg]
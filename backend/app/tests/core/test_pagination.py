@@ -0,0 +1,61 @@
+from dataclasses import dataclass
+from datetime import datetime, timezone
+
+import pytest
+
+from app.core.pagination import InvalidCursorError, Page, decode_cursor, encode_cursor
+
+
+@dataclass
+class Row:
+    id: int | None
+
+
+def test_cursor_round_trip() -> None:
+    cursor = encode_cursor([42])
+    assert "=" not in cursor
+    assert decode_cursor(cursor) == [42]
+
+
+# Not base64, a JSON object, JSON null
+@pytest.mark.parametrize("cursor", ["!!!", "eyJpZCI6MX0", "bnVsbA"])
+def test_decode_invalid_cursor(cursor: str) -> None:
+    with pytest.raises(InvalidCursorError):
+        decode_cursor(cursor)
+
+
+def test_page_from_params() -> None:
+    assert Page.from_params(cursor=None, skip=5, limit=5000, max_limit=100) == Page(
+        limit=100, skip=5
+    )
+    page = Page.from_params(cursor=encode_cursor([7]), skip=5, limit=10, max_limit=100)
+    assert page == Page(limit=10, after=7)
+    assert page.params == {"after": 7, "skip": 0, "limit": 11}
+    with pytest.raises(InvalidCursorError):
+        Page.from_params(cursor=encode_cursor(["7"]), skip=0, limit=10, max_limit=100)
+
+
+def test_page_rows() -> None:
+    page = Page(limit=2)
+    rows, cursor = page.rows([Row(1), Row(2), Row(3)])
+    assert rows == [Row(1), Row(2)]
+    assert cursor and Page.from_params(
+        cursor=cursor, skip=0, limit=2, max_limit=10
+    ) == Page(limit=2, after=2)
+    rows, cursor = page.rows([Row(1), Row(2)])
+    assert rows == [Row(1), Row(2)]
+    assert cursor is None
+
+
+def test_page_keyed_rows() -> None:
+    page = Page(limit=2)
+    rows, cursor = page.keyed_rows([(Row(3), 0.5), (Row(1), 0.25), (Row(2), 0.25)])
+    assert rows == [Row(3), Row(1)]
+    next_page = Page.from_params(cursor=cursor, skip=0, limit=2, max_limit=10)
+    assert next_page == Page(limit=2, after=1, key=0.25)
+    created_at = datetime(2024, 1, 2, 3, 4, 5, 6, tzinfo=timezone.utc)
+    _, cursor = page.keyed_rows([(Row(i), created_at) for i in range(3)])
+    next_page = Page.from_params(cursor=cursor, skip=0, limit=2, max_limit=10)
+    assert datetime.fromisoformat(next_page.key) == created_at
+    with pytest.raises(InvalidCursorError):
+        Page.from_params(cursor=encode_cursor([True, 1]), skip=0, limit=2, max_limit=10)
@@ -0,0 +1,43 @@
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.exc import TimeoutError
+
+from app.core.config import settings
+from app.core.pool import InstrumentedQueuePool
+
+
+def test_pool_stats_and_timeouts() -> None:
+    engine = create_engine(
+        str(settings.SQLALCHEMY_DATABASE_URI),
+        poolclass=InstrumentedQueuePool,
+        pool_size=1,
+        max_overflow=0,
+        pool_timeout=0.1,
+    )
+    pool = engine.pool
+    assert isinstance(pool, InstrumentedQueuePool)
+    with engine.connect():
+        stats = pool.stats()
+        assert stats.checked_out == 1
+        assert stats.checkouts == 1
+        with pytest.raises(TimeoutError):
+            engine.connect()
+    stats = pool.stats()
+    assert stats.checked_out == 0
+    assert stats.checked_in == 1
+    assert stats.timeouts == 1
+    engine.dispose()
+
+
+def test_db_pool_stats_endpoint(
+    client: TestClient, superuser_token_headers: dict[str, str]
+) -> None:
+    r = client.get(
+        f"{settings.API_V1_STR}/utils/db-pool-stats/",
+        headers=superuser_token_headers,
+    )
+    assert r.status_code == 200
+    stats = r.json()
+    assert stats["size"] == settings.POSTGRES_POOL_SIZE
+    assert stats["checkouts"] >= 1
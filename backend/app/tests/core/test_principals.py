@@ -0,0 +1,127 @@
+import threading
+from datetime import datetime, timedelta, timezone
+from unittest.mock import patch
+
+from sqlmodel import Session
+
+from app import crud
+from app.core.notifications import PostgresListener, notify
+from app.core.principals import (
+    Principal,
+    PrincipalCache,
+    TokenVersions,
+    invalidate_principal,
+    token_versions,
+)
+from app.models import User
+from app.tests.utils.user import create_random_user
+
+
+def make_principal(user_id: int) -> Principal:
+    return Principal(
+        id=user_id, email=f"{user_id}@example.com", is_active=True, is_superuser=False
+    )
+
+
+def test_principal_cache_get_put_evict() -> None:
+    cache = PrincipalCache(ttl_seconds=60, max_size=10)
+    principal = make_principal(1)
+    cache.put(principal)
+    assert cache.get(1) == principal
+    cache.evict(1)
+    assert cache.get(1) is None
+
+
+def test_principal_cache_ttl() -> None:
+    cache = PrincipalCache(ttl_seconds=60, max_size=10)
+    with patch("app.core.principals.time.monotonic", return_value=0):
+        cache.put(make_principal(1))
+    with patch("app.core.principals.time.monotonic", return_value=61):
+        assert cache.get(1) is None
+
+
+def test_principal_cache_disabled() -> None:
+    cache = PrincipalCache(ttl_seconds=0, max_size=10)
+    cache.put(make_principal(1))
+    assert cache.get(1) is None
+
+
+def test_principal_cache_lru_eviction() -> None:
+    cache = PrincipalCache(ttl_seconds=60, max_size=2)
+    cache.put(make_principal(1))
+    cache.put(make_principal(2))
+    assert cache.get(1)
+    cache.put(make_principal(3))
+    assert cache.get(1)
+    assert cache.get(2) is None
+    assert cache.get(3)
+
+
+def test_token_versions(db: Session) -> None:
+    versions = TokenVersions(refresh_seconds=60, lifetime_seconds=60)
+    assert versions.needs_refresh()
+    versions.refresh(db)
+    assert not versions.needs_refresh()
+    now = datetime.now(timezone.utc)
+    versions.load([(1, 2, now)], now)
+    assert versions.is_revoked(1, 1)
+    assert not versions.is_revoked(1, 2)
+    versions.update(1, 3)
+    assert versions.is_revoked(1, 2)
+    # Refreshes only add what changed since the previous one
+    versions.load([], now)
+    assert versions.is_revoked(1, 2)
+    # Every token revoked more than a token lifetime ago has expired
+    versions.load([], now + timedelta(seconds=61))
+    assert not versions.is_revoked(1, 2)
+
+
+def test_token_versions_outlive_the_user(db: Session) -> None:
+    user = create_random_user(db)
+    user_id = user.id
+    assert user_id is not None
+    crud.request_user_deletion(session=db, db_user=user)
+    crud.purge_user(session=db, user_id=user_id, batch_size=10)
+    assert db.get(User, user_id) is None
+    # A worker started after the purge
+    versions = TokenVersions(refresh_seconds=60, lifetime_seconds=60)
+    versions.refresh(db)
+    assert versions.is_revoked(user_id, 0)
+
+
+def test_revocation_applies_on_commit(db: Session) -> None:
+    user = create_random_user(db)
+    assert user.id is not None
+    token_version = user.token_version
+    user.token_version += 1
+    invalidate_principal(db, user, revoked=True)
+    assert not token_versions.is_revoked(user.id, token_version)
+    db.rollback()
+    assert not token_versions.is_revoked(user.id, token_version)
+    crud.revoke_tokens(session=db, db_user=user)
+    assert token_versions.is_revoked(user.id, token_version)
+
+
+def test_listener_receives_committed_notifications(db: Session) -> None:
+    received: list[str] = []
+    connected = threading.Event()
+    delivered = threading.Event()
+
+    def handler(payload: str) -> None:
+        received.append(payload)
+        delivered.set()
+
+    listener = PostgresListener()
+    listener.subscribe("test_channel", handler)
+    listener.on_reconnect(connected.set)
+    listener.start()
+    try:
+        assert connected.wait(timeout=5)
+        notify(db, "test_channel", "rolled back")
+        db.rollback()
+        notify(db, "test_channel", "42")
+        db.commit()
+        assert delivered.wait(timeout=5)
+    finally:
+        listener.stop()
+    assert received == ["42"]
@@ -0,0 +1,40 @@
+from sqlalchemy import NullPool, create_engine, func, select
+from sqlmodel import Session
+
+from app import crud
+from app.core.config import settings
+from app.core.purges import UserPurger, resume_lock_key
+from app.models import User
+from app.tests.utils.user import create_random_user
+
+
+def test_user_purger_resumes_pending_purges(db: Session) -> None:
+    user = create_random_user(db)
+    user_id = user.id
+    crud.request_user_deletion(session=db, db_user=user)
+    purger = UserPurger()
+    purger.start().result()
+    purger.stop()
+    db.expire_all()
+    assert db.get(User, user_id) is None
+
+
+def test_user_purger_resumes_in_one_worker(db: Session) -> None:
+    user = create_random_user(db)
+    user_id = user.id
+    assert user_id is not None
+    crud.request_user_deletion(session=db, db_user=user)
+    lock_engine = create_engine(
+        str(settings.SQLALCHEMY_DATABASE_URI), poolclass=NullPool
+    )
+    # Another worker is resuming the purges
+    with lock_engine.connect() as conn:
+        conn.execute(select(func.pg_advisory_lock(resume_lock_key)))
+        purger = UserPurger()
+        purger.start().result()
+        db.expire_all()
+        assert db.get(User, user_id)
+        assert purger.submit(user_id).result() == 0
+        purger.stop()
+    db.expire_all()
+    assert db.get(User, user_id) is None
@@ -0,0 +1,92 @@
+import time
+from unittest.mock import patch
+
+from sqlalchemy import create_engine
+from sqlmodel import select
+
+from app import crud
+from app.core.config import settings
+from app.core.db import engine
+from app.core.replicas import (
+    Replica,
+    ReplicaPins,
+    ReplicaSet,
+    RoutingSession,
+    parse_lsn,
+    replica_pins,
+)
+from app.models import Item, ItemCreate
+from app.tests.utils.user import create_random_user
+
+
+def test_parse_lsn() -> None:
+    assert parse_lsn("0/0") == 0
+    assert parse_lsn("16/B374D848") == (0x16 << 32) + 0xB374D848
+
+
+def test_replica_pins_expire() -> None:
+    pins = ReplicaPins(pin_seconds=60)
+    pins.pin(1, 100)
+    pins.pin(1, 50)
+    assert pins.min_lsn(1) == 100
+    assert pins.min_lsn(2) == 0
+    assert pins.min_lsn(None) == 0
+    expired = ReplicaPins(pin_seconds=0)
+    expired.pin(1, 100)
+    assert expired.min_lsn(1) == 0
+
+
+def test_replica_set_picks_caught_up_replicas() -> None:
+    # The primary reports its own position, so it can stand in for a replica
+    replica = Replica(
+        create_engine(str(settings.SQLALCHEMY_DATABASE_URI)), check_seconds=60
+    )
+    down = Replica(
+        create_engine(
+            str(settings.SQLALCHEMY_DATABASE_URI).replace(
+                f":{settings.POSTGRES_PORT}/", ":1/"
+            )
+        ),
+        check_seconds=60,
+    )
+    replicas = ReplicaSet([down, replica])
+    assert replicas.pick() is replica.engine
+    assert replicas.pick() is replica.engine
+    assert not down.healthy
+    assert replicas.pick(min_lsn=replica.replay_lsn + 1) is None
+    assert ReplicaSet([]).pick() is None
+    replica.engine.dispose()
+
+
+def test_replica_set_skips_replicas_with_an_overdue_check() -> None:
+    replica = Replica(
+        create_engine(str(settings.SQLALCHEMY_DATABASE_URI)),
+        check_seconds=60,
+        check_timeout=2,
+    )
+    replicas = ReplicaSet([replica])
+    assert replicas.pick() is replica.engine
+    now = time.monotonic()
+    # Another request is stuck checking it
+    with replica._lock:
+        with patch("app.core.replicas.time.monotonic", return_value=now + 61):
+            assert replicas.pick() is replica.engine
+        with patch("app.core.replicas.time.monotonic", return_value=now + 63):
+            assert replicas.pick() is None
+    replica.engine.dispose()
+
+
+def test_routing_session_reads_from_replica_until_it_writes() -> None:
+    replica = create_engine(str(settings.SQLALCHEMY_DATABASE_URI))
+    with RoutingSession(engine, expire_on_commit=False) as session:
+        user = create_random_user(session)
+    assert user.id is not None
+    with RoutingSession(engine, replica=replica, user_id=user.id) as session:
+        assert session.get_bind(clause=select(Item)) is replica
+        crud.create_item(
+            session=session, item_in=ItemCreate(title="Foo"), owner_id=user.id
+        )
+        assert session.wrote
+        assert session.get_bind(clause=select(Item)) is engine
+    assert replica_pins.min_lsn(user.id) > 0
+    replica.dispose()
@@ -0,0 +1,174 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import patch
+
+import pytest
+from fastapi.testclient import TestClient
+from psycopg.errors import DeadlockDetected, QueryCanceled
+from sqlalchemy import Text, cast
+from sqlalchemy.exc import OperationalError
+from sqlmodel import Session, func, select
+
+from app.core.config import settings
+from app.core.db import engine
+from app.core.response_cache import (
+    CachedResponse,
+    CacheMiss,
+    MemoryResponseCache,
+    PostgresResponseCache,
+    generation_slots,
+    item_tags,
+    list_tag,
+)
+
+
+def make_response(size: int) -> CachedResponse:
+    return CachedResponse(body=b"x" * size, etag='"1"')
+
+
+def memory_miss() -> CacheMiss:
+    # Of a cache never invalidated
+    return CacheMiss(generations=(0,) * generation_slots)
+
+
+def postgres_miss(db: Session) -> CacheMiss:
+    snapshot = db.exec(select(cast(func.pg_current_snapshot(), Text))).one()
+    return CacheMiss(snapshot=snapshot)
+
+
+def test_memory_response_cache_get_put_evict() -> None:
+    cache = MemoryResponseCache(ttl_seconds=60, max_bytes=100, max_entry_bytes=100)
+    response = make_response(10)
+    cache.put("a", response, {list_tag(1)}, memory_miss())
+    cache.put("b", response, {list_tag(2)}, memory_miss())
+    assert cache.get("a") == response
+    cache.evict(item_tags([1]))
+    assert isinstance(cache.get("a"), CacheMiss)
+    assert cache.get("b") == response
+    stats = cache.stats()
+    assert (stats.entries, stats.bytes) == (1, 10)
+    assert (stats.hits, stats.misses, stats.invalidations) == (2, 1, 1)
+
+
+def test_memory_response_cache_ttl() -> None:
+    cache = MemoryResponseCache(ttl_seconds=60, max_bytes=100, max_entry_bytes=100)
+    with patch("app.core.response_cache.time.monotonic", return_value=0):
+        cache.put("a", make_response(10), {list_tag(1)}, memory_miss())
+    with patch("app.core.response_cache.time.monotonic", return_value=61):
+        assert isinstance(cache.get("a"), CacheMiss)
+    assert cache.stats().evictions == 1
+
+
+def test_memory_response_cache_byte_bounds() -> None:
+    cache = MemoryResponseCache(ttl_seconds=60, max_bytes=25, max_entry_bytes=20)
+    cache.put("a", make_response(10), {list_tag(1)}, memory_miss())
+    cache.put("b", make_response(10), {list_tag(1)}, memory_miss())
+    assert cache.get("a")
+    cache.put("c", make_response(10), {list_tag(1)}, memory_miss())
+    assert cache.get("a")
+    assert isinstance(cache.get("b"), CacheMiss)
+    assert cache.get("c")
+    cache.put("d", make_response(21), {list_tag(1)}, memory_miss())
+    assert isinstance(cache.get("d"), CacheMiss)
+    stats = cache.stats()
+    assert (stats.entries, stats.bytes, stats.evictions) == (2, 20, 1)
+
+
+def test_memory_response_cache_skips_reads_older_than_a_write() -> None:
+    cache = MemoryResponseCache(ttl_seconds=60, max_bytes=100, max_entry_bytes=100)
+    miss = cache.get("a")
+    assert isinstance(miss, CacheMiss)
+    cache.evict(item_tags([1]))
+    cache.put("a", make_response(10), {list_tag(1)}, miss)
+    assert isinstance(cache.get("a"), CacheMiss)
+    # A write to the items of another owner
+    miss = cache.get("a")
+    assert isinstance(miss, CacheMiss)
+    cache.evict(item_tags([2]))
+    cache.put("a", make_response(10), {list_tag(1)}, miss)
+    assert cache.get("a") == make_response(10)
+
+
+def test_postgres_response_cache(db: Session) -> None:
+    cache = PostgresResponseCache(engine, ttl_seconds=60, max_entry_bytes=100)
+    response = make_response(10)
+    cache.put("a", response, {list_tag(1)}, postgres_miss(db))
+    cache.put("b", response, {list_tag(2)}, postgres_miss(db))
+    cache.put("c", make_response(101), {list_tag(2)}, postgres_miss(db))
+    assert cache.get("a") == response
+    assert isinstance(cache.get("c"), CacheMiss)
+    # In the transaction of the write
+    cache.evict(item_tags([1]))
+    for statement in cache.invalidation_statements(item_tags([1])):
+        db.execute(statement)
+    db.commit()
+    assert isinstance(cache.get("a"), CacheMiss)
+    assert cache.get("b") == response
+    stats = cache.stats()
+    assert (stats.hits, stats.misses, stats.invalidations) == (2, 2, 1)
+    cache.clear()
+    assert cache.stats().entries == 0
+
+
+def test_postgres_response_cache_skips_reads_older_than_a_write(db: Session) -> None:
+    # The write and the read are in different workers
+    cache = PostgresResponseCache(engine, ttl_seconds=60, max_entry_bytes=100)
+    response = make_response(10)
+    miss = cache.get("a")
+    assert isinstance(miss, CacheMiss)
+    for statement in cache.invalidation_statements(item_tags([1])):
+        db.execute(statement)
+    db.commit()
+    cache.put("a", response, {list_tag(1)}, miss)
+    cache.put("b", response, {list_tag(2)}, miss)
+    assert isinstance(cache.get("a"), CacheMiss)
+    assert cache.get("b") == response
+    # The put waits for the write in progress
+    miss = cache.get("a")
+    assert isinstance(miss, CacheMiss)
+    for statement in cache.invalidation_statements(item_tags([1])):
+        db.execute(statement)
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        put = executor.submit(cache.put, "a", response, {list_tag(1)}, miss)
+        time.sleep(0.2)
+        assert not put.done()
+        db.commit()
+        put.result()
+    assert isinstance(cache.get("a"), CacheMiss)
+    cache.clear()
+
+
+def test_postgres_response_cache_put_errors(db: Session) -> None:
+    cache = PostgresResponseCache(engine, ttl_seconds=60, max_entry_bytes=100)
+    miss = postgres_miss(db)
+    deadlock = OperationalError("", {}, DeadlockDetected())
+    with patch.object(Session, "execute", side_effect=deadlock):
+        cache.put("a", make_response(10), {list_tag(1)}, miss)
+    assert isinstance(cache.get("a"), CacheMiss)
+    timeout = OperationalError("", {}, QueryCanceled())
+    with patch.object(Session, "execute", side_effect=timeout):
+        with pytest.raises(OperationalError):
+            cache.put("a", make_response(10), {list_tag(1)}, miss)
+
+
+def test_postgres_response_cache_deletes_expired_entries(db: Session) -> None:
+    cache = PostgresResponseCache(engine, ttl_seconds=0.01, max_entry_bytes=100)
+    cache.put("a", make_response(10), {list_tag(1)}, postgres_miss(db))
+    time.sleep(0.02)
+    assert isinstance(cache.get("a"), CacheMiss)
+    cache.put("b", make_response(10), {list_tag(1)}, postgres_miss(db))
+    assert cache.stats().evictions == 1
+    cache.clear()
+
+
+def test_response_cache_stats_endpoint(
+    client: TestClient, superuser_token_headers: dict[str, str]
+) -> None:
+    r = client.get(
+        f"{settings.API_V1_STR}/utils/response-cache-stats/",
+        headers=superuser_token_headers,
+    )
+    assert r.status_code == 200
+    stats = r.json()
+    assert stats["backend"] == settings.RESPONSE_CACHE_BACKEND
+    assert stats["misses"] >= 0
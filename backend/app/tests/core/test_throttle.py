@@ -0,0 +1,99 @@
+from sqlmodel import Session
+
+from app.core.throttle import (
+    BucketPolicy,
+    BucketState,
+    LoginThrottle,
+    MemoryThrottleBackend,
+    PostgresThrottleBackend,
+    consume,
+    consume_statement,
+)
+from app.models import LoginThrottleBucket
+from app.tests.utils.utils import random_email
+
+policy = BucketPolicy(
+    capacity=3, refill_seconds=100, lockout_seconds=60, max_lockout_seconds=100
+)
+
+
+def test_consume_locks_when_empty() -> None:
+    state = consume(None, policy, now=0)
+    state = consume(state, policy, now=0)
+    assert state.locked_until == 0
+    state = consume(state, policy, now=0)
+    assert state.locked_until == 60
+    assert state.lockouts == 1
+
+
+def test_consume_lockout_doubles_and_is_capped() -> None:
+    state = None
+    for _ in range(3):
+        state = consume(state, policy, now=0)
+    state = consume(state, policy, now=60)
+    assert state.locked_until == 60 + 100
+    assert state.lockouts == 2
+
+
+def test_consume_resets_lockouts_once_refilled() -> None:
+    state = None
+    for _ in range(3):
+        state = consume(state, policy, now=0)
+    state = consume(state, policy, now=1000)
+    assert state.lockouts == 0
+    assert state.locked_until == 60
+
+
+def test_login_throttle_memory_backend(db: Session) -> None:
+    throttle = LoginThrottle(
+        MemoryThrottleBackend(), ip_policy=policy, email_policy=policy
+    )
+    email = random_email()
+    for _ in range(3):
+        assert throttle.retry_after(db, "10.0.0.1", email) is None
+        throttle.record_failure(db, "10.0.0.1", email)
+    assert throttle.retry_after(db, "10.0.0.1", email) == 60
+    # The email is locked from any IP
+    assert throttle.retry_after(db, "10.0.0.2", email.upper())
+
+
+def test_login_throttle_success_resets_email(db: Session) -> None:
+    throttle = LoginThrottle(
+        MemoryThrottleBackend(), ip_policy=policy, email_policy=policy
+    )
+    email = random_email()
+    throttle.record_failure(db, "10.0.0.1", email)
+    throttle.record_failure(db, "10.0.0.1", email)
+    throttle.record_success(db, "10.0.0.1", email)
+    throttle.record_failure(db, "10.0.0.2", email)
+    assert throttle.retry_after(db, "10.0.0.2", email) is None
+
+
+def test_login_throttle_postgres_backend(db: Session) -> None:
+    throttle = LoginThrottle(
+        PostgresThrottleBackend(), ip_policy=policy, email_policy=policy
+    )
+    email = random_email()
+    for _ in range(3):
+        throttle.record_failure(db, "10.0.0.3", email)
+    row = db.get(LoginThrottleBucket, f"email:{email}")
+    assert row
+    assert row.lockouts == 1
+    # Another worker only sees the shared row
+    other_worker = LoginThrottle(
+        PostgresThrottleBackend(), ip_policy=policy, email_policy=policy
+    )
+    assert other_worker.retry_after(db, "10.0.0.4", email)
+    throttle.record_success(db, "10.0.0.3", email)
+    db.expire_all()
+    assert db.get(LoginThrottleBucket, f"email:{email}") is None
+
+
+def test_consume_statement_matches_consume(db: Session) -> None:
+    key = f"email:{random_email()}"
+    state = None
+    for now in (0, 0, 0, 60, 1000):
+        state = consume(state, policy, now)
+        row = db.execute(consume_statement(key, policy, now)).one()
+        assert BucketState(*row) == state
+    db.rollback()
@@ -0,0 +1,100 @@
+import pytest
+from sqlalchemy import ClauseElement, bindparam
+from sqlalchemy.exc import OperationalError
+from sqlmodel import Session, col, delete, text
+
+from app import crud
+from app.core.db import engine
+from app.models import Item, ItemCreate
+from app.tests.utils.user import create_random_user
+from app.tests.utils.utils import explain, random_lower_string
+
+
+def test_count_items(db: Session) -> None:
+    user = create_random_user(db)
+    assert user.id is not None
+    items = [
+        crud.create_item(
+            session=db,
+            item_in=ItemCreate(title=random_lower_string()),
+            owner_id=user.id,
+        )
+        for _ in range(3)
+    ]
+    assert crud.count_items(session=db, owner_id=user.id, mode="exact") == (3, "exact")
+    assert crud.count_items(session=db, owner_id=user.id, mode="cached") == (
+        3,
+        "cached",
+    )
+    assert crud.count_items(session=db, owner_id=user.id, mode="none") == (
+        None,
+        "none",
+    )
+    db.execute(text("ANALYZE item"))
+    count, mode = crud.count_items(session=db, owner_id=user.id, mode="estimated")
+    assert mode == "estimated"
+    assert count is not None and count >= 1
+
+    assert items[0].id is not None
+    assert crud.delete_item(session=db, id=items[0].id)
+    assert crud.count_items(session=db, owner_id=user.id, mode="cached") == (
+        2,
+        "cached",
+    )
+    total, _ = crud.count_items(session=db, owner_id=None, mode="cached")
+    assert total == crud.count_items(session=db, owner_id=None, mode="exact")[0]
+
+
+def test_export_items_in_batches(db: Session) -> None:
+    user = create_random_user(db)
+    assert user.id is not None
+    items = crud.create_items(
+        session=db,
+        items_in=[ItemCreate(title=random_lower_string()) for _ in range(3)],
+        owner_id=user.id,
+    )
+    batches = list(crud.export_items(session=db, owner_id=user.id, batch_size=2))
+    db.rollback()
+    assert [len(rows) for rows in batches] == [2, 1]
+    assert [row.id for rows in batches for row in rows] == [item.id for item in items]
+    assert batches[0][0]._asdict() == {
+        "id": items[0].id,
+        "title": items[0].title,
+        "description": None,
+        "owner_id": user.id,
+    }
+
+
+def test_count_users_falls_back_to_estimate(db: Session) -> None:
+    count, mode = crud.count_users(session=db, mode="cached")
+    assert mode == "estimated"
+    assert count is not None
+
+
+@pytest.mark.parametrize(
+    "statement",
+    [
+        crud.owner_items_statement,
+        crud.owner_items_count_statement,
+        delete(Item).where(col(Item.owner_id) == bindparam("owner_id")),
+    ],
+)
+def test_owner_queries_use_owner_index(db: Session, statement: ClauseElement) -> None:
+    params = {"owner_id": 1, "after": 0, "skip": 0, "limit": 10}
+    assert "ix_item_owner_id_id" in explain(db, statement, params)
+
+
+def test_get_items_locked(db: Session) -> None:
+    user = create_random_user(db)
+    assert user.id is not None
+    item = crud.create_item(
+        session=db, item_in=ItemCreate(title=random_lower_string()), owner_id=user.id
+    )
+    assert item.id is not None
+    with Session(engine) as session:
+        assert crud.get_items(session=session, ids=[item.id], lock=True)
+        # Deleting it waits for the batch update holding the lock
+        db.execute(text("SET LOCAL lock_timeout = '100ms'"))
+        with pytest.raises(OperationalError):
+            db.execute(delete(Item).where(col(Item.id) == item.id))
+        db.rollback()
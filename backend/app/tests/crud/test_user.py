@@ -1,10 +1,14 @@
+import pytest
 from fastapi.encoders import jsonable_encoder
+from passlib.hash import bcrypt
+from sqlalchemy.exc import IntegrityError
 from sqlmodel import Session
 
 from app import crud
+from app.core.config import settings
 from app.core.security import verify_password
-from app.models import User, UserCreate, UserUpdate
-from app.tests.utils.utils import random_email, random_lower_string
+from app.models import ItemCreate, ItemStats, User, UserCreate, UserUpdate
+from app.tests.utils.utils import explain, random_email, random_lower_string
 
 
 def test_create_user(db: Session) -> None:
@@ -26,6 +30,22 @@ def test_authenticate_user(db: Session) -> None:
     assert user.email == authenticated_user.email
 
 
+def test_authenticate_user_rehashes_outdated_hash(db: Session) -> None:
+    email = random_email()
+    password = random_lower_string()
+    user_in = UserCreate(email=email, password=password)
+    user = crud.create_user(session=db, user_create=user_in)
+    user.hashed_password = bcrypt.using(rounds=4).hash(password)
+    db.add(user)
+    db.commit()
+    authenticated_user = crud.authenticate(session=db, email=email, password=password)
+    assert authenticated_user
+    assert bcrypt.from_string(authenticated_user.hashed_password).rounds == (
+        settings.BCRYPT_ROUNDS
+    )
+    assert verify_password(password, authenticated_user.hashed_password)
+
+
 def test_not_authenticate_user(db: Session) -> None:
     email = random_email()
     password = random_lower_string()
@@ -84,8 +104,56 @@ def test_update_user(db: Session) -> None:
     new_password = random_lower_string()
     user_in_update = UserUpdate(password=new_password, is_superuser=True)
     if user.id is not None:
-        crud.update_user(session=db, db_user=user, user_in=user_in_update)
+        crud.update_user(session=db, user_id=user.id, user_in=user_in_update)
     user_2 = db.get(User, user.id)
     assert user_2
     assert user.email == user_2.email
     assert verify_password(new_password, user_2.hashed_password)
+
+
+def test_email_is_case_insensitive(db: Session) -> None:
+    email = random_email()
+    user_in = UserCreate(email=f" {email.upper()}", password=random_lower_string())
+    user = crud.create_user(session=db, user_create=user_in)
+    assert user.email == email
+    found = crud.get_user_by_email(session=db, email=email.capitalize())
+    assert found and found.id == user.id
+    plan = explain(db, crud.user_by_email_statement, {"email": email})
+    assert "ix_user_email_lower" in plan
+
+
+def test_emails_differing_by_case_are_duplicates(db: Session) -> None:
+    email = random_email()
+    crud.create_user(
+        session=db, user_create=UserCreate(email=email, password=random_lower_string())
+    )
+    # Bypasses the normalization of the API models
+    db.add(User(email=email.upper(), hashed_password="x"))
+    with pytest.raises(IntegrityError):
+        db.commit()
+    db.rollback()
+
+
+def test_purge_user(db: Session) -> None:
+    user = crud.create_user(
+        session=db,
+        user_create=UserCreate(email=random_email(), password=random_lower_string()),
+    )
+    assert user.id is not None
+    user_id = user.id
+    crud.create_items(
+        session=db,
+        items_in=[ItemCreate(title=random_lower_string()) for _ in range(5)],
+        owner_id=user_id,
+    )
+    # Only users flagged for deletion are purged
+    assert crud.purge_user(session=db, user_id=user_id, batch_size=2) == 0
+    assert crud.count_items(session=db, owner_id=user_id, mode="exact")[0] == 5
+
+    crud.request_user_deletion(session=db, db_user=user)
+    assert not user.is_active
+    assert crud.purge_user(session=db, user_id=user_id, batch_size=2) == 5
+    db.expire_all()
+    assert db.get(User, user_id) is None
+    assert crud.count_items(session=db, owner_id=user_id, mode="exact")[0] == 0
+    assert db.get(ItemStats, user_id) is None
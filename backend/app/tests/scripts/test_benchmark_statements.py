@@ -0,0 +1,13 @@
+from sqlmodel import Session
+
+from app.benchmark_statements import inline_statements, measure, prebuilt_statements
+from app.core.db import engine
+from app.tests.utils.user import create_random_user
+
+
+def test_measure(db: Session) -> None:
+    user = create_random_user(db)
+    for run in (inline_statements, prebuilt_statements):
+        wall, cpu = measure(engine, user, run, iterations=1)
+        assert wall > 0
+        assert cpu >= 0
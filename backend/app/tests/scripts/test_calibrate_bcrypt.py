@@ -0,0 +1,20 @@
+from unittest.mock import patch
+
+from app.calibrate_bcrypt import calibrate, logger, measure
+
+
+def test_measure() -> None:
+    assert measure(4, samples=1) > 0
+
+
+def test_calibrate_picks_highest_rounds_within_target() -> None:
+    # Doubling cost per round, 1 ms at rounds=4
+    def fake_measure(rounds: int, _samples: int) -> float:
+        return 2.0 ** (rounds - 4)
+
+    with (
+        patch("app.calibrate_bcrypt.measure", side_effect=fake_measure),
+        patch.object(logger, "info"),
+    ):
+        assert calibrate(target_ms=150, samples=1) == 11
+        assert calibrate(target_ms=0.5, samples=1) == 4
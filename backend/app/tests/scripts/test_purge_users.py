@@ -0,0 +1,15 @@
+from sqlmodel import Session
+
+from app import crud
+from app.models import User
+from app.purge_users import main
+from app.tests.utils.user import create_random_user
+
+
+def test_main_purges_pending_users(db: Session) -> None:
+    user = create_random_user(db)
+    user_id = user.id
+    crud.request_user_deletion(session=db, db_user=user)
+    main()
+    db.expire_all()
+    assert db.get(User, user_id) is None
@@ -0,0 +1,59 @@
+from collections.abc import Iterator
+from contextlib import contextmanager
+from typing import Any
+
+from sqlalchemy import Engine, event
+from sqlmodel import Session
+
+# Statements whose plan is worth checking, inserts never scan
+explained_statements = ("SELECT", "UPDATE", "DELETE")
+
+
+@contextmanager
+def record_queries(engine: Engine) -> Iterator[list[tuple[str, Any]]]:
+    """Record the SQL and parameters of the statements run on `engine`."""
+    queries: list[tuple[str, Any]] = []
+
+    def before_cursor_execute(
+        _conn: Any,
+        _cursor: Any,
+        statement: str,
+        parameters: Any,
+        _context: Any,
+        executemany: bool,
+    ) -> None:
+        if not executemany and statement.lstrip().upper().startswith(
+            explained_statements
+        ):
+            queries.append((statement, parameters))
+
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        yield queries
+    finally:
+        event.remove(engine, "before_cursor_execute", before_cursor_execute)
+
+
+def explain_query(db: Session, statement: str, parameters: Any) -> dict[str, Any]:
+    """Top node of the plan of a recorded statement, without running it."""
+    plan = (
+        db.connection()
+        .exec_driver_sql(f"EXPLAIN (FORMAT JSON) {statement}", parameters)
+        .scalar_one()
+    )
+    db.rollback()
+    return plan[0]["Plan"]  # type: ignore[no-any-return]
+
+
+def iter_nodes(node: dict[str, Any]) -> Iterator[dict[str, Any]]:
+    yield node
+    for child in node.get("Plans", []):
+        yield from iter_nodes(child)
+
+
+def seq_scanned_tables(node: dict[str, Any]) -> set[str]:
+    return {
+        child["Relation Name"]
+        for child in iter_nodes(node)
+        if child["Node Type"] == "Seq Scan"
+    }
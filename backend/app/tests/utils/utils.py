@@ -1,7 +1,11 @@
+import json
 import random
 import string
+from typing import Any
 
 from fastapi.testclient import TestClient
+from sqlalchemy import ClauseElement
+from sqlmodel import Session
 
 from app.core.config import settings
 
@@ -24,3 +28,15 @@ def get_superuser_token_headers(client: TestClient) -> dict[str, str]:
     a_token = tokens["access_token"]
     headers = {"Authorization": f"Bearer {a_token}"}
     return headers
+
+
+def explain(db: Session, statement: ClauseElement, params: dict[str, Any]) -> str:
+    compiled = statement.compile(dialect=db.get_bind().dialect)
+    connection = db.connection()
+    # Tiny test tables would be scanned anyway, ask whether the index is usable
+    connection.exec_driver_sql("SET LOCAL enable_seqscan = off")
+    plan = connection.exec_driver_sql(
+        f"EXPLAIN (FORMAT JSON) {compiled}", compiled.construct_params(params)
+    ).scalar()
+    db.rollback()
+    return json.dumps(plan)